@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Benchmark: synchronizing the layout with the window arrangement.
+
+Creates a tab page with 50 windows, and measures how long
+``Editor.sync_with_prompt_toolkit`` takes, both when nothing changed (like
+after ``:set nu`` or ``:w``) and when one window shows another buffer. The
+exit status is non-zero when the time for an unchanged layout is above the
+target.
+
+Usage::
+
+    python benchmarks/bench_layout.py [-n ITERATIONS] [-w WINDOWS]
+"""
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+#: Target for the time to synchronize an unchanged layout. (In milliseconds.)
+TARGET_MS = 0.5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_editor(tmp, window_count):
+    """
+    Create an editor that shows `window_count` files in one tab page. (A few
+    columns of horizontally split windows.) Return the editor and two hidden
+    `EditorBuffer` instances.
+    """
+    os.environ['HOME'] = tmp
+    sys.path.insert(0, ROOT)
+
+    from prompt_toolkit.input import DummyInput
+    from prompt_toolkit.output import DummyOutput
+    from pyvim.editor import get_editor
+
+    locations = []
+    for i in range(window_count + 2):
+        location = pathlib.Path(tmp) / ('file%i.py' % i)
+        location.write_text('x = %i\n' % i)
+        locations.append(location)
+
+    editor = get_editor()
+    editor.input = DummyInput()
+    editor.output = DummyOutput()
+    editor.layout()
+    editor.load_initial_files(locations[:1])
+
+    wa = editor.window_arrangement
+    columns = 5
+    for i in range(1, window_count):
+        if i % (window_count // columns) == 0:
+            wa.vsplit(locations[i])
+        else:
+            wa.hsplit(locations[i])
+
+    # The extra files are hidden buffers, for switching the active window.
+    hidden = [wa.open_buffer(l) for l in locations[-2:]]
+    editor.sync_with_prompt_toolkit()
+    return editor, hidden
+
+
+def measure(function, iterations):
+    """
+    Return the average time of `function` in milliseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) * 1000 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=200)
+    parser.add_argument('-w', '--windows', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        editor, hidden = create_editor(tmp, args.windows)
+        wa = editor.window_arrangement
+        assert wa.active_tab.window_count() == args.windows
+
+        unchanged = measure(editor.sync_with_prompt_toolkit, args.iterations)
+
+        def switch_buffer():
+            hidden.reverse()
+            wa.show_editor_buffer(hidden[0])
+            editor.sync_with_prompt_toolkit()
+        switched = measure(switch_buffer, args.iterations)
+
+    print('%i windows' % args.windows)
+    print('sync, unchanged layout: %.3fms' % unchanged)
+    print('sync, one window switched buffer: %.3fms' % switched)
+    print('target (unchanged layout): %.3fms' % TARGET_MS)
+
+    return 0 if unchanged <= TARGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
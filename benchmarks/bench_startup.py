@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Benchmark: time to first frame.
+
+Starts pyvim a number of times in a pseudo terminal with ``--startuptime``,
+and reports the time it took until the first frame was rendered. The exit
+status is non-zero when the median is above the target.
+
+Usage::
+
+    python benchmarks/bench_startup.py [-n RUNS] [FILE...]
+"""
+import argparse
+import os
+import pty
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+#: Target for the median time to first frame. (In milliseconds.)
+TARGET_MS = 400
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _read_first_frame(filename):
+    """
+    Return the clock of the 'first frame' line in a startuptime report.
+    """
+    try:
+        with open(filename) as f:
+            for line in f:
+                if line.rstrip().endswith(': first frame'):
+                    return float(line.split()[0])
+    except IOError:
+        pass
+
+
+def time_to_first_frame(files, timeout=30):
+    """
+    Run pyvim once, return the time to first frame in milliseconds.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        report = os.path.join(tmp, 'startuptime.log')
+        env = dict(os.environ, HOME=tmp, PYTHONPATH=ROOT)
+
+        master, slave = pty.openpty()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'pyvim', '--startuptime', report] + files,
+            stdin=slave, stdout=slave, stderr=slave, env=env, cwd=tmp)
+        os.close(slave)
+
+        try:
+            end = time.time() + timeout
+            result = None
+            while result is None and time.time() < end:
+                # Keep the pty drained, otherwise the renderer blocks.
+                if select.select([master], [], [], .01)[0]:
+                    try:
+                        os.read(master, 65536)
+                    except OSError:
+                        break
+                result = _read_first_frame(report)
+
+            # Quit. (Keep trying: a message could be waiting for a key press.)
+            while process.poll() is None and time.time() < end:
+                os.write(master, b'\r\x1b:qa!\r')
+                if select.select([master], [], [], .1)[0]:
+                    try:
+                        os.read(master, 65536)
+                    except OSError:
+                        break
+        finally:
+            if process.poll() is None:
+                process.kill()
+            os.close(master)
+
+    if result is None:
+        raise Exception('No first frame within %is.' % timeout)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    files = [os.path.abspath(f) for f in args.files]
+    times = [time_to_first_frame(files) for _ in range(args.runs)]
+    median = statistics.median(times)
+
+    print('time to first frame: median %.1fms, min %.1fms, max %.1fms (%i runs)' % (
+        median, min(times), max(times), len(times)))
+    print('target: %ims' % TARGET_MS)
+
+    return 0 if median <= TARGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark: ``:%s`` on a large buffer.
+
+Compares the substitution engine with the previous implementation of ``:s``
+(``re.sub`` line by line through ``Buffer.transform_lines``). The exit status
+is non-zero when the engine is above the target.
+
+Usage::
+
+    python benchmarks/bench_substitute.py [-l LINES]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+#: Target for ``:%s/foo/bar/g`` on a buffer of 1M lines. (In milliseconds.)
+TARGET_MS = 2000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
+
+
+def legacy_substitute(buffer, range_start, range_end, search, replace, flags):
+    """
+    The previous implementation of `substitute`, without the editor state.
+    """
+    range_start = int(range_start) - 1
+    range_end = int(range_end) - 1
+    line_index_iterator = range(range_start, range_end + 1)
+
+    sub_count = 0 if 'g' in flags else 1
+    transform_callback = lambda s: re.sub(search, replace, s, count=sub_count)
+    new_text = buffer.transform_lines(line_index_iterator, transform_callback)
+
+    new_cursor_position_row = line_index_iterator[-1]
+    buffer.document = Document(
+        new_text,
+        Document(new_text).translate_row_col_to_index(
+            new_cursor_position_row, 0),
+    )
+
+
+def engine_substitute(buffer, search, replace, flags):
+    """
+    ``:%s`` through the substitution engine, like `commands.substitute`.
+    """
+    from pyvim.commands.ranges import parse_range
+    from pyvim.commands.substitute import compile_pattern, get_range_offsets, substitute_text
+
+    document = buffer.document
+    start_row, end_row = parse_range('%', document)
+    pattern = compile_pattern(search)
+    start, end = get_range_offsets(document, start_row, end_row)
+    result = substitute_text(pattern, replace, document.text, start, end, 'g' in flags)
+
+    buffer.save_to_undo_stack()
+    buffer.document = Document(result.text, result.last_position)
+
+
+def create_buffer(line_count):
+    return Buffer(document=Document(
+        ''.join('%i: foo = bar(foo, baz)\n' % i for i in range(line_count)), 0))
+
+
+def measure(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-l', '--lines', type=int, default=1000000)
+    args = parser.parse_args()
+
+    print('%i lines' % args.lines)
+    for flags in ('', 'g'):
+        buffer = create_buffer(args.lines)
+        legacy = measure(lambda: legacy_substitute(
+            buffer, '1', str(args.lines), 'foo', 'qux', flags))
+
+        buffer2 = create_buffer(args.lines)
+        engine = measure(lambda: engine_substitute(buffer2, 'foo', 'qux', flags))
+
+        assert buffer.text == buffer2.text
+        print(':%%s/foo/qux/%s  previous: %.0fms  engine: %.0fms' % (flags, legacy, engine))
+
+    print('target (engine, g flag, 1M lines): %ims' % TARGET_MS)
+    return 0 if engine * 1000000 / args.lines <= TARGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
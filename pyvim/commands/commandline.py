@@ -65,7 +65,8 @@ class CommandLine(prompt_toolkit.layout.containers.ConditionalContainer):
         # (e.g. when typing ':colorscheme blue', it should already show the
         # preview before pressing enter.)
         def preview(_):
-            if get_app().layout.has_focus(self.command_buffer):
+            from pyvim.editor import get_editor
+            if get_app().layout.has_focus(self.command_buffer) and not get_editor().in_batch:
                 self.previewer.preview(self.command_buffer.text)
         self.command_buffer.on_text_changed += preview
 
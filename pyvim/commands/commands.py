@@ -1,10 +1,10 @@
-from prompt_toolkit.application import run_in_terminal
+from asyncio import get_event_loop
+from prompt_toolkit.application import get_app, run_in_terminal
 from prompt_toolkit.document import Document
 import pathlib
 import logging
 import os
 import re
-import six
 
 logger = logging.getLogger(__name__)
 
@@ -224,12 +224,27 @@ def buffer_list(editor):
         for info in wa.list_open_buffers():
             char = '%' if info.is_active else ''
             eb = info.editor_buffer
-            print(' %3i %-2s %-20s  line %i' % (
-                  info.index, char, eb.location, (eb.buffer.document.cursor_position_row + 1)))
-        six.moves.input('\nPress ENTER to continue...')
+            if eb.is_loaded:
+                line = '%i' % (eb.buffer.document.cursor_position_row + 1)
+                memory = _format_size(eb.memory_usage())
+            else:
+                line = '-'
+                memory = 'not loaded'
+            print(' %3i %-2s %-20s  line %-6s %s' % (
+                  info.index, char, eb.location, line, memory))
+        input('\nPress ENTER to continue...')
     run_in_terminal(handler)
 
 
+def _format_size(size):
+    """ Format a number of bytes for display. """
+    for unit in ('B', 'K', 'M'):
+        if size < 1024:
+            return '%i%s' % (size, unit)
+        size /= 1024.
+    return '%.1fG' % size
+
+
 @_cmd('b')
 @_cmd('buffer')
 def _buffer(editor, variables, force=False):
@@ -244,7 +259,9 @@ def _buffer(editor, variables, force=False):
         if not force and eb.has_unsaved_changes:
             editor.show_message(_NO_WRITE_SINCE_LAST_CHANGE_TEXT)
         else:
-            editor.window_arrangement.go_to_buffer(buffer_name)
+            error = editor.window_arrangement.go_to_buffer(buffer_name)
+            if error:
+                editor.show_message(error)
 
 
 @cmd('bw', accepts_force=True)
@@ -284,22 +301,86 @@ def buffer_edit(editor, location, force=False):
             pathlib.Path(location).absolute(), show_in_current_window=True)
 
 
+@_cmd('find')
+@_cmd('fin')
+@_cmd('Files')
+def find(editor, variables):
+    """
+    Open a file of the project (the current directory), that matches the
+    query fuzzily. (The completion of the query is the picker.) The files are
+    indexed in the background, the first time.
+    """
+    query = (variables.get('find_query') or '').strip()
+    if not query:
+        editor.show_message('Argument required')
+        return
+
+    index = editor.get_file_index()
+
+    if index.ready or editor.file_index_task is None:
+        _open_found_file(editor, index, query)
+        return
+
+    import asyncio
+    task = editor.file_index_task
+
+    async def open_when_indexed():
+        await asyncio.wait([task])
+        editor.show_message(None)
+        _open_found_file(editor, index, query)
+        editor.sync_with_prompt_toolkit()
+        get_app().invalidate()
+
+    editor.show_message('Indexing files...')
+    get_app().create_background_task(open_when_indexed())
+
+
+def _open_found_file(editor, index, query):
+    path = os.path.join(index.root, os.path.expanduser(query))
+    if not os.path.isfile(path):  # (A completion inserts the whole path.)
+        matches = index.find(query, limit=1)
+        if not matches:
+            editor.show_message('Can\'t find file "%s" in path' % query)
+            return
+        path = os.path.join(index.root, matches[0])
+
+    editor.file_explorer = ''
+    # (Normalized, so that './a.txt' and 'a.txt' are the same buffer.)
+    editor.window_arrangement.open_buffer(pathlib.Path(os.path.normpath(path)),
+                                          show_in_current_window=True)
+
+
 @cmd('q', accepts_force=True)
 @cmd('quit', accepts_force=True)
 def quit(editor, all_=False, force=False):
     """
     Quit.
     """
-    ebs = editor.editor_layout.editor_root.window_arrangement.editor_buffers
+    wa = editor.window_arrangement
+    ebs = wa.editor_buffers
+    server = editor.server
+
+    # When a '--remote-wait' client waits for this buffer, close it. (That
+    # releases the client, and the server keeps running.)
+    if not all_ and server is not None and server.is_waiting_for(wa.active_editor_buffer):
+        if not force and wa.active_editor_buffer.has_unsaved_changes:
+            editor.show_message(_NO_WRITE_SINCE_LAST_CHANGE_TEXT)
+        else:
+            wa.close_buffer()
 
     # When there are buffers that have unsaved changes, show balloon.
-    if not force and any(eb.has_unsaved_changes for eb in ebs):
+    elif not force and any(eb.has_unsaved_changes for eb in ebs):
         editor.show_message(_NO_WRITE_SINCE_LAST_CHANGE_TEXT)
 
     # When there is more than one buffer open.
     elif not all_ and len(ebs) > 1:
         editor.show_message('%i more files to edit' % (len(ebs) - 1))
 
+    # When '--remote-wait' clients wait for other buffers.
+    elif not force and server is not None and server.waiting_count:
+        editor.show_message('%i buffers are open for remote clients (add ! to quit anyway)' %
+                            server.waiting_count)
+
     else:
         editor.application.exit()
 
@@ -332,10 +413,15 @@ def write(editor, location, force=False):
 @location_cmd('wq', accepts_force=True)
 def write_and_quit(editor, location, force=False):
     """
-    Write file and quit.
+    Write file and quit. (Or close the buffer, when a '--remote-wait' client
+    waits for it.)
     """
     write(editor, location, force=force)
-    editor.application.exit()
+
+    if editor.server is not None and editor.server.waiting_count:
+        quit(editor, force=force)
+    else:
+        editor.application.exit()
 
 
 @cmd('cq')
@@ -349,17 +435,75 @@ def quit_nonzero(editor):
     editor.application.exit()
 
 
+@cmd('up')
+@cmd('update')
+def update(editor):
+    """
+    Write the current buffer, when it has unsaved changes.
+    """
+    eb = editor.window_arrangement.active_editor_buffer
+    if eb.has_unsaved_changes:
+        write(editor, None)
+
+
+@cmd('wa')
+@cmd('wall')
+def write_all(editor):
+    """
+    Write all the buffers that have unsaved changes.
+    """
+    ebs = [eb for eb in editor.window_arrangement.editor_buffers if eb.has_unsaved_changes]
+    if ebs:
+        editor.show_message(_write_buffers(ebs))
+
+
 @cmd('wqa')
+@cmd('wqall')
+@cmd('xa')
+@cmd('xall')
 def write_and_quit_all(editor):
     """
-    Write current buffer and quit all.
+    Write all the buffers that have unsaved changes, and quit all. (Unless
+    writing failed.)
     """
-    eb = editor.window_arrangement.active_editor_buffer
-    if eb.location is None:
-        editor.show_message(_NO_FILE_NAME)
+    ebs = [eb for eb in editor.window_arrangement.editor_buffers if eb.has_unsaved_changes]
+    if ebs:
+        message = _write_buffers(ebs)
+        if any(eb.has_unsaved_changes for eb in ebs):
+            editor.show_message(message)
+            return
+    quit(editor, all_=True, force=False)
+
+
+def _write_buffers(editor_buffers):
+    """
+    Write these buffers concurrently. Return a summary message.
+    """
+    from .write_all import WriteFailure, write_buffers, format_write_summary
+
+    failures = [WriteFailure(eb, _NO_FILE_NAME) for eb in editor_buffers if eb.location is None]
+    ebs = [eb for eb in editor_buffers if eb.location is not None]
+    failures.extend(write_buffers(ebs))
+
+    return format_write_summary(len(editor_buffers) - len(failures), failures)
+
+
+@location_cmd('mks', accepts_force=True)
+@location_cmd('mksession', accepts_force=True)
+def make_session(editor, location, force=False):
+    """
+    Write a session file. (Restore it with `pyvim -S`.)
+    """
+    from pyvim.session import get_default_session_path, save_session
+    location = location or get_default_session_path()
+
+    if not force and os.path.exists(location):
+        editor.show_message('"%s" exists (add ! to override)' % location)
     else:
-        eb.write()
-        quit(editor, all_=True, force=False)
+        try:
+            save_session(editor, location)
+        except OSError as e:
+            editor.show_message('{}'.format(e))
 
 
 @cmd('h')
@@ -555,6 +699,65 @@ def set_scroll_offset(editor, value):
             editor.show_message('Number required after =')
 
 
+@set_cmd('buffermem', accepts_value=True)
+def set_buffer_memory(editor, value):
+    """
+    Set the memory budget for the buffers, in KiB. When it's exceeded,
+    unmodified hidden buffers are unloaded. (0 means no limit.)
+    """
+    if value is None:
+        editor.show_message('buffermem=%i' % editor.buffer_memory)
+    else:
+        try:
+            value = int(value)
+            if value >= 0:
+                editor.buffer_memory = value
+            else:
+                editor.show_message('Argument must be positive')
+        except ValueError:
+            editor.show_message('Number required after =')
+
+
+@set_cmd('makeprg', accepts_value=True)
+@set_cmd('mp', accepts_value=True)
+def set_makeprg(editor, value):
+    """
+    Set the program that `:make` runs.
+    """
+    if value is None:
+        editor.show_message('makeprg=%s' % editor.makeprg)
+    else:
+        editor.makeprg = _unescape_option_value(value)
+
+
+@set_cmd('errorformat', accepts_value=True)
+@set_cmd('efm', accepts_value=True)
+def set_errorformat(editor, value):
+    """
+    Set the format of the errors that `:make` parses.
+    """
+    from pyvim.make import compile_errorformat, ErrorFormatError
+
+    if value is None:
+        editor.show_message('errorformat=%s' % editor.errorformat)
+        return
+
+    value = _unescape_option_value(value)
+    try:
+        compile_errorformat(value)
+    except ErrorFormatError as e:
+        editor.show_message(str(e))
+    else:
+        editor.errorformat = value
+
+
+def _unescape_option_value(value):
+    """
+    Remove the backslashes before spaces and backslashes. (Like Vim.)
+    """
+    return re.sub(r'\\([\s\\])', r'\1', value)
+
+
 @set_cmd('incsearch')
 @set_cmd('is')
 def incsearch_enable(editor):
@@ -569,6 +772,20 @@ def incsearch_disable(editor):
     editor.incsearch = False
 
 
+@set_cmd('inccommand')
+@set_cmd('icm')
+def inccommand_enable(editor):
+    """ Enable the preview of ':s' while it's typed. """
+    editor.inccommand = True
+
+
+@set_cmd('noinccommand')
+@set_cmd('noicm')
+def inccommand_disable(editor):
+    """ Disable the preview of ':s' while it's typed. """
+    editor.inccommand = False
+
+
 @set_cmd('ignorecase')
 @set_cmd('ic')
 def search_ignorecase(editor):
@@ -716,25 +933,22 @@ def set_scroll_offset(editor, value):
         editor.colorcolumn = numbers
 
 
-def substitute(editor, range_start, range_end, search, replace, flags):
-    """ Substitute /search/ with /replace/ over a range of text """
-    def get_line_index_iterator(cursor_position_row, range_start, range_end):
-        if not range_start:
-            assert not range_end
-            range_start = range_end = cursor_position_row
-        else:
-            range_start = int(range_start) - 1
-            range_end = int(range_end) - 1 if range_end else range_start
-        return range(range_start, range_end + 1)
+def substitute(editor, range_, search, replace, flags):
+    """
+    Substitute /search/ with /replace/ over a range of text.
 
-    def get_transform_callback(search, replace, flags):
-        SUBSTITUTE_ALL, SUBSTITUTE_ONE = 0, 1
-        sub_count = SUBSTITUTE_ALL if 'g' in flags else SUBSTITUTE_ONE
-        return lambda s: re.sub(search, replace, s, count=sub_count)
+    Flags: `g` for all the matches in a line, `i` to ignore case, `n` to only
+    count the matches and `c` to confirm every substitution.
+    """
+    from .ranges import parse_range, RangeError
+    from .substitute import (
+        compile_pattern, get_range_offsets, find_matches, substitute_text,
+        SubstituteConfirmation, BACKGROUND_SIZE)
 
     search_state = editor.application.current_search_state
-    buffer = editor.current_editor_buffer.buffer
-    cursor_position_row = buffer.document.cursor_position_row
+    editor_buffer = editor.current_editor_buffer
+    buffer = editor_buffer.buffer
+    document = buffer.document
 
     # read editor state
     if not search:
@@ -742,25 +956,937 @@ def substitute(editor, range_start, range_end, search, replace, flags):
 
     if replace is None:
         replace = editor.last_substitute_text
+    else:
+        replace = replace.replace('\\/', '/')
 
-    line_index_iterator = get_line_index_iterator(
-        cursor_position_row, range_start, range_end)
-    transform_callback = get_transform_callback(search, replace, flags)
-    new_text = buffer.transform_lines(line_index_iterator, transform_callback)
-
-    assert len(line_index_iterator) >= 1
-    new_cursor_position_row = line_index_iterator[-1]
+    try:
+        start_row, end_row = parse_range(range_, document, editor_buffer.marks)
+    except RangeError as e:
+        editor.show_message(str(e))
+        return
 
-    # update text buffer
-    buffer.document = Document(
-        new_text,
-        Document(new_text).translate_row_col_to_index(
-            new_cursor_position_row, 0),
-    )
-    buffer.cursor_position += buffer.document.get_start_of_line_position(
-        after_whitespace=True)
-    buffer._search(search_state, include_current_position=True)
+    try:
+        pattern = compile_pattern(search, ignore_case=('i' in flags or editor.ignore_case))
+    except re.error as e:
+        editor.show_message('Invalid pattern: %s' % e)
+        return
 
     # update editor state
     editor.last_substitute_text = replace
     search_state.text = search
+
+    start, end = get_range_offsets(document, start_row, end_row)
+    all_matches = 'g' in flags
+
+    if 'n' in flags:
+        # Only count. (Large ranges in the background.)
+        if end - start > BACKGROUND_SIZE:
+            _count_in_background(editor, pattern, document.text, start, end,
+                                 all_matches, search)
+        else:
+            matches, line_count = find_matches(pattern, document.text, start, end, all_matches)
+            _show_count(editor, len(matches), line_count, search)
+
+    elif 'c' in flags:
+        # Confirm every substitution. (The key bindings call `confirm_substitute`.)
+        buffer.save_to_undo_stack()
+        confirmation = SubstituteConfirmation(buffer, pattern, replace, start, end, all_matches)
+        if confirmation.done:
+            editor.show_message('Pattern not found: %s' % search)
+        else:
+            editor.substitute_confirmation = confirmation
+            editor.show_message(confirmation.prompt)
+
+    elif end - start > BACKGROUND_SIZE:
+        # Large range: don't block the event loop.
+        _substitute_in_background(editor, buffer, pattern, replace, start, end,
+                                  all_matches, search)
+
+    else:
+        result = substitute_text(pattern, replace, document.text, start, end, all_matches)
+
+        if result.count == 0:
+            editor.show_message('Pattern not found: %s' % search)
+        else:
+            # One undo step for the whole substitution.
+            buffer.save_to_undo_stack()
+            buffer.document = Document(result.text, result.last_position)
+            _finish_substitute(editor, buffer, result.count, result.line_count)
+
+
+def preview_substitute(editor, range_, search, replace, flags):
+    """
+    Preview of ``:s`` while it's typed, on the visible lines of the current
+    window. Return a `SubstitutePreview`, or `None` when there is nothing to
+    preview. The matches in the range are counted in the background.
+    """
+    from .ranges import parse_range, RangeError
+    from .substitute import compile_pattern, get_range_offsets, SubstitutePreview
+
+    if not editor.inccommand:
+        return None
+
+    search = search or editor.application.current_search_state.text
+    if not search:
+        return None
+
+    wa = editor.window_arrangement
+    editor_buffer = wa.active_editor_buffer
+    buffer = editor_buffer.buffer
+    document = buffer.document
+
+    try:
+        start_row, end_row = parse_range(range_, document, editor_buffer.marks)
+        pattern = compile_pattern(search, ignore_case=('i' in flags or editor.ignore_case))
+    except (RangeError, re.error):
+        return None  # (Incomplete while typing.)
+
+    if replace is not None and 'n' not in flags:
+        replace = replace.replace('\\/', '/')
+    else:
+        replace = None  # Only highlight the matches.
+
+    start, end = get_range_offsets(document, start_row, end_row)
+    preview = SubstitutePreview(buffer, document, pattern, replace, start, end, 'g' in flags)
+
+    render_info = wa.get_window(wa.active_window).render_info
+    if render_info is not None:
+        try:
+            preview.compute(render_info.first_visible_line(), render_info.last_visible_line())
+        except (re.error, IndexError):
+            return None  # Invalid group reference in the replacement.
+
+    _count_matches_in_background(editor, preview, search)
+    return preview
+
+
+def _count_matches_in_background(editor, preview, search):
+    """
+    Count the matches of the preview in an executor, and show the count
+    when the preview is still active.
+    """
+    job = preview.count_job
+    loop = get_event_loop()
+
+    def done(result):
+        if result is None or editor.state.substitute_preview is not preview:
+            return  # Cancelled, or the input changed.
+
+        _show_count(editor, *result, search)
+        preview.message = editor.message
+        get_app().invalidate()
+
+    def in_executor():
+        result = job.run()
+        loop.call_soon_threadsafe(lambda: done(result))
+
+    loop.run_in_executor(None, in_executor)
+
+
+_VIMGREP_ARGS_RE = re.compile(r'^/(?P<pattern>([^/\\]|\\.)*)/[gj]*\s*(?P<paths>.*)$')
+
+
+@_cmd('grep')
+@_cmd('vimgrep')
+@_cmd('vim')
+def grep(editor, variables):
+    """
+    Search in files. `:grep` uses ripgrep when it's installed, `:vimgrep`
+    always searches in-process. The results appear in the quickfix list,
+    while the search runs.
+    """
+    import shlex
+
+    command = variables.get('command')
+    args = variables.get('grep_args') or ''
+    title = ':%s %s' % (command, args)
+
+    if command == 'grep':
+        try:
+            args = shlex.split(args)
+        except ValueError as e:
+            editor.show_message('Invalid arguments: %s' % e)
+            return
+        pattern, paths = (args[0], args[1:]) if args else ('', [])
+    else:
+        m = _VIMGREP_ARGS_RE.match(args)
+        if m:
+            pattern = m.group('pattern').replace('\\/', '/')
+            paths = m.group('paths').split()
+        else:
+            pattern, _, paths = args.partition(' ')
+            paths = paths.split()
+
+    if not pattern:
+        editor.show_message('Usage: :%s <pattern> [<path>...]' % command)
+        return
+
+    _start_grep(editor, title, pattern, paths or ['.'], use_ripgrep=(command == 'grep'))
+
+
+def _start_grep(editor, title, pattern, paths, use_ripgrep):
+    """
+    Run the search in the background. The matches are added to the quickfix
+    list in batches.
+    """
+    from pyvim.grep import grep
+
+    if editor.grep_task:
+        editor.grep_task.cancel()
+
+    quickfix = editor.quickfix
+    quickfix.clear(title)
+    editor.show_quickfix_window(focus=False)
+
+    async def run():
+        try:
+            async for matches in grep(pattern, paths, ignore_case=editor.ignore_case,
+                                      use_ripgrep=use_ripgrep):
+                quickfix.extend(matches)
+                editor.show_message('Searching... %i matches' % len(quickfix))
+                get_app().invalidate()
+        except re.error as e:
+            editor.show_message('Invalid pattern: %s' % e)
+        except OSError as e:
+            editor.show_message('%s' % e)
+        else:
+            if len(quickfix):
+                editor.show_message('%i matches in %i files' % (
+                    len(quickfix), quickfix.file_count))
+            else:
+                editor.show_message('Pattern not found: %s' % pattern)
+        finally:
+            if editor.grep_task is task:
+                editor.grep_task = None
+            get_app().invalidate()
+
+    editor.show_message('Searching...')
+    task = get_app().create_background_task(run())
+    editor.grep_task = task
+
+
+def cancel_grep(editor):
+    """
+    Stop the search of `:grep`.
+    """
+    if editor.grep_task:
+        editor.grep_task.cancel()
+        editor.grep_task = None
+        editor.show_message('Interrupted')
+
+
+@cmd('copen')
+@cmd('cope')
+def quickfix_open(editor):
+    """
+    Open the quickfix window.
+    """
+    editor.show_quickfix_window()
+
+
+@cmd('cclose')
+@cmd('ccl')
+def quickfix_close(editor):
+    """
+    Close the quickfix window.
+    """
+    editor.hide_quickfix_window()
+
+
+@cmd('cn', accepts_force=True)
+@cmd('cnext', accepts_force=True)
+def quickfix_next(editor, force=False):
+    """
+    Go to the next entry of the quickfix list.
+    """
+    _quickfix_move(editor, 1, force)
+
+
+@cmd('cp', accepts_force=True)
+@cmd('cprev', accepts_force=True)
+@cmd('cprevious', accepts_force=True)
+@cmd('cN', accepts_force=True)
+@cmd('cNext', accepts_force=True)
+def quickfix_previous(editor, force=False):
+    """
+    Go to the previous entry of the quickfix list.
+    """
+    _quickfix_move(editor, -1, force)
+
+
+@cmd('cfirst', accepts_force=True)
+@cmd('cfir', accepts_force=True)
+@cmd('crewind', accepts_force=True)
+@cmd('cr', accepts_force=True)
+def quickfix_first(editor, force=False):
+    """
+    Go to the first entry of the quickfix list.
+    """
+    editor.quickfix.go_to(0)
+    jump_to_quickfix_entry(editor, force)
+
+
+@cmd('clast', accepts_force=True)
+@cmd('cla', accepts_force=True)
+def quickfix_last(editor, force=False):
+    """
+    Go to the last entry of the quickfix list.
+    """
+    editor.quickfix.go_to(len(editor.quickfix) - 1)
+    jump_to_quickfix_entry(editor, force)
+
+
+@_cmd('cc')
+def quickfix_go_to(editor, variables):
+    """
+    Go to entry N of the quickfix list. (Or to the current entry.)
+    """
+    number = variables.get('quickfix_number')
+    if number:
+        editor.quickfix.go_to(int(number) - 1)
+    jump_to_quickfix_entry(editor, force=bool(variables['force']))
+
+
+def _quickfix_move(editor, count, force):
+    if not len(editor.quickfix):
+        editor.show_message('No Errors')
+    elif editor.quickfix.move(count) is None:
+        editor.show_message('No more items')
+    else:
+        jump_to_quickfix_entry(editor, force)
+
+
+def jump_to_quickfix_entry(editor, force=False):
+    """
+    Open the file of the current quickfix entry in the active window, and
+    move the cursor to the entry. (Files are only read when they are jumped
+    to.)
+    """
+    quickfix = editor.quickfix
+    entry = quickfix.current
+    if entry is None:
+        editor.show_message('No Errors')
+        return
+
+    wa = editor.window_arrangement
+    location = pathlib.Path(entry.path).absolute()
+    eb = wa.active_editor_buffer
+
+    if eb.location != location:
+        if not force and eb.has_unsaved_changes:
+            editor.show_message(_NO_WRITE_SINCE_LAST_CHANGE_TEXT)
+            return
+        eb = wa.open_buffer(location, show_in_current_window=True, lazy=True)
+
+    eb.load()
+    document = eb.buffer.document
+    row = max(0, min(entry.lineno - 1, document.line_count - 1))
+    eb.buffer.cursor_position = document.translate_row_col_to_index(
+        row, max(0, entry.column - 1))
+
+    editor.sync_with_prompt_toolkit()
+    editor.focus_active_window()
+    editor.show_message('(%i of %i): %s' % (
+        quickfix.index + 1, len(quickfix), entry.text.strip()))
+
+
+@_cmd('make')
+@_cmd('mak')
+def make(editor, variables):
+    """
+    Run 'makeprg' in the background. The errors are added to the quickfix
+    list, and highlighted in the buffers, while the build runs. (`$*` in
+    'makeprg' is replaced by the arguments, otherwise they are appended.)
+    """
+    from pyvim.make import MakeJob, compile_errorformat, ErrorFormatError
+
+    args = (variables.get('make_args') or '').strip()
+    if '$*' in editor.makeprg:
+        command = editor.makeprg.replace('$*', args)
+    else:
+        command = ('%s %s' % (editor.makeprg, args)).strip()
+
+    try:
+        patterns = compile_errorformat(editor.errorformat)
+    except ErrorFormatError as e:
+        editor.show_message(str(e))
+        return
+
+    cancel_make(editor, show_message=False)
+
+    job = MakeJob(command, patterns, os.getcwd())
+    quickfix = editor.quickfix
+    quickfix.clear(':%s' % command)
+    diagnostics = editor.diagnostics = {}
+
+    async def run():
+        try:
+            async for errors in job.run():
+                quickfix.extend(e[:4] for e in errors)
+                for e in errors:
+                    if e.lineno:
+                        diagnostics.setdefault(pathlib.Path(e.path), {}).setdefault(
+                            e.lineno - 1, []).append(e.to_reporter_error())
+                get_app().invalidate()
+        except OSError as e:
+            editor.show_message('%s' % e)
+        else:
+            message = '%i errors, %i warnings' % (job.error_count, job.warning_count)
+            if job.returncode:
+                message = 'shell returned %i, %s' % (job.returncode, message)
+            editor.show_message(message)
+        finally:
+            if editor.make_job is job:
+                editor.make_job = editor.make_task = None
+            get_app().invalidate()
+
+    editor.make_job = job
+    editor.make_task = get_app().create_background_task(run())
+
+
+def cancel_make(editor, show_message=True):
+    """
+    Stop the build of `:make`.
+    """
+    if editor.make_task:
+        editor.make_task.cancel()
+        editor.make_job = editor.make_task = None
+        if show_message:
+            editor.show_message('Interrupted')
+
+
+def global_(editor, range_, search, command, invert):
+    """
+    Execute `command` for every line in the range (by default the whole
+    buffer) that matches /search/. (Or that doesn't match, for `:v`.)
+    """
+    from .ranges import parse_range, RangeError
+    from .substitute import compile_pattern
+    from .global_command import (
+        find_rows, apply_to_lines, parse_normal_command, GlobalCommandError)
+    from .normal import execute_normal_on_rows
+
+    search_state = editor.application.current_search_state
+    editor_buffer = editor.current_editor_buffer
+    buffer = editor_buffer.buffer
+    document = buffer.document
+
+    if not search:
+        search = search_state.text
+    else:
+        search = search.replace('\\/', '/')
+
+    try:
+        start_row, end_row = parse_range(range_ or '%', document, editor_buffer.marks)
+    except RangeError as e:
+        editor.show_message(str(e))
+        return
+
+    try:
+        pattern = compile_pattern(search, ignore_case=editor.ignore_case)
+    except re.error as e:
+        editor.show_message('Invalid pattern: %s' % e)
+        return
+
+    search_state.text = search
+
+    lines = document.lines
+    rows = find_rows(pattern, lines, start_row, end_row, invert)
+    if not rows:
+        editor.show_message('Pattern not found: %s' % search)
+        return
+
+    keys = parse_normal_command(command.strip())
+    if keys is not None:
+        execute_normal_on_rows(editor, buffer, rows, keys)
+        return
+
+    try:
+        new_lines, cursor_row = apply_to_lines(
+            lines, rows, command, pattern, ignore_case=editor.ignore_case)
+    except GlobalCommandError as e:
+        editor.show_message(str(e))
+        return
+
+    # One document for all the changes. (One undo step.)
+    cursor_position = sum(map(len, new_lines[:cursor_row])) + cursor_row
+    buffer.save_to_undo_stack()
+    buffer.document = Document('\n'.join(new_lines), cursor_position)
+    buffer.cursor_position += buffer.document.get_start_of_line_position(
+        after_whitespace=True)
+
+    line_delta = len(new_lines) - len(lines)
+    if line_delta < -2:
+        editor.show_message('%i fewer lines' % -line_delta)
+    elif line_delta > 2:
+        editor.show_message('%i more lines' % line_delta)
+
+
+def normal(editor, range_, keys):
+    """
+    Execute normal mode keys. (`:normal`.) With a range, the keys are
+    executed for every line of the range, with the cursor at the start of
+    the line.
+    """
+    from .ranges import parse_range, RangeError
+    from .normal import execute_normal, execute_normal_on_rows
+
+    editor_buffer = editor.current_editor_buffer
+    buffer = editor_buffer.buffer
+
+    if not keys:
+        editor.show_message('Argument required')
+        return
+
+    if range_ is None:
+        execute_normal(editor, buffer, keys)
+        return
+
+    try:
+        start_row, end_row = parse_range(range_, buffer.document, editor_buffer.marks)
+    except RangeError as e:
+        editor.show_message(str(e))
+        return
+
+    execute_normal_on_rows(editor, buffer, range(start_row, end_row + 1), keys)
+
+
+def buffer_do(editor, command):
+    """
+    Execute the command in every buffer. (`:bufdo`)
+    """
+    _do_in_buffers(editor, list(editor.window_arrangement.editor_buffers), command)
+
+
+def argument_do(editor, command):
+    """
+    Execute the command in every file of the argument list. (`:argdo`)
+    """
+    wa = editor.window_arrangement
+    if not editor.arguments:
+        editor.show_message('No argument list')
+        return
+    _do_in_buffers(editor, [wa.open_buffer(location, lazy=True)
+                            for location in editor.arguments], command)
+
+
+_WRITE_COMMANDS = ('w', 'write', 'up', 'update')
+
+
+def _do_in_buffers(editor, editor_buffers, command):
+    """
+    Show every buffer in the current window (like Vim), and execute the Ex
+    command in it. Commands are separated with '|'. (A backslash escapes it.)
+    Writes (`:w` and `:update` without file name) are collected, and done
+    concurrently at the end.
+    """
+    from .grammar import parse_input
+    from .handler import handle_command
+
+    commands = [c.replace('\\|', '|') for c in re.split(r'\s*(?<!\\)\|\s*', command)]
+    wa = editor.window_arrangement
+    to_write = []
+
+    for eb in editor_buffers:
+        if eb not in wa.editor_buffers:
+            continue  # Closed by a previous command.
+
+        wa.show_editor_buffer(eb)
+        editor.sync_with_prompt_toolkit()
+
+        for c in commands:
+            parsed = parse_input(c)
+            if parsed.command in _WRITE_COMMANDS and not parsed.variables.get('location'):
+                if parsed.command in ('w', 'write') or eb.has_unsaved_changes:
+                    to_write.append(eb)
+            else:
+                handle_command(c)
+
+    if to_write:
+        # (A buffer is written once, also when several commands write it.)
+        editor.show_message(_write_buffers(list(dict.fromkeys(to_write))))
+
+
+def sort_lines(editor, range_, args, reverse):
+    """
+    Sort the lines of the range. (By default the whole buffer.) `args` are
+    the flags and the optional /pattern/ of `:sort`.
+    """
+    from .ranges import parse_range, RangeError
+    from .substitute import compile_pattern, get_range_offsets, BACKGROUND_SIZE
+    from .sort import parse_sort_args, Sorter, BackgroundSort, SortError
+
+    search_state = editor.application.current_search_state
+    editor_buffer = editor.current_editor_buffer
+    buffer = editor_buffer.buffer
+    document = buffer.document
+
+    try:
+        flags, search = parse_sort_args(args or '')
+    except SortError as e:
+        editor.show_message(str(e))
+        return
+
+    try:
+        start_row, end_row = parse_range(range_ or '%', document, editor_buffer.marks)
+    except RangeError as e:
+        editor.show_message(str(e))
+        return
+
+    pattern = None
+    if search is not None:
+        if not search:
+            search = search_state.text
+        try:
+            pattern = compile_pattern(search, ignore_case=editor.ignore_case)
+        except re.error as e:
+            editor.show_message('Invalid pattern: %s' % e)
+            return
+        search_state.text = search
+
+    start, end = get_range_offsets(document, start_row, end_row)
+    job = BackgroundSort(Sorter(pattern, flags, reverse), document.text, start, end)
+    line_count = end_row - start_row + 1
+
+    if end - start > BACKGROUND_SIZE:
+        # Large range: don't block the event loop.
+        _sort_in_background(editor, buffer, job, line_count)
+    else:
+        _finish_sort(editor, buffer, job, job.run(), line_count)
+
+
+def _sort_in_background(editor, buffer, job, line_count):
+    """
+    Run the sort in an executor, on a snapshot of the text. The result is
+    only applied when the buffer did not change in the meantime.
+    """
+    if editor.background_sort:
+        editor.background_sort.cancel()
+
+    editor.background_sort = job
+    loop = get_event_loop()
+
+    def show_progress():
+        if editor.background_sort is job:
+            editor.show_message('Sorting... %i%%' % (job.progress * 100))
+            get_app().invalidate()
+
+    def done(result):
+        if editor.background_sort is not job:
+            return  # Cancelled.
+        editor.background_sort = None
+
+        if result is None:
+            pass
+        elif buffer.text != job.text:
+            editor.show_message('Buffer changed, sort discarded')
+        else:
+            editor.message = None
+            _finish_sort(editor, buffer, job, result, line_count)
+        get_app().invalidate()
+
+    def in_executor():
+        try:
+            result = job.run(lambda: loop.call_soon_threadsafe(show_progress))
+        except OSError as e:
+            # (Writing the runs to the temporary directory failed. `e` is
+            # unbound after the except block, so format the message here.)
+            message = 'Sort failed: %s' % e
+            loop.call_soon_threadsafe(lambda: editor.show_message(message))
+            result = None
+        loop.call_soon_threadsafe(lambda: done(result))
+
+    editor.show_message('Sorting... 0%')
+    loop.run_in_executor(None, in_executor)
+
+
+def _finish_sort(editor, buffer, job, result, line_count):
+    text = job.text
+
+    # One undo step. The cursor goes to the first line of the range.
+    buffer.save_to_undo_stack()
+    buffer.document = Document(text[:job.start] + result + text[job.end:], job.start)
+
+    removed = line_count - job.line_count
+    if removed > 2:
+        editor.show_message('%i fewer lines' % removed)
+
+
+def cancel_sort(editor):
+    """
+    Cancel the sort that runs in the background.
+    """
+    if editor.background_sort:
+        editor.background_sort.cancel()
+        editor.background_sort = None
+        editor.show_message('Interrupted')
+
+
+def filter_lines(editor, range_, command):
+    """
+    Filter the lines of the range through a shell command. (`:{range}!cmd`)
+    """
+    from .ranges import parse_range, RangeError
+    from .substitute import get_range_offsets
+
+    editor_buffer = editor.current_editor_buffer
+    document = editor_buffer.buffer.document
+
+    try:
+        start_row, end_row = parse_range(range_, document, editor_buffer.marks)
+    except RangeError as e:
+        editor.show_message(str(e))
+        return
+
+    start, end = get_range_offsets(document, start_row, end_row)
+    _start_shell_filter(editor, editor_buffer, command, start, end,
+                        line_count=end_row - start_row + 1)
+
+
+def read_command_output(editor, range_, command):
+    """
+    Insert the output of a shell command below the cursor line, or below the
+    given line. (`:r !cmd`, `:0r !cmd` inserts above the first line.)
+    """
+    from .ranges import parse_range, RangeError
+
+    editor_buffer = editor.current_editor_buffer
+    document = editor_buffer.buffer.document
+
+    if range_ == '0':
+        position = 0
+    else:
+        try:
+            _, row = parse_range(range_, document, editor_buffer.marks)
+        except RangeError as e:
+            editor.show_message(str(e))
+            return
+        # Start of the next line.
+        position = document.translate_row_col_to_index(row, 0) + len(document.lines[row]) + 1
+
+    _start_shell_filter(editor, editor_buffer, command, position, position)
+
+
+def _start_shell_filter(editor, editor_buffer, command, start, end, line_count=None):
+    """
+    Run the command in the background. When `line_count` is given, the lines
+    between `start` and `end` are sent to the command and replaced by its
+    output. Otherwise, the output is inserted at `start`. (`:r !cmd`)
+    """
+    from .shell_filter import (
+        run_filter, begin_replace, begin_insert, replace_lines, insert_lines)
+
+    if not command.strip():
+        editor.show_message('Argument required')
+        return
+
+    if editor.shell_filter_task:
+        editor.shell_filter_task.cancel()
+
+    buffer = editor_buffer.buffer
+    text = buffer.text
+    is_filter = line_count is not None
+
+    def show_progress(size):
+        editor.show_message('Running %s... %s' % (command, _format_size(size)))
+        get_app().invalidate()
+
+    async def run():
+        # (The new text is built while the output arrives.)
+        output = begin_replace(text, start) if is_filter else begin_insert(text, start)
+        try:
+            result = await run_filter(
+                command, output, text, start, end if is_filter else None,
+                encoding=editor_buffer.encoding, on_progress=show_progress)
+        except OSError as e:
+            editor.show_message('%s' % e)
+            return
+        finally:
+            if editor.shell_filter_task is task:
+                editor.shell_filter_task = None
+            get_app().invalidate()
+
+        if buffer.text != text:
+            editor.show_message('Buffer changed, output of %s discarded' % command)
+            return
+
+        if result.returncode != 0 and result.is_empty:
+            editor.show_message('shell returned %i%s' % (
+                result.returncode, ': %s' % result.error if result.error else ''))
+            return
+
+        editor.message = None
+        if is_filter:
+            new_text, cursor_position = replace_lines(text, start, end, result, output)
+            if line_count > 2:
+                editor.show_message('%i lines filtered' % line_count)
+        elif result.is_empty:
+            return
+        else:
+            new_text, cursor_position = insert_lines(text, start, result, output)
+
+        # One undo step.
+        buffer.save_to_undo_stack()
+        buffer.document = Document(new_text, cursor_position)
+
+    editor.show_message('Running %s...' % command)
+    task = get_app().create_background_task(run())
+    editor.shell_filter_task = task
+
+
+def cancel_shell_filter(editor):
+    """
+    Stop the command of `:!` or `:r !`.
+    """
+    if editor.shell_filter_task:
+        editor.shell_filter_task.cancel()
+        editor.shell_filter_task = None
+        editor.show_message('Interrupted')
+
+
+def _substitute_in_background(editor, buffer, pattern, replace, start, end,
+                              all_matches, search):
+    """
+    Run the substitution in an executor, on a snapshot of the text. The
+    result is only applied when the buffer did not change in the meantime.
+    """
+    from .substitute import BackgroundSubstitute
+
+    if editor.background_substitute:
+        editor.background_substitute.cancel()
+
+    job = BackgroundSubstitute(pattern, replace, buffer.text, start, end, all_matches)
+    editor.background_substitute = job
+    loop = get_event_loop()
+
+    def show_progress():
+        # (The status bar shows the progress.)
+        if editor.background_substitute is job:
+            get_app().invalidate()
+
+    def done(result):
+        if editor.background_substitute is not job:
+            return  # Cancelled.
+        editor.background_substitute = None
+
+        if result is None:
+            pass
+        elif buffer.text != job.text:
+            editor.show_message('Buffer changed, substitution discarded')
+        elif result.count == 0:
+            editor.show_message('Pattern not found: %s' % search)
+        else:
+            editor.message = None
+            buffer.save_to_undo_stack()
+            buffer.document = Document(result.text, result.last_position)
+            _finish_substitute(editor, buffer, result.count, result.line_count)
+        get_app().invalidate()
+
+    def in_executor():
+        result = job.run(lambda: loop.call_soon_threadsafe(show_progress))
+        loop.call_soon_threadsafe(lambda: done(result))
+
+    loop.run_in_executor(None, in_executor)
+
+
+def _count_in_background(editor, pattern, text, start, end, all_matches, search):
+    """
+    Count the matches of ``:s`` with the `n` flag in an executor. Like a
+    substitution in the background, it can be cancelled with Ctrl-C.
+    """
+    from .substitute import BackgroundCount
+
+    if editor.background_substitute:
+        editor.background_substitute.cancel()
+
+    job = BackgroundCount(pattern, text, start, end, all_matches)
+    editor.background_substitute = job
+    loop = get_event_loop()
+
+    def show_progress():
+        # (The status bar shows the progress.)
+        if editor.background_substitute is job:
+            get_app().invalidate()
+
+    def done(result):
+        if editor.background_substitute is not job:
+            return  # Cancelled.
+        editor.background_substitute = None
+
+        if result is not None:
+            _show_count(editor, *result, search)
+        get_app().invalidate()
+
+    def in_executor():
+        result = job.run(lambda: loop.call_soon_threadsafe(show_progress))
+        loop.call_soon_threadsafe(lambda: done(result))
+
+    loop.run_in_executor(None, in_executor)
+
+
+def _show_count(editor, count, line_count, search):
+    " Report the result of counting the matches of ``:s``. "
+    if count:
+        editor.show_message('%i matches on %i lines' % (count, line_count))
+    else:
+        editor.show_message('Pattern not found: %s' % search)
+
+
+def cancel_substitute(editor):
+    """
+    Cancel the substitution (or count) that runs in the background.
+    """
+    if editor.background_substitute:
+        editor.background_substitute.cancel()
+        editor.background_substitute = None
+        editor.show_message('Interrupted')
+
+
+def confirm_substitute(editor, answer):
+    """
+    Handle the answer to the confirmation of a substitution. (y/n/a/q/l, or
+    `None` for another key, which is ignored.)
+    """
+    confirmation = editor.substitute_confirmation
+
+    if confirmation.is_stale:
+        # (The matches are not valid anymore.)
+        editor.substitute_confirmation = None
+        editor.show_message('Buffer changed, substitution stopped')
+        return
+
+    if answer is None:
+        pass
+    elif answer == 'y':
+        confirmation.accept()
+    elif answer == 'n':
+        confirmation.skip()
+    elif answer == 'a':
+        confirmation.accept_all()
+    elif answer == 'l':
+        confirmation.accept()
+        confirmation.quit()
+    else:
+        confirmation.quit()
+
+    if confirmation.done:
+        editor.substitute_confirmation = None
+        if confirmation.last_position is not None:
+            confirmation.buffer.cursor_position = confirmation.last_position
+        _finish_substitute(editor, confirmation.buffer, confirmation.count,
+                           confirmation.line_count)
+    else:
+        editor.show_message(confirmation.prompt)
+
+
+def _finish_substitute(editor, buffer, count, line_count):
+    """
+    Move the cursor to the start of the line of the last substitution, and
+    report the number of substitutions. (Like Vim, when more than two lines
+    changed.)
+    """
+    buffer.cursor_position += buffer.document.get_start_of_line_position(
+        after_whitespace=True)
+
+    if line_count > 2:
+        editor.show_message('%i substitutions on %i lines' % (count, line_count))
@@ -1,46 +1,248 @@
+from asyncio import get_running_loop
+from collections import OrderedDict
+from functools import lru_cache
+from typing import FrozenSet, NamedTuple, Optional
+import os
+import threading
+from prompt_toolkit.completion import Completer, Completion, DynamicCompleter
+from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.document import Document
 
-from prompt_toolkit.completion import Completer, Completion
-from prompt_toolkit.completion import WordCompleter, PathCompleter
-from prompt_toolkit.contrib.completers.system import SystemCompleter
-from prompt_toolkit.contrib.regular_languages.completion import GrammarCompleter
-
-from .grammar import COMMAND_GRAMMAR
+from .grammar import parse_command
 from .commands import get_commands, SET_COMMANDS
+from ..fuzzy import FuzzyIndex
 
 __all__ = (
     'create_command_completer',
+    'DirectoryCache',
+    'LocationCompleter',
+    'ProjectFileCompleter',
 )
 
+#: Maximum number of completions for a path.
+MAX_PATH_COMPLETIONS = 1000
+
+#: Maximum number of completions for `:find` and `:b`.
+MAX_FIND_COMPLETIONS = 100
+
 
 def create_command_completer():
     commands = [c + ' ' for c in get_commands()]
 
-    return GrammarCompleter(COMMAND_GRAMMAR, {
+    return CommandCompleter({
         'command': WordCompleter(commands),
-        'location': PathCompleter(expanduser=True),
+        'location': LocationCompleter(),
         'set_option': WordCompleter(sorted(SET_COMMANDS)),
+        'find_query': ProjectFileCompleter(),
         'buffer_name': BufferNameCompleter(),
         'colorscheme': ColorSchemeCompleter(),
-        'shell_command': SystemCompleter(),
+        # (Compiling the grammar of the system completer takes time, so only
+        # do that when a shell command is completed.)
+        'shell_command': DynamicCompleter(_get_system_completer),
     })
 
 
+@lru_cache(maxsize=1)
+def _get_system_completer():
+    from prompt_toolkit.contrib.completers.system import SystemCompleter
+    return SystemCompleter()
+
+
+class CommandCompleter(Completer):
+    """
+    Complete the variable of the command line that is typed at the cursor,
+    using the completer for that variable. (The input is parsed by
+    `parse_command`, which memoizes the parse for the lexer, the previewer
+    and the handler.)
+    """
+    def __init__(self, completers):
+        self.completers = completers
+
+    def _get_completer(self, document):
+        """
+        Return the completer and the document for the variable at the cursor.
+        """
+        text = document.text_before_cursor
+        end_variable = parse_command(text).end_variable
+        if end_variable is None:
+            return None, None
+
+        name, start = end_variable
+        value = text[start:]
+        return self.completers.get(name), Document(value, len(value))
+
+    def get_completions(self, document, complete_event):
+        completer, document = self._get_completer(document)
+        if completer is not None:
+            yield from completer.get_completions(document, complete_event)
+
+    async def get_completions_async(self, document, complete_event):
+        completer, document = self._get_completer(document)
+        if completer is not None:
+            async for completion in completer.get_completions_async(document, complete_event):
+                yield completion
+
+
+class _Listing(NamedTuple):
+    mtime: int
+    index: FuzzyIndex  # Of the sorted names, the hidden names at the end.
+    hidden_start: int  # Index of the first hidden name.
+    directories: FrozenSet[str]
+
+
+class DirectoryCache(object):
+    """
+    Listings of directories, for the completion of paths. A listing is read
+    again when the modification time of the directory changed. (Which
+    happens when entries are added, removed or renamed.) The listings are
+    read with `os.scandir`, which tells whether an entry is a directory
+    without a `stat` call on most file systems.
+    """
+    def __init__(self, max_size: int = 32):
+        self.max_size = max_size
+        self._listings: 'OrderedDict[str, _Listing]' = OrderedDict()
+        self._lock = threading.Lock()  # (Used from the completion threads.)
+
+    def get_listing(self, directory: str) -> Optional[_Listing]:
+        """
+        Return the listing of this directory, or None when it can't be read.
+        """
+        directory = os.path.abspath(directory)
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+        with self._lock:
+            listing = self._listings.get(directory)
+            if listing is not None and listing.mtime == mtime:
+                self._listings.move_to_end(directory)
+                return listing
+
+        try:
+            listing = _read_listing(directory, mtime)
+        except OSError:
+            return None
+
+        with self._lock:
+            self._listings[directory] = listing
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.max_size:
+                self._listings.popitem(last=False)
+        return listing
+
+
+def _read_listing(directory: str, mtime: int) -> _Listing:
+    directories = set()
+    names = []
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            names.append(entry.name)
+            try:
+                if entry.is_dir():
+                    directories.add(entry.name)
+            except OSError:
+                pass
+
+    # (A plain sort is much faster than a sort with a key.)
+    names.sort()
+    visible = [name for name in names if not name.startswith('.')]
+    hidden = [name for name in names if name.startswith('.')]
+
+    return _Listing(mtime=mtime, index=FuzzyIndex(visible + hidden), hidden_start=len(visible),
+                    directories=frozenset(directories))
+
+
+class LocationCompleter(Completer):
+    """
+    Complete on the entries of a directory. The last part of the path is
+    matched fuzzily. (See `pyvim.fuzzy`.) Hidden entries are only completed
+    when it starts with a dot.
+
+    The asynchronous completion (of the command line) reads the directory and
+    matches in a thread, so that a large directory, or a slow (network) file
+    system doesn't block the user interface. The listings are cached.
+    """
+    def __init__(self, cache: Optional[DirectoryCache] = None,
+                 max_completions: int = MAX_PATH_COMPLETIONS):
+        self.cache = cache or DirectoryCache()
+        self.max_completions = max_completions
+
+    def get_completions(self, document, complete_event):
+        dirname, prefix = os.path.split(document.text_before_cursor)
+        listing = self.cache.get_listing(os.path.expanduser(dirname) or '.')
+        if listing is None:
+            return
+
+        if prefix.startswith('.'):
+            names = listing.index.filter(prefix, limit=self.max_completions)
+        elif prefix:
+            names = [n for n in listing.index.filter(prefix) if not n.startswith('.')]
+            del names[self.max_completions:]
+        else:
+            names = listing.index.names[:min(listing.hidden_start, self.max_completions)]
+
+        for name in names:
+            if name in listing.directories:
+                name += '/'
+            yield Completion(name, start_position=-len(prefix), display=name)
+
+    async def get_completions_async(self, document, complete_event):
+        completions = await get_running_loop().run_in_executor(
+            None, lambda: list(self.get_completions(document, complete_event)))
+        for completion in completions:
+            yield completion
+
+
+class ProjectFileCompleter(Completer):
+    """
+    Complete on the files of the project, matched fuzzily. (The picker of
+    `:find`. See `Editor.get_file_index`.)
+
+    The asynchronous completion starts the indexing, and matches in a thread.
+    """
+    def __init__(self, max_completions: int = MAX_FIND_COMPLETIONS):
+        self.max_completions = max_completions
+
+    def _get_completions(self, index, text):
+        for path in index.find(text, limit=self.max_completions):
+            yield Completion(path, start_position=-len(text), display=path)
+
+    def get_completions(self, document, complete_event):
+        from pyvim.editor import get_editor
+        index = get_editor().file_index
+        if index is not None:
+            yield from self._get_completions(index, document.text_before_cursor)
+
+    async def get_completions_async(self, document, complete_event):
+        from pyvim.editor import get_editor
+        index = get_editor().get_file_index()
+        text = document.text_before_cursor
+
+        completions = await get_running_loop().run_in_executor(
+            None, lambda: list(self._get_completions(index, text)))
+        for completion in completions:
+            yield completion
+
+
 class BufferNameCompleter(Completer):
     """
-    Complete on buffer names.
-    It is sufficient when the input appears anywhere in the buffer name, to
-    trigger a completion.
+    Complete on buffer names. The input is matched fuzzily against the
+    locations, with the index of the buffer list. (See
+    `BufferRegistry.match`.)
     """
+    def __init__(self, max_completions: int = MAX_FIND_COMPLETIONS):
+        self.max_completions = max_completions
 
     def get_completions(self, document, complete_event):
         text = document.text_before_cursor
 
         from pyvim.editor import get_editor
         editor = get_editor()
-        for eb in editor.window_arrangement.editor_buffers:
-            location = eb.location
-
-            if location is not None and text in location:
+        for eb in editor.window_arrangement.editor_buffers.match(text, limit=self.max_completions):
+            if eb.location is not None:
+                location = str(eb.location)
                 yield Completion(location, start_position=-len(text), display=location)
 
 
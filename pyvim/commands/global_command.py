@@ -0,0 +1,136 @@
+"""
+The ``:g`` and ``:v`` commands: execute a command for every line that matches
+(or doesn't match) a pattern.
+
+The matching lines are found in one pass over the lines of the range. Line
+based commands (``d``, ``m0``, ``t$``, ``s``, ...) edit the list of lines, and
+the document is rebuilt once at the end.
+"""
+from typing import List, Optional, Pattern, Tuple
+import itertools
+import operator
+import re
+
+__all__ = (
+    'GlobalCommandError',
+    'find_rows',
+    'parse_normal_command',
+    'apply_to_lines',
+)
+
+_DELETE_RE = re.compile(r'^d(elete)?$')
+_MOVE_RE = re.compile(r'^(?P<command>m|move|t|co|copy)\s*(?P<address>0|\$)$')
+_SUBSTITUTE_RE = re.compile(r"""^(s|substitute)\s*
+    (/(?P<search>([^/\\]|\\.)*)
+     (/(?P<replace>([^/\\]|\\.)*)
+      (/(?P<flags>[gi]*))?)?)?$""", re.VERBOSE)
+_NORMAL_RE = re.compile(r'^norm(al)?!?\s+(?P<keys>.+)$')
+
+
+class GlobalCommandError(Exception):
+    """
+    The command can't be executed by ``:g``.
+    """
+
+
+def find_rows(pattern: Pattern, lines: List[str], start_row: int, end_row: int,
+              invert: bool = False) -> List[int]:
+    """
+    Return the rows between `start_row` and `end_row` (inclusive) that match
+    the pattern, or that don't match when `invert` is set.
+    """
+    # (`map` and `compress` do the loop in C.)
+    found = map(pattern.search, lines[start_row:end_row + 1])
+    return list(itertools.compress(
+        range(start_row, end_row + 1),
+        map(operator.not_, found) if invert else found))
+
+
+def _last_row(lines: List[str]) -> int:
+    """ Row of the last line. (Not the empty line after a trailing newline.) """
+    if len(lines) > 1 and lines[-1] == '':
+        return len(lines) - 2
+    return max(0, len(lines) - 1)
+
+
+def parse_normal_command(command: str) -> Optional[str]:
+    """
+    Return the keys of a ``normal`` command, or `None` for other commands.
+    """
+    m = _NORMAL_RE.match(command)
+    return m.group('keys') if m else None
+
+
+def apply_to_lines(lines: List[str], rows: List[int], command: str,
+                   pattern: Pattern, ignore_case: bool = False) -> Tuple[List[str], int]:
+    """
+    Execute a line based command for all these rows. Return the new lines and
+    the row for the cursor. `pattern` is used when ``s`` has no pattern.
+
+    :raises GlobalCommandError: for commands that are not supported.
+    """
+    command = command.strip()
+
+    if _DELETE_RE.match(command):
+        deleted = set(rows)
+        new_lines = [l for i, l in enumerate(lines) if i not in deleted]
+        # Cursor on the line after the last deleted line.
+        cursor_row = rows[-1] - len(rows) + 1
+        return new_lines, min(cursor_row, _last_row(new_lines))
+
+    m = _MOVE_RE.match(command)
+    if m:
+        selected = [lines[i] for i in rows]
+        copy = m.group('command') in ('t', 'co', 'copy')
+
+        if copy:
+            rest = lines
+        else:
+            selected_rows = set(rows)
+            rest = [l for i, l in enumerate(lines) if i not in selected_rows]
+
+        if m.group('address') == '0':
+            # Every line goes to the top, one after the other: they end up in
+            # reverse order.
+            selected.reverse()
+            return selected + rest, 0
+        else:
+            # After the last line. (Before the empty line after a trailing
+            # newline.)
+            if len(lines) > 1 and lines[-1] == '':
+                new_lines = rest[:-1] + selected + ['']
+            else:
+                new_lines = rest + selected
+            return new_lines, _last_row(new_lines)
+
+    m = _SUBSTITUTE_RE.match(command)
+    if m:
+        from .substitute import compile_pattern
+
+        search = m.group('search')
+        flags = m.group('flags') or ''
+        if search:
+            try:
+                sub_pattern = compile_pattern(search, ignore_case=('i' in flags or ignore_case))
+            except re.error as e:
+                raise GlobalCommandError('Invalid pattern: %s' % e)
+        else:
+            sub_pattern = pattern
+        replace = (m.group('replace') or '').replace('\\/', '/')
+        count = 0 if 'g' in flags else 1
+
+        new_lines = list(lines)
+        cursor_row = None
+        try:
+            for row in rows:
+                new_lines[row], n = sub_pattern.subn(replace, lines[row], count)
+                if n:
+                    cursor_row = row
+        except re.error as e:
+            raise GlobalCommandError('Invalid replacement: %s' % e)
+
+        if cursor_row is None:
+            raise GlobalCommandError('Pattern not found: %s' % sub_pattern.pattern)
+        return new_lines, cursor_row
+
+    raise GlobalCommandError('Not supported with :g: %s' % command)
@@ -1,63 +1,308 @@
-from typing import Optional, Tuple, NamedTuple
-from prompt_toolkit.contrib.regular_languages.compiler import compile, Variables
+"""
+Parser for the Vim command line.
+
+The input is parsed on every keystroke: for the highlighting, the completion
+and the preview, and once more by the handler when enter is pressed. So this
+is a small hand-written parser: the command name is looked up in a table,
+which tells how to parse the arguments of the command. The last parse is
+memoized, because all of these parse the same input.
+
+The variables are the same as the ones of the regular grammar that was used
+before. (See `handle_command` for how they are used.)
+"""
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
 from .commands import get_commands_taking_locations
+from .ranges import RANGE_PATTERN
+
+__all__ = (
+    'ParsedCommand',
+    'parse_command',
+    'CommandSetOption',
+    'parse_input',
+)
+
+_LEADING_RE = re.compile(r':*\s*')
+_SPACE_RE = re.compile(r'\s*')
+_SPACES_RE = re.compile(r'\s+')
+_SPACES_BEFORE_ARGUMENT_RE = re.compile(r'\s+(?=.)')  # (The last space can be the argument.)
+_RANGE_RE = re.compile(RANGE_PATTERN)
+_NAME_RE = re.compile(r'[a-zA-Z]+')
+_WORD_RE = re.compile(r'[^\s!]+')
+_FORCE_RE = re.compile(r'!?')
+_REST_RE = re.compile(r'.*')
+_ARGUMENT_RE = re.compile(r'.+')
+_LOCATION_RE = re.compile(r'[^\s]+')
+_NUMBER_RE = re.compile(r'\d+')
+_PATTERN_RE = re.compile(r'([^/\\]|\\.)*')
+_FLAGS_RE = re.compile(r'/[gcin]*')
+_SET_OPTION_RE = re.compile(r'[^\s=]+')
+_SET_VALUE_RE = re.compile(r'([^\s\\]|\\.)+')  # Spaces are escaped with a backslash.
+
+
+class ParsedCommand(object):
+    """
+    The result of parsing the command line.
+
+    Use `get` for the value of a variable, like for the variables of a match
+    of a regular grammar. When the input didn't match (`matched` is False),
+    the variables are the ones of the part that could be parsed. (For the
+    highlighting.)
+    """
+    __slots__ = ('text', 'matched', 'variables', 'end_variable')
+
+    def __init__(self, text: str, matched: bool,
+                 variables: Tuple[Tuple[str, str, int, int], ...],
+                 end_variable: Optional[Tuple[str, int]]):
+        self.text = text
+        self.matched = matched
+
+        #: (name, value, start, stop) tuples.
+        self.variables = variables
+
+        #: (name, start) of the variable that is typed at the end of the
+        #: input, or None. (For the completion.)
+        self.end_variable = end_variable
+
+    def __repr__(self):
+        return '%s(%r, %s)' % (
+            self.__class__.__name__, self.text,
+            ', '.join('%s=%r' % (name, value) for name, value, _, _ in self.variables))
+
+    def get(self, name: str, default=None):
+        for n, value, _, _ in self.variables:
+            if n == name:
+                return value
+        return default
+
+    def __getitem__(self, name: str):
+        return self.get(name)
+
+    def spans(self) -> Iterator[Tuple[str, int, int]]:
+        " Yield (name, start, stop) for all the variables. "
+        for name, _, start, stop in self.variables:
+            yield name, start, stop
+
+
+class _Parser(object):
+    """
+    Position in the input, and the variables found so far.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.variables: List[Tuple[str, str, int, int]] = []
+        self.end_variable: Optional[Tuple[str, int]] = None
+
+        # The variables of the attempt that got the furthest.
+        self.furthest: Tuple[int, List[Tuple[str, str, int, int]]] = (-1, [])
+
+    def restart(self, pos: int):
+        " Try another alternative from this position. "
+        if self.pos > self.furthest[0]:
+            self.furthest = (self.pos, self.variables)
+        self.pos = pos
+        self.variables = []
+
+    def skip(self, regex) -> bool:
+        m = regex.match(self.text, self.pos)
+        if m is None:
+            return False
+        self.pos = m.end()
+        return True
+
+    def literal(self, string: str) -> bool:
+        if self.text.startswith(string, self.pos):
+            self.pos += len(string)
+            return True
+        return False
+
+    def variable(self, name: str, regex) -> bool:
+        """
+        Match `regex` as the value of the variable `name`. (When the input
+        ends where the value starts, or in the value, this is the variable
+        for the completion.)
+        """
+        start = self.pos
+        m = regex.match(self.text, start)
+        if m is None:
+            if start == len(self.text):
+                self.end_variable = (name, start)
+            return False
+
+        # (An empty value, like an empty bang after the command name, is not
+        # the one that is typed when the previous variable ends here too.)
+        end = m.end()
+        if end == len(self.text) and (end > start or not self.variables or
+                                      self.variables[-1][3] != end):
+            self.end_variable = (name, start)
+        self.variables.append((name, m.group(), start, end))
+        self.pos = end
+        return True
+
+    def at_end(self) -> bool:
+        " Allow trailing whitespace. "
+        self.skip(_SPACE_RE)
+        return self.pos == len(self.text)
+
+
+# Parsers for the arguments of a command. They are called after the name of
+# the command, and return True when the rest of the input matches.
+
+def _argument(name: str, regex, force: bool = True, optional: bool = False) -> Callable[[_Parser], bool]:
+    """
+    Parser for commands that take one argument, after whitespace.
+    """
+    spaces = _SPACES_BEFORE_ARGUMENT_RE if regex is _ARGUMENT_RE else _SPACES_RE
+
+    def parse(p: _Parser) -> bool:
+        if force:
+            p.variable('force', _FORCE_RE)
+        if not p.skip(spaces):
+            return optional and p.at_end()
+        return p.variable(name, regex) and p.at_end()
+    return parse
+
+
+def _parse_substitute(p: _Parser) -> bool:
+    " s/search/replace/flags "
+    p.skip(_SPACE_RE)
+    if not p.literal('/'):
+        return False
+    p.variable('search', _PATTERN_RE)
+    if p.literal('/'):
+        p.variable('replace', _PATTERN_RE)
+        p.variable('flags', _FLAGS_RE)
+    return p.at_end()
+
+
+def _parse_global(p: _Parser) -> bool:
+    " g/pattern/command "
+    p.variable('force', _FORCE_RE)
+    p.skip(_SPACE_RE)
+    return (p.literal('/') and
+            p.variable('global_pattern', _PATTERN_RE) and
+            p.literal('/') and
+            p.variable('global_command', _REST_RE) and
+            p.at_end())
+
+
+def _parse_read(p: _Parser) -> bool:
+    " r !command "
+    p.skip(_SPACE_RE)
+    return p.literal('!') and p.variable('read_command', _REST_RE) and p.at_end()
+
+
+def _parse_set(p: _Parser) -> bool:
+    " set option[=value] "
+    if not (p.skip(_SPACES_RE) and p.variable('set_option', _SET_OPTION_RE)):
+        return False
+    if p.literal('=') and not p.variable('set_value', _SET_VALUE_RE):
+        return False
+    return p.at_end()
+
+
+class _CommandSyntax(NamedTuple):
+    parse_arguments: Callable[[_Parser], bool]
+    accepts_range: bool = False
+
+
+def _create_command_table() -> Dict[str, _CommandSyntax]:
+    table = {}
+
+    def add(names, parse_arguments, accepts_range=False):
+        for name in names:
+            table[name] = _CommandSyntax(parse_arguments, accepts_range)
+
+    add(['s', 'substitute'], _parse_substitute, accepts_range=True)
+    add(['g', 'global', 'v', 'vglobal'], _parse_global, accepts_range=True)
+    add(['r', 'read'], _parse_read, accepts_range=True)
+    add(['bufdo', 'bufd', 'argdo', 'argd'], _argument('batch_command', _ARGUMENT_RE))
+    add(['norm', 'normal'], _argument('normal_keys', _ARGUMENT_RE), accepts_range=True)
+    add(['sort', 'sor'], _argument('sort_args', _REST_RE, optional=True), accepts_range=True)
+    add(['grep', 'vimgrep', 'vim'], _argument('grep_args', _ARGUMENT_RE))
+    add(['make', 'mak'], _argument('make_args', _REST_RE, optional=True))
+    add(['cc'], _argument('quickfix_number', _NUMBER_RE))
+    add(get_commands_taking_locations(), _argument('location', _LOCATION_RE))
+    add(['b', 'buffer'], _argument('buffer_name', _LOCATION_RE))
+    add(['find', 'fin', 'Files'], _argument('find_query', _ARGUMENT_RE, force=False))
+    add(['set'], _parse_set)
+    add(['colorscheme'], _argument('colorscheme', _LOCATION_RE, force=False))
+    return table
+
+
+#: Syntax of the commands that take arguments, by name.
+_COMMANDS = _create_command_table()
 
 
-#: The compiled grammar for the Vim command line.
-COMMAND_GRAMMAR = compile(r"""
-    # Allow leading colons and whitespace. (They are ignored.)
-    :*
-    \s*
-    (
-        # Substitute command
-        ((?P<range_start>\d+)(,(?P<range_end>\d+))?)?  (?P<command>s|substitute) \s* / (?P<search>[^/]*) ( / (?P<replace>[^/]*) (?P<flags> /(g)? )? )?   |
+def _parse_command(p: _Parser) -> bool:
+    """
+    A command from the table (with a range when the command accepts one), a
+    range followed by a shell command (filter), a line number, or a shell
+    command.
+    """
+    has_range = p.variable('range', _RANGE_RE)
 
-        # Commands accepting a location.
-        (?P<command>%(commands_taking_locations)s)(?P<force>!?)  \s+   (?P<location>[^\s]+)   |
+    if p.variable('command', _NAME_RE):
+        syntax = _COMMANDS.get(p.variables[-1][1])
+        if syntax is None or (has_range and not syntax.accepts_range):
+            return False
+        return syntax.parse_arguments(p)
 
-        # Commands accepting a buffer.
-        (?P<command>b|buffer)(?P<force>!?)  \s+   (?P<buffer_name>[^\s]+)    |
+    if has_range:
+        name, value, start, stop = p.variables[0]
+        if value.isdigit() and p.at_end():
+            p.variables[0] = ('go_to_line', value, start, stop)
+            return True
 
-        # Jump to line numbers.
-        (?P<go_to_line>\d+)                                     |
+        p.skip(_SPACE_RE)
+        return p.literal('!') and p.variable('filter_command', _REST_RE) and p.at_end()
 
-        # Set operation
-        (?P<command>set) \s+ (?P<set_option>[^\s=]+)
-                             (=(?P<set_value>[^\s]+))?           |
+    return p.literal('!') and p.variable('shell_command', _REST_RE) and p.at_end()
 
-        # Colorscheme command
-        (?P<command>colorscheme) \s+ (?P<colorscheme>[^\s]+)    |
 
-        # Shell command
-        !(?P<shell_command>.*)                                  |
+def _parse_other(p: _Parser) -> bool:
+    """
+    Any other command, with an optional bang. (Or the empty input.)
+    """
+    if p.variable('command', _WORD_RE):
+        p.variable('force', _FORCE_RE)
+    return p.at_end()
 
-        # Any other normal command.
-        (?P<command>[^\s!]+)(?P<force>!?)                         |
 
-        # Accept the empty input as well. (Ignores everything.)
+@lru_cache(maxsize=1)
+def parse_command(text: str) -> ParsedCommand:
+    """
+    Parse the input of the command line. (The last result is memoized.)
+    """
+    p = _Parser(text)
+    p.skip(_LEADING_RE)  # Leading colons and whitespace are ignored.
+    start = p.pos
 
-        #(?P<command>colorscheme.+)    (?P<colorscheme>[^\s]+)  |
-    )
+    matched = _parse_command(p)
+    if not matched:
+        p.restart(start)
+        matched = _parse_other(p)
+        if not matched:
+            p.restart(start)
+            p.variables = p.furthest[1]
 
-    # Allow trailing space.
-    \s*
-""" % {
-    'commands_taking_locations': '|'.join(get_commands_taking_locations()),
-})
+    return ParsedCommand(text, matched, tuple(p.variables), p.end_variable)
 
 
 class CommandSetOption(NamedTuple):
-    variables: Optional[Variables] = None
+    variables: Optional[ParsedCommand] = None
     command: Optional[str] = None
     set_option: Optional[str] = None
 
 
 def parse_input(input_string: str) -> CommandSetOption:
-    m = COMMAND_GRAMMAR.match(input_string)
-    if m is None:
+    parsed = parse_command(input_string)
+    if not parsed.matched:
         return CommandSetOption()
 
-    variables = m.variables()
-    command = variables.get('command')
-    set_option = variables.get('set_option')
-    return CommandSetOption(variables, command, set_option)
+    command = parsed.get('command')
+    set_option = parsed.get('set_option')
+    return CommandSetOption(parsed, command, set_option)
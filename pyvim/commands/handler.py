@@ -1,7 +1,9 @@
 import logging
 import asyncio
-from .grammar import COMMAND_GRAMMAR
-from .commands import call_command_handler, has_command_handler, substitute
+from .grammar import parse_command
+from .commands import (
+    call_command_handler, has_command_handler, substitute, global_, filter_lines,
+    read_command_output, sort_lines, normal, buffer_do, argument_do)
 logger = logging.getLogger(__name__)
 
 
@@ -14,20 +16,23 @@ def handle_command(input_string):
     """
     Handle commands entered on the Vi command line.
     """
-    # Match with grammar and extract variables.
-    m = COMMAND_GRAMMAR.match(input_string)
-    if m is None:
+    # Parse and extract variables. (Usually, the previewer already parsed
+    # this input.)
+    variables = parse_command(input_string)
+    if not variables.matched:
         return
 
-    variables = m.variables()
     command = variables.get('command')
     go_to_line = variables.get('go_to_line')
     shell_command = variables.get('shell_command')
-    range_start = variables.get('range_start')
-    range_end = variables.get('range_end')
+    range_ = variables.get('range')
     search = variables.get('search')
     replace = variables.get('replace')
     flags = variables.get('flags', '')
+    global_pattern = variables.get('global_pattern')
+    global_command = variables.get('global_command')
+    filter_command = variables.get('filter_command')
+    read_command = variables.get('read_command')
 
     # Call command handler.
     from pyvim.editor import get_editor
@@ -36,6 +41,14 @@ def handle_command(input_string):
         # Handle go-to-line.
         _go_to_line(editor, go_to_line)
 
+    elif filter_command is not None:
+        # Filter lines through a shell command.
+        filter_lines(editor, range_, filter_command)
+
+    elif read_command is not None:
+        # Insert the output of a shell command.
+        read_command_output(editor, range_, read_command)
+
     elif shell_command is not None:
         # Handle shell commands.
         editor.application.run_system_command(shell_command)
@@ -46,7 +59,23 @@ def handle_command(input_string):
 
     elif command in ('s', 'substitute'):
         flags = flags.lstrip('/')
-        substitute(editor, range_start, range_end, search, replace, flags)
+        substitute(editor, range_, search, replace, flags)
+
+    elif command in ('g', 'global', 'v', 'vglobal'):
+        invert = command in ('v', 'vglobal') or bool(variables.get('force'))
+        global_(editor, range_, global_pattern, global_command, invert)
+
+    elif command in ('bufdo', 'bufd'):
+        buffer_do(editor, variables.get('batch_command'))
+
+    elif command in ('argdo', 'argd'):
+        argument_do(editor, variables.get('batch_command'))
+
+    elif command in ('norm', 'normal'):
+        normal(editor, range_, variables.get('normal_keys'))
+
+    elif command in ('sort', 'sor'):
+        sort_lines(editor, range_, variables.get('sort_args'), bool(variables.get('force')))
 
     else:
         # For unknown commands, show error message.
@@ -1,9 +1,8 @@
-
-from prompt_toolkit.contrib.regular_languages.lexer import GrammarLexer
-from prompt_toolkit.lexers import PygmentsLexer, SimpleLexer
+from prompt_toolkit.document import Document
+from prompt_toolkit.lexers import Lexer, PygmentsLexer, SimpleLexer
 
 from pygments.lexers import BashLexer
-from .grammar import COMMAND_GRAMMAR
+from .grammar import parse_command
 
 __all__ = (
     'create_command_lexer',
@@ -14,8 +13,35 @@ def create_command_lexer():
     """
     Lexer for highlighting of the command line.
     """
-    return GrammarLexer(COMMAND_GRAMMAR, lexers={
+    return CommandLexer(lexers={
         'command': SimpleLexer('class:commandline.command'),
         'location': SimpleLexer('class:commandline.location'),
         'shell_command': PygmentsLexer(BashLexer),
     })
+
+
+class CommandLexer(Lexer):
+    """
+    Highlight the variables of the command line with the lexer for that
+    variable. (The input is parsed by `parse_command`, like for the
+    completion.)
+    """
+    def __init__(self, lexers):
+        self.lexers = lexers
+
+    def lex_document(self, document):
+        text = document.text
+        fragments = []
+        pos = 0
+
+        for name, start, stop in parse_command(text).spans():
+            lexer = self.lexers.get(name)
+            if lexer is not None and start >= pos:
+                fragments.append(('', text[pos:start]))
+                fragments.extend(lexer.lex_document(Document(text[start:stop]))(0))
+                pos = stop
+
+        fragments.append(('', text[pos:]))
+
+        # (The command line has one line.)
+        return lambda lineno: fragments if lineno == 0 else []
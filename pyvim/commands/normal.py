@@ -0,0 +1,267 @@
+"""
+Execution of normal mode keys from an Ex command (like ``:normal``), and
+playback of macros (``@q``).
+
+The keys are executed as a batch. (See `Editor.batch_edit`.) The screen and
+the reporter are only updated once, at the end, and the batch is one undo
+step.
+"""
+from typing import Dict, Hashable, List
+import functools
+from prompt_toolkit.input.ansi_escape_sequences import ANSI_SEQUENCES
+from prompt_toolkit.input.vt100_parser import Vt100Parser
+from prompt_toolkit.key_binding.bindings.page_navigation import load_page_navigation_bindings
+from prompt_toolkit.key_binding.defaults import load_key_bindings
+from prompt_toolkit.key_binding.key_bindings import (
+    Binding, GlobalOnlyKeyBindings, KeyBindingsBase, KeysTuple, merge_key_bindings)
+from prompt_toolkit.key_binding.key_processor import KeyPress, KeyProcessor
+from prompt_toolkit.key_binding.vi_state import InputMode
+from prompt_toolkit.layout.containers import Window
+from prompt_toolkit.layout.layout import walk
+
+__all__ = (
+    'execute_normal_on_rows',
+    'execute_normal',
+    'execute_macro',
+)
+
+
+#: Number of characters after the start of the next row that are compared,
+#: to check that the keys did not change the text there.
+_JUNCTION_SIZE = 1024
+
+
+def _to_key_presses(keys: str) -> List[KeyPress]:
+    return [KeyPress(ANSI_SEQUENCES.get(c, c), c) for c in keys]
+
+
+def execute_normal_on_rows(editor, buffer, rows: List[int], keys: str):
+    """
+    Execute `keys` in navigation mode, with the cursor at the start of every
+    row. Rows are shifted by the lines that were inserted or deleted for the
+    previous rows. The whole execution is one undo step.
+    """
+    def run(processor, key_presses):
+        if not rows:
+            return
+        line_count = buffer.text.count('\n')
+        position = buffer.document.translate_row_col_to_index(rows[0], 0)
+
+        # The shortest distance between the cursor and the end of the text,
+        # while the keys of a row are processed. (The keys edit the text at
+        # the cursor.)
+        nearest_end = 0
+
+        def track_cursor(_):
+            nonlocal nearest_end
+            nearest_end = min(nearest_end, len(buffer.text) - buffer.cursor_position)
+
+        buffer.on_cursor_position_changed += track_cursor
+        buffer.on_text_changed += track_cursor
+        try:
+            for i, row in enumerate(rows):
+                text = buffer.text
+                buffer.cursor_position = position
+                nearest_end = len(text) - position
+                _process(editor, processor, key_presses)
+
+                if i + 1 == len(rows):
+                    break
+
+                new_text = buffer.text
+                next_start = _skip_lines(text, position, rows[i + 1] - row)
+
+                # Find the start of the next row. (Building the index of all
+                # the line starts for every row would be quadratic.) When the
+                # text after it was not changed, it's as far from the end as
+                # before.
+                if new_text is text:
+                    position = next_start
+                else:
+                    tail = len(text) - next_start if next_start != -1 else -1
+                    position = len(new_text) - tail
+                    if not (tail != -1 and nearest_end > tail and position >= 0 and
+                            (position == 0 or new_text[position - 1] == '\n') and
+                            new_text.startswith(text[next_start:next_start + _JUNCTION_SIZE], position)):
+                        new_row = rows[i + 1] + new_text.count('\n') - line_count
+                        if new_row > buffer.document.line_count - 1:
+                            return
+                        position = buffer.document.translate_row_col_to_index(new_row, 0)
+
+                if position == -1:
+                    return  # Past the last line.
+        finally:
+            buffer.on_cursor_position_changed -= track_cursor
+            buffer.on_text_changed -= track_cursor
+
+    _execute(editor, buffer, _to_key_presses(keys), run)
+
+
+def _skip_lines(text: str, position: int, count: int) -> int:
+    """
+    Return the start of the line, `count` lines after the line that starts
+    at `position`. (-1 when there are not that many lines.)
+    """
+    for _ in range(count):
+        position = text.find('\n', position) + 1
+        if position == 0:
+            return -1
+    return position
+
+
+def execute_normal(editor, buffer, keys: str):
+    """
+    Execute `keys` in navigation mode, at the cursor. (``:normal`` without
+    range.)
+    """
+    _execute(editor, buffer, _to_key_presses(keys),
+             lambda processor, key_presses: _process(editor, processor, key_presses))
+
+
+def execute_macro(editor, buffer, text: str, count: int = 1):
+    """
+    Execute the keys of a recorded macro `count` times. The playback stops
+    when the keys did not change the text or the cursor position anymore.
+    (Like a macro in Vim stops at the first error, for instance when `j`
+    reaches the last line.)
+    """
+    # (The register contains the data of the recorded keys. Parse it like
+    # input from the terminal.)
+    key_presses: List[KeyPress] = []
+    parser = Vt100Parser(key_presses.append)
+    parser.feed(text)
+    parser.flush()
+
+    def run(processor, key_presses):
+        for _ in range(count):
+            before = buffer.text, buffer.cursor_position
+            processor.feed_multiple(key_presses)
+            processor.process_keys()
+            if (buffer.text, buffer.cursor_position) == before:
+                break
+
+    # (Unlike ``:normal``, a macro can leave the editor in another mode.)
+    _execute(editor, buffer, key_presses, run, restore_mode=False)
+
+
+def _execute(editor, buffer, key_presses: List[KeyPress], run, restore_mode=True):
+    """
+    Call `run(processor, key_presses)` as a batch, with a key processor of our
+    own. (This runs from a key binding of the application's key processor:
+    enter in the command line, or `@`.)
+    """
+    app = editor.application
+    processor = KeyProcessor(_BatchKeyBindings(app))
+
+    # Don't wait for more keys at the end. (Incomplete sequences are dropped.)
+    timeoutlen = app.timeoutlen
+    app.timeoutlen = None
+
+    try:
+        with editor.batch_edit(buffer):
+            run(processor, key_presses)
+    finally:
+        app.timeoutlen = timeoutlen
+        if restore_mode:
+            app.vi_state.input_mode = InputMode.NAVIGATION
+
+
+def _process(editor, processor: KeyProcessor, key_presses: List[KeyPress]):
+    " Process the keys in navigation mode. "
+    editor.application.vi_state.input_mode = InputMode.NAVIGATION
+    processor.feed_multiple(key_presses)
+    processor.process_keys()
+    processor.reset()
+
+
+class _BatchKeyBindings(KeyBindingsBase):
+    """
+    The key bindings of the application, for a batch:
+
+    - They are looked up once for every window that gets the focus. (The
+      application looks them up for every key, by walking through the whole
+      layout.)
+    - They don't save the buffer in the undo stack before every key. (The
+      batch is one undo step.)
+    """
+    def __init__(self, app):
+        self.app = app
+        self._cache: Dict[Window, KeyBindingsBase] = {}
+        self._without_save: Dict[Binding, Binding] = {}
+
+    def _get_key_bindings(self) -> KeyBindingsBase:
+        window = self.app.layout.current_window
+        try:
+            return self._cache[window]
+        except KeyError:
+            result = self._cache[window] = _merge_key_bindings(self.app, window)
+            return result
+
+    def _copy_without_save(self, bindings: List[Binding]) -> List[Binding]:
+        result = []
+        for b in bindings:
+            try:
+                result.append(self._without_save[b])
+            except KeyError:
+                copy = self._without_save[b] = Binding(
+                    b.keys, b.handler, filter=b.filter, eager=b.eager, is_global=b.is_global,
+                    save_before=lambda e: False, record_in_macro=b.record_in_macro)
+                result.append(copy)
+        return result
+
+    @property
+    def _version(self) -> Hashable:
+        return self._get_key_bindings()._version
+
+    @property
+    def bindings(self) -> List[Binding]:
+        return self._copy_without_save(self._get_key_bindings().bindings)
+
+    def get_bindings_for_keys(self, keys: KeysTuple) -> List[Binding]:
+        return self._copy_without_save(self._get_key_bindings().get_bindings_for_keys(keys))
+
+    def get_bindings_starting_with_keys(self, keys: KeysTuple) -> List[Binding]:
+        return self._copy_without_save(self._get_key_bindings().get_bindings_starting_with_keys(keys))
+
+
+@functools.lru_cache(maxsize=1)
+def _get_default_key_bindings() -> KeyBindingsBase:
+    " The default key bindings of prompt_toolkit, and its page navigation. "
+    return merge_key_bindings([load_key_bindings(), load_page_navigation_bindings()])
+
+
+def _merge_key_bindings(app, window: Window) -> KeyBindingsBase:
+    """
+    The key bindings that the application uses when `window` has the focus.
+    (Like prompt_toolkit: the bindings of the window and of its parents, the
+    global bindings of the other containers, the key bindings of the
+    application and the default bindings.)
+    """
+    key_bindings = []
+    collected = set()
+
+    container = window
+    while True:
+        collected.add(container)
+        kb = container.get_key_bindings()
+        if kb is not None:
+            key_bindings.append(kb)
+        if container.is_modal():
+            break
+        parent = app.layout.get_parent(container)
+        if parent is None:
+            break
+        container = parent
+
+    for c in walk(container):
+        if c not in collected:
+            kb = c.get_key_bindings()
+            if kb is not None:
+                key_bindings.append(GlobalOnlyKeyBindings(kb))
+
+    if app.key_bindings:
+        key_bindings.append(app.key_bindings)
+    key_bindings.append(_get_default_key_bindings())
+
+    # (The bindings of the focused window come last: they have priority.)
+    return merge_key_bindings(key_bindings[::-1])
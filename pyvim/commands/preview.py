@@ -22,6 +22,14 @@ class CommandPreviewer(object):
         """
         from pyvim.editor import get_editor
         e = get_editor()
+
+        # Stop counting the matches of the ':s' preview, and hide its count.
+        preview = e.state.substitute_preview
+        if preview is not None:
+            preview.cancel()
+            if preview.message is not None and e.message == preview.message:
+                e.message = None
+
         e.state = self._state
 
     def preview(self, input_string: str):
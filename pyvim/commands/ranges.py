@@ -0,0 +1,102 @@
+"""
+Line ranges for Ex commands. (Like ``:%s``, ``:.,$s`` or ``:'a,'bs``.)
+
+An address is a line number, ``.`` for the current line, ``$`` for the last
+line or ``'x`` for the line of mark x, optionally followed by an offset like
+``+3`` or ``-1``. (A lone offset is relative to the current line.) ``%`` is
+the whole buffer.
+"""
+from typing import Dict, Optional, Tuple
+import re
+from prompt_toolkit.document import Document
+
+__all__ = (
+    'RANGE_PATTERN',
+    'RangeError',
+    'parse_range',
+)
+
+_ADDRESS_PATTERN = r"""((\d+|\.|\$|'[a-z<>])([+-]\d+)?|[+-]\d+)"""
+
+#: Regular expression for a range, to be used in the command grammar.
+RANGE_PATTERN = r"""(%%|%(address)s(,%(address)s)?)""" % {'address': _ADDRESS_PATTERN}
+
+_ADDRESS_RE = re.compile(r"""^(?P<base>\d+|\.|\$|'[a-z<>])?(?P<offset>[+-]\d+)?$""")
+
+
+class RangeError(Exception):
+    """
+    The range could not be resolved. (Unknown mark, or out of the buffer.)
+    """
+
+
+def _last_row(document: Document) -> int:
+    """
+    Row of the last line. (Not counting the empty line after a trailing
+    newline.)
+    """
+    if document.text.endswith('\n'):
+        return max(0, document.line_count - 2)
+    return document.line_count - 1
+
+
+def _parse_address(address: str, document: Document, marks: Dict[str, int]) -> int:
+    """
+    Return the (zero based) row for this address.
+    """
+    m = _ADDRESS_RE.match(address)
+    if m is None:
+        raise RangeError('Invalid range')
+
+    base = m.group('base')
+    if base is None or base == '.':
+        row = document.cursor_position_row
+    elif base == '$':
+        row = _last_row(document)
+    elif base.startswith("'"):
+        try:
+            position = marks[base[1:]]
+        except KeyError:
+            raise RangeError('Mark not set')
+        row, _ = document.translate_index_to_position(min(position, len(document.text)))
+    else:
+        row = int(base) - 1
+
+    if m.group('offset'):
+        row += int(m.group('offset'))
+
+    return row
+
+
+def parse_range(range_text: Optional[str], document: Document,
+                marks: Optional[Dict[str, int]] = None) -> Tuple[int, int]:
+    """
+    Return the first and last row (zero based, inclusive) of this range.
+    Without range, that's the current line.
+
+    :param marks: Mapping from mark name to cursor position.
+    """
+    if not range_text:
+        row = document.cursor_position_row
+        return row, row
+
+    if range_text == '%':
+        return 0, _last_row(document)
+
+    marks = marks or {}
+    addresses = range_text.split(',')
+    start = _parse_address(addresses[0], document, marks)
+    end = _parse_address(addresses[1], document, marks) if len(addresses) > 1 else start
+
+    # Line 0 is accepted as the first line, like in Vim.
+    start = max(start, 0)
+    end = max(end, 0)
+
+    if start >= document.line_count or end >= document.line_count:
+        raise RangeError('Invalid range')
+
+    # Backwards ranges are swapped.
+    if start > end:
+        start, end = end, start
+
+    return start, end
@@ -0,0 +1,222 @@
+"""
+Shell filters: ``:{range}!cmd`` and ``:r !cmd``.
+
+The command runs as an asyncio subprocess. The lines of the range are written
+to its stdin in chunks, while its output is read in chunks and decoded
+incrementally. The new text of the buffer is built while the output arrives:
+an `io.StringIO` that starts with the text before the range (`begin_replace`
+or `begin_insert`) receives every decoded chunk, which is dropped right after
+that. The text after the range is added at the end (`replace_lines` or
+`insert_lines`). So the output is never held on its own, next to the new text.
+"""
+from typing import Callable, NamedTuple, Optional, TextIO, Tuple
+import asyncio
+import codecs
+import io
+import os
+import signal
+
+__all__ = (
+    'FilterResult',
+    'run_filter',
+    'create_shell_process',
+    'kill_shell_process',
+    'begin_replace',
+    'begin_insert',
+    'replace_lines',
+    'insert_lines',
+)
+
+#: Size of the chunks that are written to the command and read from it.
+CHUNK_SIZE = 256 * 1024
+
+#: Only the end of the error output is kept.
+_MAX_ERROR_SIZE = 4096
+
+
+async def create_shell_process(command: str, **kwargs) -> asyncio.subprocess.Process:
+    """
+    Start a shell command. On POSIX systems, it gets its own process group,
+    so that `kill_shell_process` also stops the processes that it started.
+    """
+    if os.name == 'posix':
+        kwargs['start_new_session'] = True
+    return await asyncio.create_subprocess_shell(command, **kwargs)
+
+
+async def kill_shell_process(process: asyncio.subprocess.Process) -> None:
+    """
+    Stop a command that was started by `create_shell_process`, and wait for it.
+    """
+    if process.returncode is None:
+        try:
+            if os.name == 'posix':
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+class FilterResult(NamedTuple):
+    size: int  # The number of bytes of output.
+    returncode: int
+    error: str  # The last line of the error output.
+
+    @property
+    def is_empty(self) -> bool:
+        return not self.size
+
+
+async def run_filter(command: str, output: TextIO, text: str = '', start: int = 0,
+                     end: Optional[int] = None, encoding: str = 'utf-8',
+                     on_progress: Optional[Callable[[int], None]] = None) -> FilterResult:
+    """
+    Run `command` in a shell, with `text[start:end]` (plus a newline) as input.
+    Without `end`, the command doesn't receive any input. (``:r !cmd``)
+
+    The decoded output is written to `output` while it arrives, without the
+    newline at the end. (The last line of a buffer doesn't end with a
+    newline.)
+
+    :param on_progress: Called with the number of bytes that were read.
+    """
+    process = await create_shell_process(
+        command,
+        stdin=asyncio.subprocess.DEVNULL if end is None else asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+
+    async def write():
+        stdin = process.stdin
+        try:
+            for position in range(start, end, CHUNK_SIZE):
+                stdin.write(text[position:min(position + CHUNK_SIZE, end)].encode(encoding, 'replace'))
+                await stdin.drain()
+            stdin.write(b'\n')
+            await stdin.drain()
+            stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The command stopped reading. (Like `head`.)
+
+    async def read():
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        size = 0
+        newline = False  # The last newline, that is only written when more follows.
+
+        def write(chunk: str):
+            nonlocal newline
+            if chunk:
+                if newline:
+                    output.write('\n')
+                newline = chunk.endswith('\n')
+                output.write(chunk[:-1] if newline else chunk)
+
+        while True:
+            data = await process.stdout.read(CHUNK_SIZE)
+            if not data:
+                break
+            size += len(data)
+            write(decoder.decode(data))
+            if on_progress:
+                on_progress(size)
+        write(decoder.decode(b'', final=True))
+        return size
+
+    async def read_error():
+        error = b''
+        while True:
+            data = await process.stderr.read(CHUNK_SIZE)
+            if not data:
+                return error.decode(encoding, 'replace')
+            error = (error + data)[-_MAX_ERROR_SIZE:]
+
+    try:
+        coroutines = [read(), read_error()]
+        if end is not None:
+            coroutines.append(write())
+        size, error, *_ = await asyncio.gather(*coroutines)
+        await process.wait()
+    finally:
+        # Cancelled: stop the command.
+        await kill_shell_process(process)
+
+    lines = error.strip().splitlines()
+    return FilterResult(size, process.returncode, lines[-1] if lines else '')
+
+
+def _write_text(output: TextIO, text: str, start: int, end: int) -> None:
+    " Write `text[start:end]`, in chunks. (Without copying it as a whole.) "
+    for position in range(start, end, CHUNK_SIZE):
+        output.write(text[position:min(position + CHUNK_SIZE, end)])
+
+
+def begin_replace(text: str, start: int) -> io.StringIO:
+    """
+    The start of the new text, for `replace_lines`: the text before the lines
+    that are filtered. `run_filter` writes the output after it.
+    """
+    output = io.StringIO()
+    _write_text(output, text, 0, start)
+    return output
+
+
+def begin_insert(text: str, position: int) -> io.StringIO:
+    """
+    The start of the new text, for `insert_lines`: the text before
+    `position`. `run_filter` writes the output after it.
+    """
+    output = io.StringIO()
+    if position > len(text):
+        _write_text(output, text, 0, len(text))
+        output.write('\n')
+    else:
+        _write_text(output, text, 0, position)
+    return output
+
+
+def replace_lines(text: str, start: int, end: int, result: FilterResult,
+                  output: io.StringIO) -> Tuple[str, int]:
+    """
+    Replace the lines between `start` and `end` (as returned by
+    `get_range_offsets`) by the output: complete the new text that was
+    started by `begin_replace`. Without output, the lines are deleted.
+    Return the new text and the cursor position. (`output` is closed.)
+    """
+    if not result.is_empty:
+        _write_text(output, text, end, len(text))
+        new_text = output.getvalue()
+        output.close()
+        return new_text, start
+
+    output.close()
+
+    # Delete the lines, with the newline after them. (Or before them, for the
+    # last lines.)
+    if end < len(text):
+        return text[:start] + text[end + 1:], start
+    start = max(0, start - 1)
+    return text[:start], text.rfind('\n', 0, start) + 1
+
+
+def insert_lines(text: str, position: int, result: FilterResult,
+                 output: io.StringIO) -> Tuple[str, int]:
+    """
+    Insert the output as new lines at `position`: the start of a line, or
+    ``len(text) + 1`` for below the last line. Complete the new text that was
+    started by `begin_insert`. Return the new text and the cursor position.
+    (`output` is closed.)
+    """
+    if result.is_empty:
+        output.close()
+        return text, min(position, len(text))
+
+    if position > len(text):
+        position = len(text) + 1
+    else:
+        output.write('\n')
+        _write_text(output, text, position, len(text))
+    new_text = output.getvalue()
+    output.close()
+    return new_text, position
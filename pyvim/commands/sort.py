@@ -0,0 +1,349 @@
+"""
+Implementation of ``:sort``.
+
+``:[range]sort[!] [n][u][i][r] [/pattern/]``, like Vim:
+
+- `n`: sort on the first decimal number in the line.
+- `i`: ignore case.
+- `u`: only keep the first of a sequence of equal lines. (Equal keys.)
+- `/pattern/`: sort on what comes after the match. (With `r`: on the match.)
+- `!`: reverse order.
+
+Lines without key (no match of the pattern, or no number with `n`) come
+first, in their original order. The sort is stable. Like in Vim, `!` reverses
+the whole result: the lines without key come last, and the lines with equal
+keys are in the reverse of their original order. (``:sort! n`` of ``b 9 a 10
+c`` gives ``10 9 c a b``.)
+
+The keys are extracted for a whole list of lines at once, with `map` over
+the methods of the compiled regexes and `str`. A range that is larger than
+`SORT_MEMORY` is sorted in chunks ("runs") that are written to temporary
+files, and merged afterwards. Only one run is held in memory as a list of
+lines.
+"""
+from typing import Any, Callable, IO, Iterable, Iterator, List, Optional, Pattern, Tuple
+import heapq
+import itertools
+import os
+import re
+import tempfile
+import threading
+from operator import itemgetter
+
+__all__ = (
+    'SortError',
+    'parse_sort_args',
+    'Sorter',
+    'BackgroundSort',
+)
+
+#: Ranges that are larger than this (in characters) are sorted in runs, that
+#: are stored in temporary files.
+SORT_MEMORY = 64 * 1024 * 1024
+
+#: Size of the runs. (In characters.)
+RUN_SIZE = 8 * 1024 * 1024
+
+_NUMBER_RE = re.compile(r'-?\d+')
+_FLAGS = 'nuir'
+
+
+class SortError(Exception):
+    " Invalid arguments for `:sort`. "
+
+
+def parse_sort_args(args: str) -> Tuple[str, Optional[str]]:
+    """
+    Parse the arguments of `:sort`. Return the flags and the pattern. (`None`
+    without pattern, '' for `//`: the last search pattern.)
+
+    The pattern can be anywhere between the flags, and any character that is
+    not a letter can be its delimiter.
+    """
+    flags = ''
+    pattern = None
+    i = 0
+
+    while i < len(args):
+        c = args[i]
+        if c in _FLAGS:
+            flags += c
+            i += 1
+        elif c.isspace():
+            i += 1
+        elif not c.isalpha() and c != '\\' and pattern is None:
+            end = i + 1
+            while end < len(args) and args[end] != c:
+                end += 2 if args[end] == '\\' else 1
+            if end >= len(args):
+                raise SortError('Missing delimiter after pattern: %s' % args[i:])
+            pattern = args[i + 1:end].replace('\\' + c, c)
+            i = end + 1
+        else:
+            raise SortError('Invalid argument: %s' % args[i:])
+
+    return flags, pattern
+
+
+class Sorter(object):
+    """
+    Sorts lists of lines.
+
+    :param pattern: Compiled pattern, or `None`.
+    :param flags: Combination of 'n', 'u', 'i' and 'r'.
+    """
+
+    def __init__(self, pattern: Optional[Pattern], flags: str = '', reverse: bool = False):
+        self.pattern = pattern
+        self.numeric = 'n' in flags
+        self.unique = 'u' in flags
+        self.ignore_case = 'i' in flags
+        self.use_match = 'r' in flags
+        self.reverse = reverse
+
+    def get_keys(self, lines: List[str]) -> List:
+        """
+        The sort key for every line. (`None` for lines without key.)
+        """
+        values: Iterable[str] = lines
+
+        if self.pattern is not None:
+            matches = map(self.pattern.search, lines)
+            if self.use_match:
+                values = [m.group() if m else '' for m in matches]
+            else:
+                values = [line[m.end():] if m else '' for line, m in zip(lines, matches)]
+
+        if self.ignore_case:
+            values = map(str.lower, values)
+
+        if self.numeric:
+            return [int(m.group()) if m else None for m in map(_NUMBER_RE.search, values)]
+
+        return values if isinstance(values, list) else list(values)
+
+    def sort(self, lines: List[str]) -> List[str]:
+        """
+        Return the sorted lines.
+        """
+        keys = self.get_keys(lines)
+        missing, order = self._sort_indexes(keys)
+        return [lines[i] for i in self._chain(missing, order)]
+
+    def _sort_indexes(self, keys: List) -> Tuple[List[int], List[int]]:
+        """
+        Return the indexes of the lines without key, and the sorted indexes of
+        the other lines. (Without duplicates for `u`.) Both are reversed for
+        `!`.
+        """
+        if self.numeric:
+            missing = [i for i, k in enumerate(keys) if k is None]
+            order = [i for i, k in enumerate(keys) if k is not None] if missing else list(range(len(keys)))
+        else:
+            missing = []
+            order = list(range(len(keys)))
+
+        order.sort(key=keys.__getitem__)
+        if self.reverse:
+            missing.reverse()
+            order.reverse()
+
+        if self.unique:
+            order = self._unique(order, keys)
+        return missing, order
+
+    def _chain(self, missing: List[int], order: List[int]) -> Iterator[int]:
+        """
+        The indexes of the result. (The lines without key come first, or last
+        for `!`.)
+        """
+        return itertools.chain(order, missing) if self.reverse else itertools.chain(missing, order)
+
+    @staticmethod
+    def _unique(order: List[int], keys: List) -> List[int]:
+        return [next(group) for _, group in itertools.groupby(order, key=keys.__getitem__)]
+
+    def merge(self, runs: List[Iterator[str]]) -> Iterator[str]:
+        """
+        Merge sorted runs of lines (without the lines without key).
+        """
+        if self.reverse:
+            # (`heapq.merge` takes equal lines from the first run first.)
+            runs = runs[::-1]
+
+        if self.pattern is None and not self.ignore_case and not self.numeric:
+            # The lines are their own keys.
+            merged = heapq.merge(*runs, reverse=self.reverse)
+            if self.unique:
+                merged = (line for line, _ in itertools.groupby(merged))
+            return merged
+
+        pairs = heapq.merge(*map(self._with_keys, runs), key=itemgetter(0), reverse=self.reverse)
+        if self.unique:
+            return (next(group)[1] for _, group in itertools.groupby(pairs, key=itemgetter(0)))
+        return map(itemgetter(1), pairs)
+
+    def _with_keys(self, lines: Iterator[str], batch_size: int = 4096) -> Iterator[Tuple[Any, str]]:
+        " Yield (key, line) tuples. (The keys are extracted in batches.) "
+        for batch in iter(lambda: list(itertools.islice(lines, batch_size)), []):
+            yield from zip(self.get_keys(batch), batch)
+
+
+class BackgroundSort(object):
+    """
+    `:sort` of a range, that runs in a thread on a snapshot of the text. The
+    range is sorted in memory when it's smaller than `SORT_MEMORY`, otherwise
+    in runs that are stored in a temporary directory.
+    """
+
+    def __init__(self, sorter: Sorter, text: str, start: int, end: int,
+                 memory: int = SORT_MEMORY, run_size: int = RUN_SIZE):
+        self.sorter = sorter
+        self.text = text
+        self.start = start
+        self.end = end
+        self.memory = memory
+        self.run_size = run_size
+
+        self.progress = 0.0  # Between 0 and 1.
+        self.line_count = 0  # Number of lines in the result.
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self, report_progress: Optional[Callable[[], None]] = None) -> Optional[str]:
+        """
+        Sort. (Can be called in a thread.) Return the sorted text of the
+        range, or `None` when it was cancelled.
+        """
+        if self.end - self.start <= self.memory:
+            return self._sort_in_memory(report_progress)
+
+        with tempfile.TemporaryDirectory(prefix='pyvim-sort-') as directory:
+            return self._external_sort(directory, report_progress)
+
+    def _sort_in_memory(self, report_progress) -> Optional[str]:
+        sorter = self.sorter
+        lines = self.text[self.start:self.end].split('\n')
+
+        keys = sorter.get_keys(lines)
+        if not self._report_progress(.3, report_progress):
+            return None
+
+        missing, order = sorter._sort_indexes(keys)
+        if not self._report_progress(.9, report_progress):
+            return None
+
+        self.line_count = len(missing) + len(order)
+        self.progress = 1.0
+        return '\n'.join([lines[i] for i in sorter._chain(missing, order)])
+
+    def _report_progress(self, progress: float, report_progress) -> bool:
+        " Update the progress. Return `False` when cancelled. "
+        self.progress = progress
+        if report_progress:
+            report_progress()
+        return not self._cancelled.is_set()
+
+    def _chunks(self) -> Iterator[Tuple[int, int]]:
+        " Yield (start, end) offsets of chunks of whole lines. "
+        offset = self.start
+        while offset < self.end:
+            chunk_end = self.end
+            if offset + self.run_size < self.end:
+                newline = self.text.find('\n', offset + self.run_size, self.end)
+                if newline != -1:
+                    chunk_end = newline
+            yield offset, chunk_end
+            offset = chunk_end + 1
+
+    def _external_sort(self, directory: str, report_progress) -> Optional[str]:
+        sorter = self.sorter
+        size = max(1, self.end - self.start)
+
+        def open_file(name, mode):
+            # (Only '\n' separates lines. Lone surrogates are kept.)
+            return open(os.path.join(directory, name), mode, encoding='utf-8',
+                        errors='surrogatepass', newline='\n')
+
+        # 1. Sort the runs. Lines without key are kept aside, for every run.
+        #    (Like the runs, in the order of the result.)
+        run_names = []
+        for start, end in self._chunks():
+            lines = self.text[start:end].split('\n')
+            keys = sorter.get_keys(lines)
+            missing, order = sorter._sort_indexes(keys)
+
+            run_names.append('run%i' % len(run_names))
+            with open_file(run_names[-1], 'w') as f:
+                _write_lines(f, (lines[i] for i in order))
+            with open_file('missing-' + run_names[-1], 'w') as f:
+                _write_lines(f, (lines[i] for i in missing))
+            del lines, keys, missing, order
+
+            if not self._report_progress((end - self.start) / size / 2, report_progress):
+                return None
+
+        # 2. Merge the runs into the output file. The lines without key come
+        #    first (or last, when reversed, from the last run to the first).
+        missing_names = ['missing-' + name for name in run_names]
+        if sorter.reverse:
+            missing_names.reverse()
+
+        files = [open_file(name, 'r') for name in run_names]
+        try:
+            with open_file('output', 'w') as output:
+                line_count = 0
+                written = 0
+
+                def write(lines: List[str]) -> bool:
+                    " Write lines to the output. Return `False` when cancelled. "
+                    nonlocal line_count, written
+                    if lines:
+                        if line_count:
+                            output.write('\n')
+                        output.write('\n'.join(lines))
+                        line_count += len(lines)
+                        written += sum(map(len, lines)) + len(lines)
+                    return self._report_progress(.5 + min(.5, written / size / 2), report_progress)
+
+                def write_missing() -> bool:
+                    for name in missing_names:
+                        with open_file(name, 'r') as f:
+                            if not write(list(_read_lines(f))):
+                                return False
+                    return True
+
+                if not sorter.reverse and not write_missing():
+                    return None
+
+                merged = sorter.merge([_read_lines(f) for f in files])
+                for lines in iter(lambda: list(itertools.islice(merged, 65536)), []):
+                    if not write(lines):
+                        return None
+
+                if sorter.reverse and not write_missing():
+                    return None
+        finally:
+            for f in files:
+                f.close()
+
+        self.line_count = line_count
+        self.progress = 1.0
+        with open_file('output', 'r') as f:
+            return f.read()
+
+
+def _write_lines(file: IO[str], lines: Iterable[str]) -> None:
+    " Write lines, every line followed by a newline. "
+    file.writelines(line + '\n' for line in lines)
+
+
+def _read_lines(file: IO[str]) -> Iterator[str]:
+    " Read lines that were written by `_write_lines`. "
+    return (line[:-1] for line in file)
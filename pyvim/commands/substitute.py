@@ -0,0 +1,582 @@
+"""
+Substitution engine for ``:s``.
+
+The pattern is compiled once (and cached), and the replacement is done in a
+single pass over the text of the whole range, instead of line by line. Large
+ranges are substituted in a thread. (See `BackgroundSubstitute`.)
+
+While ``:s`` is typed, the substitution is previewed on the visible lines.
+(See `SubstitutePreview`.)
+"""
+from typing import Callable, Dict, Iterator, List, Match, NamedTuple, Optional, Pattern, Tuple
+import functools
+import itertools
+import re
+import threading
+import time
+from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
+
+__all__ = (
+    'compile_pattern',
+    'get_range_offsets',
+    'find_matches',
+    'substitute_text',
+    'SubstituteResult',
+    'SubstituteConfirmation',
+    'BackgroundSubstitute',
+    'SubstitutePreview',
+    'BackgroundCount',
+    'BACKGROUND_SIZE',
+)
+
+#: Ranges larger than this (in characters) are substituted in a thread.
+BACKGROUND_SIZE = 2 * 1024 * 1024
+
+#: Size of the chunks that the background substitution processes between
+#: two progress reports. (And between two checks for cancellation.)
+CHUNK_SIZE = 256 * 1024
+
+#: Time (in seconds) that the preview of ``:s`` can take for every keystroke.
+PREVIEW_TIME_BUDGET = 0.02
+
+
+@functools.lru_cache(maxsize=32)
+def compile_pattern(search: str, ignore_case: bool = False) -> Pattern:
+    """
+    Compile the search pattern. (`^` and `$` match at every line.)
+    """
+    flags = re.MULTILINE
+    if ignore_case:
+        flags |= re.IGNORECASE
+    return re.compile(search, flags)
+
+
+def get_range_offsets(document: Document, start_row: int, end_row: int) -> Tuple[int, int]:
+    """
+    Return the start and end offset of the text between these rows.
+    (Inclusive, without the newline at the end of the last row.)
+    """
+    lines = document.lines
+
+    # (Avoid building the index of line starts for a range that starts at the
+    # first line or ends at the last line, like '%'.)
+    if start_row == 0:
+        start = 0
+    else:
+        start = document.translate_row_col_to_index(start_row, 0)
+
+    if end_row >= len(lines) - 2:
+        end = len(document.text) - sum(len(l) + 1 for l in lines[end_row + 1:])
+    else:
+        end = document.translate_row_col_to_index(end_row, 0) + len(lines[end_row])
+
+    return start, end
+
+
+def find_matches(pattern: Pattern, text: str, start: int, end: int,
+                 all_matches: bool) -> Tuple[List[Match], int]:
+    """
+    Return the matches between `start` and `end`, and the number of lines
+    that have a match. Unless `all_matches` is set, only the first match of
+    every line is returned. (Like ``:s`` without the `g` flag.)
+    """
+    result = []
+    line_count = 0
+
+    for m, first_in_line in _iter_matches(pattern, text, start, end, all_matches):
+        result.append(m)
+        line_count += first_in_line
+    return result, line_count
+
+
+def _iter_matches(pattern: Pattern, text: str, start: int, end: int,
+                  all_matches: bool) -> Iterator[Tuple[Match, bool]]:
+    """
+    Like `find_matches`, but yield the matches while they are found. (With
+    `True` for the first match of a line.)
+    """
+    line_end = -1  # End of the line of the last match.
+
+    for m in pattern.finditer(text, start, end):
+        if m.start() > line_end:
+            line_end = text.find('\n', m.start())
+            if line_end == -1:
+                line_end = len(text)
+            yield m, True
+        elif all_matches:
+            yield m, False
+
+
+class SubstituteResult(NamedTuple):
+    text: str
+    count: int  # Number of substitutions.
+    line_count: int  # Number of lines with a substitution.
+    last_position: Optional[int]  # Start of the last substitution in the new text.
+
+
+def substitute_text(pattern: Pattern, replace: str, text: str, start: int, end: int,
+                    all_matches: bool) -> SubstituteResult:
+    """
+    Substitute the matches of `pattern` between the `start` and `end` offsets
+    of `text` by `replace`. (A template like for `re.sub`.)
+    """
+    # (Substitute in a slice: `sub` and `split` don't take start and end
+    # positions.)
+    new_segment, count, line_count, last_position = _substitute_segment(
+        pattern, replace, text[start:end], all_matches)
+
+    if last_position is not None:
+        last_position += start
+
+    return SubstituteResult(
+        text=text[:start] + new_segment + text[end:],
+        count=count,
+        line_count=line_count,
+        last_position=last_position)
+
+
+def _substitute_segment(pattern, replace, segment, all_matches):
+    """
+    Substitute in this text. Return the new text, the number of substitutions,
+    the number of lines with a substitution and the start of the last one.
+    """
+    if '\\' in replace or pattern.groups:
+        return _substitute_expand(pattern, replace, segment, all_matches)
+    else:
+        return _substitute_literal(pattern, replace, segment, all_matches)
+
+
+@functools.lru_cache(maxsize=32)
+def _grouped(pattern: Pattern) -> Pattern:
+    """ The same pattern, as one group. (For `split`.) """
+    return re.compile('(%s)' % pattern.pattern, pattern.flags)
+
+
+def _substitute_literal(pattern, replace, segment, all_matches):
+    """
+    Substitution by a literal string, for patterns without groups.
+    `split` and `join` do most of the work.
+    """
+    # Matches are at the odd indexes, the text between them at the even ones.
+    parts = _grouped(pattern).split(segment)
+    if len(parts) == 1:
+        return segment, 0, 0, None
+
+    if all_matches:
+        between = parts[::2]
+        new_segment = replace.join(between)
+        count = len(between) - 1
+        line_count = 1 + sum(1 for i in range(2, len(parts) - 1, 2)
+                             if '\n' in parts[i] or '\n' in parts[i - 1])
+    else:
+        # Only the first match of every line: the one after a newline.
+        result = [parts[0]]
+        count = 0
+        first_in_line = True
+        for i in range(1, len(parts), 2):
+            if first_in_line:
+                result.append(replace)
+                count += 1
+            else:
+                result.append(parts[i])
+            result.append(parts[i + 1])
+            first_in_line = '\n' in parts[i + 1] or '\n' in parts[i]
+        new_segment = ''.join(result)
+        line_count = count
+
+    # The last substitution: the last match when all the matches are
+    # substituted, otherwise the first one of the last line with a match.
+    i = len(parts) - 2
+    if not all_matches:
+        while i > 1 and '\n' not in parts[i - 1] and '\n' not in parts[i - 2]:
+            i -= 2
+    last_position = len(new_segment) - sum(len(p) for p in parts[i + 1:]) - len(replace)
+
+    return new_segment, count, line_count, last_position
+
+
+def _substitute_expand(pattern, replace, segment, all_matches):
+    """
+    Substitution by a template (with group references), through a callback.
+    """
+    count = 0
+    line_count = 0
+    line_end = -1  # End of the line of the last substitution.
+    last_position = None
+    delta = 0  # Difference in length between the new and the old text.
+
+    def replace_match(m):
+        nonlocal count, line_count, line_end, last_position, delta
+
+        if m.start() > line_end:
+            line_end = segment.find('\n', m.start())
+            if line_end == -1:
+                line_end = len(segment)
+            line_count += 1
+        elif not all_matches:
+            return m.group(0)
+
+        new = m.expand(replace)
+        last_position = m.start() + delta
+        delta += len(new) - (m.end() - m.start())
+        count += 1
+        return new
+
+    new_segment = pattern.sub(replace_match, segment)
+    return new_segment, count, line_count, last_position
+
+
+class SubstituteConfirmation(object):
+    """
+    State of a ``:s`` with the `c` flag, that asks for a confirmation of every
+    substitution. The matches are found one at a time, in the text as it was
+    at the start. (So that a large range doesn't have to be searched up
+    front.) The buffer is changed after every accepted substitution. (The
+    matches are only valid as long as nothing else changes the buffer, see
+    `is_stale`.)
+    """
+
+    def __init__(self, buffer: Buffer, pattern: Pattern, replace: str,
+                 start: int, end: int, all_matches: bool):
+        self.buffer = buffer
+        self.replace = replace
+        self._matches = _iter_matches(pattern, buffer.text, start, end, all_matches)
+        self._match: Optional[Match] = None  # The current match.
+
+        self.count = 0  # Number of substitutions.
+        self.last_position: Optional[int] = None
+        self._delta = 0  # Difference in length between the new and the old text.
+        self._rows = set()  # Rows (in the original text) with a substitution.
+        self._row = 0  # Row of `_row_offset`.
+        self._row_offset = 0
+
+        # The text after the last substitution.
+        self._text = buffer.text
+
+        self.skip()
+
+    @property
+    def done(self) -> bool:
+        return self._match is None
+
+    @property
+    def line_count(self) -> int:
+        """ Number of lines with a substitution. """
+        return len(self._rows)
+
+    @property
+    def is_stale(self) -> bool:
+        """ True when the buffer was changed by something else. """
+        return self.buffer.text != self._text
+
+    @property
+    def prompt(self) -> str:
+        return 'replace with %s (y/n/a/q/l)?' % self.replace
+
+    def _substitute(self, m: Match) -> str:
+        """
+        Record the substitution of this match. Return the new text for it.
+        """
+        new = m.expand(self.replace)
+
+        self._row += m.string.count('\n', self._row_offset, m.start())
+        self._row_offset = m.start()
+        self._rows.add(self._row)
+
+        self.last_position = m.start() + self._delta
+        self._delta += len(new) - len(m.group(0))
+        self.count += 1
+        return new
+
+    def accept(self):
+        """ Substitute the current match, go to the next one. """
+        m = self._match
+        text = self.buffer.text
+        position = m.start() + self._delta
+        new = self._substitute(m)
+
+        self.buffer.document = Document(
+            text[:position] + new + text[position + len(m.group(0)):], position)
+        self._text = self.buffer.text
+        self.skip()
+
+    def skip(self):
+        """ Go to the next match. """
+        self._match = next(self._matches, (None, False))[0]
+        if self._match is not None:
+            self.buffer.cursor_position = self._match.start() + self._delta
+
+    def accept_all(self):
+        """ Substitute this and all the remaining matches. (In one pass.) """
+        text = self.buffer.text
+        delta = self._delta  # Offset of the original text in the current text.
+        parts = []
+        offset = 0
+
+        for m in itertools.chain([self._match], (m for m, _ in self._matches)):
+            position = m.start() + delta
+            parts.append(text[offset:position])
+            parts.append(self._substitute(m))
+            offset = position + len(m.group(0))
+
+        parts.append(text[offset:])
+        self._match = None
+        self.buffer.document = Document(''.join(parts), self.last_position or 0)
+        self._text = self.buffer.text
+
+    def quit(self):
+        self._match = None
+
+
+class BackgroundSubstitute(object):
+    """
+    A substitution of a large range, that runs in a thread on a snapshot of
+    the text. The range is processed in chunks of whole lines, which makes it
+    possible to report progress and to cancel in between.
+
+    (A match can't span two chunks, so a pattern that matches a newline could
+    miss a match at a chunk boundary.)
+    """
+
+    description = 'substitute'  # (For the status bar.)
+
+    def __init__(self, pattern: Pattern, replace: str, text: str,
+                 start: int, end: int, all_matches: bool):
+        self.pattern = pattern
+        self.replace = replace
+        self.text = text
+        self.start = start
+        self.end = end
+        self.all_matches = all_matches
+
+        self.progress = 0.0  # Between 0 and 1.
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def run(self, report_progress: Optional[Callable[[], None]] = None
+            ) -> Optional[SubstituteResult]:
+        """
+        Do the substitution. (Called in a thread.) Return `None` when it was
+        cancelled. `report_progress` is called after every chunk.
+        """
+        text = self.text
+        start = self.start
+        end = self.end
+
+        parts = []
+        new_length = 0  # Length of `parts`.
+        count = 0
+        line_count = 0
+        last_position = None
+        offset = start
+
+        while True:
+            if self._cancelled.is_set():
+                return None
+
+            # A chunk ends before a newline. (The newline is added in between,
+            # otherwise `$` would match at the end of the chunk and `^` at the
+            # start of the next one.)
+            chunk_end = _next_chunk_end(text, offset, end)
+
+            new_segment, n, lines, last = _substitute_segment(
+                self.pattern, self.replace, text[offset:chunk_end], self.all_matches)
+
+            if last is not None:
+                last_position = start + new_length + last
+            parts.append(new_segment)
+            new_length += len(new_segment)
+            count += n
+            line_count += lines
+
+            self.progress = (chunk_end - start) / max(1, end - start)
+            if report_progress:
+                report_progress()
+
+            if chunk_end >= end:
+                break
+
+            parts.append('\n')
+            new_length += 1
+            offset = chunk_end + 1
+
+        return SubstituteResult(
+            text=text[:start] + ''.join(parts) + text[end:],
+            count=count,
+            line_count=line_count,
+            last_position=last_position)
+
+
+def _next_chunk_end(text: str, offset: int, end: int) -> int:
+    """
+    End of the chunk that starts at `offset`: before a newline, at least
+    `CHUNK_SIZE` characters further.
+    """
+    if offset + CHUNK_SIZE < end:
+        newline = text.find('\n', offset + CHUNK_SIZE, end)
+        if newline != -1:
+            return newline
+    return end
+
+
+class SubstitutePreview(object):
+    """
+    Preview of a ``:s`` that is being typed. (Like Vim's 'inccommand'.)
+
+    The substitutions are computed from a snapshot of the buffer (its
+    `Document`), only for the rows that are visible, and only as long as the
+    time budget allows. Matches that span several lines are not previewed.
+    When `replace` is None, the matches are highlighted.
+
+    The number of matches in the whole range is counted in the background.
+    (See `BackgroundCount`.)
+    """
+
+    def __init__(self, buffer: Buffer, document: Document, pattern: Pattern,
+                 replace: Optional[str], start: int, end: int, all_matches: bool):
+        self.buffer = buffer
+        self.document = document
+        self.pattern = pattern
+        self.replace = replace
+        self.start = start
+        self.end = end
+        self.all_matches = all_matches
+
+        #: Mapping from row to (start column, end column, new text) tuples.
+        self.substitutions: Dict[int, List[Tuple[int, int, str]]] = {}
+
+        #: False when the time budget did not suffice for all visible rows.
+        self.complete = True
+
+        self.count_job = BackgroundCount(pattern, document.text, start, end, all_matches)
+
+        #: The message with the count, when it's shown.
+        self.message: Optional[str] = None
+
+    def compute(self, first_row: int, last_row: int,
+                time_budget: float = PREVIEW_TIME_BUDGET):
+        """
+        Compute the substitutions for these rows. (Inclusive.)
+        """
+        document = self.document
+        text = document.text
+        lines = document.lines
+        last_row = min(last_row, len(lines) - 1)
+        if first_row > last_row:
+            return
+
+        start = max(self.start, document.translate_row_col_to_index(first_row, 0))
+        end = min(self.end, document.translate_row_col_to_index(last_row, 0) + len(lines[last_row]))
+        deadline = time.monotonic() + time_budget
+
+        row = document.translate_index_to_position(start)[0]
+        row_offset = start  # Offset that is on `row`.
+        line_start = line_end = -1  # Of the line of the last match.
+
+        for i, m in enumerate(self.pattern.finditer(text, start, end)):
+            if i % 64 == 0 and time.monotonic() > deadline:
+                self.complete = False
+                break
+
+            if m.start() > line_end:
+                row += text.count('\n', row_offset, m.start())
+                row_offset = m.start()
+                line_start = text.rfind('\n', 0, m.start()) + 1
+                line_end = text.find('\n', m.start())
+                if line_end == -1:
+                    line_end = len(text)
+            elif not self.all_matches:
+                continue
+
+            if m.end() > line_end:
+                continue  # Spans several lines.
+
+            new = m.group(0) if self.replace is None else m.expand(self.replace)
+            self.substitutions.setdefault(row, []).append(
+                (m.start() - line_start, m.end() - line_start, new))
+
+    def cancel(self):
+        self.count_job.cancel()
+
+
+def _count_matches(pattern: Pattern, text: str, start: int, end: int,
+                   all_matches: bool) -> Tuple[int, int]:
+    """
+    Like `find_matches`, but only return the numbers of matches and lines.
+    """
+    count = 0
+    line_count = 0
+    line_end = -1
+
+    for m in pattern.finditer(text, start, end):
+        if m.start() > line_end:
+            line_end = text.find('\n', m.start())
+            if line_end == -1:
+                line_end = len(text)
+            line_count += 1
+        elif not all_matches:
+            continue
+        count += 1
+    return count, line_count
+
+
+class BackgroundCount(object):
+    """
+    Count the matches of a ``:s`` that is being typed, or of a ``:s`` with the
+    `n` flag over a large range, in a thread. (On a snapshot of the text.) The
+    range is processed in chunks of whole lines, which makes it possible to
+    report progress and to cancel in between.
+    """
+
+    description = 'count'  # (For the status bar.)
+
+    def __init__(self, pattern: Pattern, text: str, start: int, end: int,
+                 all_matches: bool):
+        self.pattern = pattern
+        self.text = text
+        self.start = start
+        self.end = end
+        self.all_matches = all_matches
+
+        self.progress = 0.0  # Between 0 and 1.
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self, report_progress: Optional[Callable[[], None]] = None
+            ) -> Optional[Tuple[int, int]]:
+        """
+        Return the number of matches and the number of lines with a match, or
+        `None` when it was cancelled. (Called in a thread.) `report_progress`
+        is called after every chunk.
+        """
+        text = self.text
+        start = self.start
+        end = self.end
+        offset = start
+        count = line_count = 0
+
+        while True:
+            if self._cancelled.is_set():
+                return None
+
+            chunk_end = _next_chunk_end(text, offset, end)
+            n, lines = _count_matches(self.pattern, text, offset, chunk_end, self.all_matches)
+            count += n
+            line_count += lines
+
+            self.progress = (chunk_end - start) / max(1, end - start)
+            if report_progress:
+                report_progress()
+
+            if chunk_end >= end:
+                return count, line_count
+            offset = chunk_end + 1
@@ -0,0 +1,65 @@
+"""
+Writing many buffers at once. (``:wa``, ``:wqa``, and the writes of
+``:bufdo`` and ``:argdo``.)
+
+The writes don't depend on each other, so they run concurrently in a thread
+pool. On a slow (network) file system, most of the time of a write is spent
+waiting. The buffers themselves are only touched on the UI thread: the texts
+are taken before, and the buffers are marked as written afterwards.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Sequence
+
+__all__ = (
+    'WriteFailure',
+    'write_buffers',
+    'format_write_summary',
+)
+
+#: Maximum number of concurrent writes.
+WRITE_WORKERS = 16
+
+#: Maximum number of failures in the summary message.
+_MAX_REPORTED_FAILURES = 5
+
+
+class WriteFailure(NamedTuple):
+    editor_buffer: object  # `EditorBuffer`.
+    error: str
+
+
+def write_buffers(editor_buffers: Sequence, max_workers: int = WRITE_WORKERS) -> List[WriteFailure]:
+    """
+    Write these buffers (which need to have a location), and wait until all
+    of them are written. Return the failures.
+    """
+    if not editor_buffers:
+        return []
+
+    texts = [eb.prepare_write() for eb in editor_buffers]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(editor_buffers))) as executor:
+        futures = list(map(executor.submit, [eb.write_text for eb in editor_buffers], texts))
+
+    failures = []
+    for eb, text, future in zip(editor_buffers, texts, futures):
+        error = future.exception()
+        if error is None:
+            eb.written(text)
+        else:
+            failures.append(WriteFailure(eb, '%s' % error))
+    return failures
+
+
+def format_write_summary(written_count: int, failures: Sequence[WriteFailure]) -> str:
+    """
+    One message for the result of writing many buffers.
+    """
+    if not failures:
+        return '%i file%s written' % (written_count, '' if written_count == 1 else 's')
+
+    errors = ['%s: %s' % (f.editor_buffer.get_display_name(short=True), f.error)
+              for f in failures[:_MAX_REPORTED_FAILURES]]
+    if len(failures) > _MAX_REPORTED_FAILURES:
+        errors.append('...')
+
+    return '%i written, %i failed: %s' % (written_count, len(failures), '; '.join(errors))
@@ -7,7 +7,8 @@ Usage::
     e = Editor(files_to_edit)
     e.run()  # Runs the event loop, starts interaction.
 """
-from typing import Optional, List, Dict
+from typing import Callable, Dict, Iterator, List, Optional
+import contextlib
 import logging
 import os
 import pathlib
@@ -45,6 +46,7 @@ class _Editor(object):
         self.expand_tab = True  # Insect spaces instead of tab characters.
         self.tabstop = 4  # Number of spaces that a tab character represents.
         self.incsearch = True  # Show matches while typing search string.
+        self.inccommand = True  # Preview ':s' while typing.
         self.ignore_case = False  # Ignore case while searching.
         self.enable_mouse_support = True
         self.display_unprintable_characters = True  # ':set list'
@@ -52,9 +54,32 @@ class _Editor(object):
         self.scroll_offset = 0  # ':set scrolloff'
         self.wrap_lines = True  # ':set wrap'
         self.break_indent = False  # ':set breakindent'
+        # ':set buffermem', memory budget for the buffers in KiB. When it's
+        # exceeded, hidden buffers are unloaded. (0 means no limit.)
+        self.buffer_memory = 0
+        # ':set makeprg' and ':set errorformat', for ':make'.
+        from .make import DEFAULT_MAKEPRG, DEFAULT_ERRORFORMAT
+        self.makeprg = DEFAULT_MAKEPRG
+        self.errorformat = DEFAULT_ERRORFORMAT
 
         self.message = None
 
+        # The `EditorServer`, when pyvim was started with '--server'.
+        self.server = None
+
+        # The argument list: the files given on the command line. (':argdo')
+        self.arguments: List[pathlib.Path] = []
+
+        # The quickfix list (results of ':grep'), and whether the quickfix
+        # window is open. (':copen')
+        from .quickfix import QuickfixList
+        self.quickfix = QuickfixList()
+        self.quickfix_visible = False
+
+        # Errors of the last ':make'. Mapping from location to a mapping from
+        # (zero based) line number to `ReporterError` instances.
+        self.diagnostics = {}
+
         # Load styles. (Mapping from name to Style class.)
         from .style import generate_built_in_styles, get_editor_style_by_name
         self.styles = generate_built_in_styles()
@@ -74,6 +99,10 @@ class _Editor(object):
         # Create key bindings registry.
         self.key_bindings = prompt_toolkit.key_binding.KeyBindings()
 
+        # While `batch_edit` runs: the functions that are postponed until the
+        # end of the batch. (A dict, for calling every function once, in order.)
+        self._batch_callbacks: Optional[Dict[Callable[[], None], None]] = None
+
     def layout(self):
         # Ensure config directory exists.
         config_directory = pathlib.Path(os.path.expanduser('~')) / '.pyvim'
@@ -113,6 +142,29 @@ class _Editor(object):
 
         self.last_substitute_text = ''
 
+        # `SubstituteConfirmation` while a ':s///c' is waiting for an answer.
+        self.substitute_confirmation = None
+
+        # `BackgroundSubstitute` while a substitution of a large range runs.
+        self.background_substitute = None
+
+        # `BackgroundSort` while a sort of a large range runs.
+        self.background_sort = None
+
+        # The asyncio task of a `:grep` that is running.
+        self.grep_task = None
+
+        # The asyncio task of a `:{range}!cmd` or `:r !cmd` that is running.
+        self.shell_filter_task = None
+
+        # The `MakeJob` of a `:make` that is running, and its asyncio task.
+        self.make_job = None
+        self.make_task = None
+
+        # The `FileIndex` of `:find`, and the asyncio task that updates it.
+        self.file_index = None
+        self.file_index_task = None
+
         from .key_bindings import create_key_bindings
         create_key_bindings()
 
@@ -121,17 +173,21 @@ class _Editor(object):
         Load a list of files.
         """
         assert in_tab_pages + hsplit + vsplit <= 1  # Max one of these options.
+        self.arguments = list(locations)
 
         # When no files were given, open at least one empty buffer.
         locations2 = locations or [None]
 
+        # Files are only read once they are displayed. (Opening thousands of
+        # files should not be slower than opening one.)
+
         # First file
         self.window_arrangement.open_buffer(
-            locations2[0])
+            locations2[0], lazy=True)
 
         for f in locations2[1:]:
             if in_tab_pages:
-                self.window_arrangement.create_tab(f)
+                self.window_arrangement.create_tab(f, lazy=True)
             elif hsplit:
                 self.window_arrangement.hsplit(
                     location=f)
@@ -140,7 +196,7 @@ class _Editor(object):
                     location=f)
             else:
                 self.window_arrangement.open_buffer(
-                    f)
+                    f, lazy=True)
 
         self.window_arrangement.active_tab_index = 0
 
@@ -152,12 +208,8 @@ class _Editor(object):
         """
         Return the `EditorBuffer` that is currently active.
         """
-        current_buffer = self.application.current_buffer
-
-        # Find/return the EditorBuffer with this name.
-        for b in self.window_arrangement.editor_buffers:
-            if b.buffer == current_buffer:
-                return b
+        return self.window_arrangement.get_editor_buffer_for_buffer(
+            self.application.current_buffer)
 
     @property
     def add_key_binding(self):
@@ -187,13 +239,137 @@ class _Editor(object):
         # prompt-toolkit matches our WindowArrangement.
         self.editor_layout.editor_root.window_arrangement.update()
 
+        # Free the memory of buffers that were hidden, if needed.
+        self.window_arrangement.unload_hidden_buffers(self.buffer_memory * 1024)
+
         # Make sure that the focus stack of prompt-toolkit has the current
-        # page.
+        # page. (Unless the quickfix window has the focus.)
+        if not self.quickfix_has_focus:
+            self.focus_active_window()
+
+    def focus_active_window(self):
+        """
+        Focus the active window of the current tab page.
+        """
         tab_window = self.window_arrangement.active_window
         if tab_window:
             window = self.editor_layout.editor_root.window_arrangement.get_window(
-                tab_window.editor_buffer)
-            self.application.layout.focus(window)
+                tab_window)
+            # (Focusing walks through the whole layout. Skip it if possible.)
+            if self.application.layout.current_window is not window:
+                self.application.layout.focus(window)
+
+    @property
+    def quickfix_has_focus(self) -> bool:
+        return (self.quickfix_visible and self.application.layout.current_window is
+                self.editor_layout.quickfix_window.window)
+
+    def show_quickfix_window(self, focus: bool = True):
+        """
+        Open the quickfix window. (':copen')
+        """
+        self.quickfix_visible = True
+        if focus:
+            self.application.layout.focus(self.editor_layout.quickfix_window.window)
+
+    def hide_quickfix_window(self):
+        """
+        Close the quickfix window. (':cclose')
+        """
+        self.quickfix_visible = False
+        self.focus_active_window()
+
+    def get_file_index(self):
+        """
+        Return the `FileIndex` of the current directory, for `:find`. It's
+        loaded and updated in the background, so it can be empty or stale
+        for a moment.
+        """
+        import time
+        from .file_index import FileIndex, UPDATE_INTERVAL, get_file_index_path
+
+        root = os.path.abspath(os.getcwd())
+        index = self.file_index
+
+        if index is None or index.root != root:
+            index = FileIndex(root, get_file_index_path(self.config_directory, root))
+            self.file_index = index
+        elif self.file_index_task is not None or (
+                index.updated is not None and time.monotonic() - index.updated < UPDATE_INTERVAL):
+            return index
+
+        if self.file_index_task:
+            self.file_index_task.cancel()
+        self.file_index_task = self.application.create_background_task(self._update_file_index(index))
+        return index
+
+    async def _update_file_index(self, index):
+        from asyncio import current_task, get_running_loop
+        task = current_task()
+
+        def update():
+            if not index.ready:
+                index.load()
+            if index.update(cancelled=lambda: self.file_index is not index):
+                index.save()
+
+        try:
+            await get_running_loop().run_in_executor(None, update)
+        except OSError as e:
+            self.show_message('Can\'t save the file index: %s' % e)
+        else:
+            # Complete the query of `:find` again, when it was completed
+            # while the index was empty.
+            from .commands.grammar import parse_command
+            buffer = self.command_buffer
+            end_variable = parse_command(buffer.document.text_before_cursor).end_variable
+            if (self.application.layout.has_focus(buffer) and end_variable and
+                    end_variable[0] == 'find_query'):
+                buffer.start_completion(select_first=False)
+        finally:
+            if self.file_index_task is task:
+                self.file_index_task = None
+            self.application.invalidate()
+
+    @property
+    def in_batch(self) -> bool:
+        return self._batch_callbacks is not None
+
+    def call_after_batch(self, callback: Callable[[], None]) -> bool:
+        """
+        While `batch_edit` runs, postpone `callback` until the end of the
+        batch and return `True`. (Then it's called once, whatever the number
+        of calls.) Otherwise, return `False`.
+        """
+        if self._batch_callbacks is None:
+            return False
+        self._batch_callbacks[callback] = None
+        return True
+
+    @contextlib.contextmanager
+    def batch_edit(self, buffer: prompt_toolkit.buffer.Buffer) -> Iterator[None]:
+        """
+        Execute many keys or edits (like ``:%normal`` or ``1000@q``) as a
+        batch. No reporter or command line preview runs before the batch
+        ends, and the screen is redrawn once, at the end.
+
+        The undo stack gets one snapshot of the buffer, before the batch. (The
+        key processor of the batch doesn't save the buffer before every key:
+        see `_BatchKeyBindings`.)
+        """
+        if self._batch_callbacks is not None:
+            yield  # Nested batch.
+            return
+
+        buffer.save_to_undo_stack()
+        self._batch_callbacks = {}
+        try:
+            yield
+        finally:
+            callbacks, self._batch_callbacks = self._batch_callbacks, None
+            for callback in callbacks:
+                callback()
+            self.application.invalidate()
 
     def show_help(self):
         """
@@ -249,6 +425,14 @@ class _Editor(object):
         if not variables:
             return
 
+        # Preview substitutions.
+        if command in ('s', 'substitute'):
+            from .commands.commands import preview_substitute
+            preview = preview_substitute(
+                self, variables.get('range'), variables.get('search'),
+                variables.get('replace'), variables.get('flags', ''))
+            self.state = self.state._replace(substitute_preview=preview)
+
         # Preview colorschemes.
         if command == 'colorscheme':
             colorscheme = variables.get('colorscheme')
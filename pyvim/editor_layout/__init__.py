@@ -25,12 +25,15 @@ class EditorLayout(object):
         from .simple_arg_toolbar import SimpleArgToolbar
         from .logger import LoggerWindow
         from .lsp_status import LspStatus
+        from .quickfix_window import QuickfixWindow
 
         self.editor_root = EditorRoot(config_directory)
+        self.quickfix_window = QuickfixWindow()
         editor_layout = prompt_toolkit.layout.FloatContainer(
             content=prompt_toolkit.layout.HSplit([
                 self.editor_root.tabbar,
                 self.editor_root,
+                self.quickfix_window,
                 self.editor_root.commandline,
                 ReportMessageToolbar(self.editor_root.commandline.has_focus),
                 prompt_toolkit.widgets.SystemToolbar(),
@@ -0,0 +1,138 @@
+"""
+The quickfix window. (``:copen``)
+
+Only the visible rows are rendered: `UIContent` asks for the lines that are
+on the screen, so the size of the quickfix list doesn't matter.
+"""
+import prompt_toolkit.filters
+import prompt_toolkit.layout
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.mouse_events import MouseEventType
+
+__all__ = (
+    'QuickfixWindow',
+)
+
+#: Height of the quickfix window.
+QUICKFIX_WINDOW_HEIGHT = 10
+
+
+class QuickfixControl(prompt_toolkit.layout.UIControl):
+    """
+    Control that displays the quickfix list of the editor.
+    """
+
+    def __init__(self, editor):
+        self.editor = editor
+        self._key_bindings = self._create_key_bindings()
+
+    def is_focusable(self):
+        return True
+
+    def create_content(self, width, height):
+        quickfix = self.editor.quickfix
+        current = quickfix.index
+
+        def get_line(i):
+            style = 'class:quickfix.current' if i == current else 'class:quickfix'
+            return [(style, quickfix.format_entry(i))]
+
+        return prompt_toolkit.layout.UIContent(
+            get_line=get_line,
+            line_count=len(quickfix),
+            cursor_position=Point(x=0, y=current),
+            show_cursor=False)
+
+    def mouse_handler(self, mouse_event):
+        quickfix = self.editor.quickfix
+        if mouse_event.event_type == MouseEventType.MOUSE_UP:
+            quickfix.go_to(mouse_event.position.y)
+        elif mouse_event.event_type == MouseEventType.SCROLL_DOWN:
+            quickfix.go_to(quickfix.index + 1)
+        elif mouse_event.event_type == MouseEventType.SCROLL_UP:
+            quickfix.go_to(quickfix.index - 1)
+        else:
+            return NotImplemented
+
+    def get_key_bindings(self):
+        return self._key_bindings
+
+    def _create_key_bindings(self):
+        kb = KeyBindings()
+        editor = self.editor
+
+        @kb.add('j')
+        @kb.add('down')
+        def _(event):
+            editor.quickfix.go_to(editor.quickfix.index + event.arg)
+
+        @kb.add('k')
+        @kb.add('up')
+        def _(event):
+            editor.quickfix.go_to(editor.quickfix.index - event.arg)
+
+        @kb.add('c-f')
+        @kb.add('pagedown')
+        def _(event):
+            editor.quickfix.go_to(editor.quickfix.index + QUICKFIX_WINDOW_HEIGHT)
+
+        @kb.add('c-b')
+        @kb.add('pageup')
+        def _(event):
+            editor.quickfix.go_to(editor.quickfix.index - QUICKFIX_WINDOW_HEIGHT)
+
+        @kb.add('g', 'g')
+        def _(event):
+            editor.quickfix.go_to(0)
+
+        @kb.add('G')
+        def _(event):
+            editor.quickfix.go_to(len(editor.quickfix) - 1)
+
+        @kb.add('enter')
+        def _(event):
+            " Open the current entry. "
+            from pyvim.commands.commands import jump_to_quickfix_entry
+            jump_to_quickfix_entry(editor)
+
+        @kb.add('q')
+        def _(event):
+            " Close the quickfix window. "
+            editor.hide_quickfix_window()
+
+        @kb.add('c-w', 'c-w')
+        @kb.add('c-w', 'k')
+        def _(event):
+            " Go back to the editor window. "
+            editor.focus_active_window()
+
+        return kb
+
+
+class QuickfixWindow(prompt_toolkit.layout.ConditionalContainer):
+    """
+    The quickfix window, below the windows of the tab page. (When it's open.)
+    """
+
+    def __init__(self):
+        from pyvim.editor import get_editor
+        editor = get_editor()
+
+        self.control = QuickfixControl(editor)
+        self.window = prompt_toolkit.layout.Window(
+            self.control,
+            height=QUICKFIX_WINDOW_HEIGHT,
+            style='class:quickfix')
+
+        super(QuickfixWindow, self).__init__(
+            prompt_toolkit.layout.HSplit([
+                self.window,
+                prompt_toolkit.layout.Window(
+                    prompt_toolkit.layout.FormattedTextControl(
+                        lambda: [('class:toolbar.status', ' [Quickfix List] %s (%i/%i)' % (
+                            editor.quickfix.title, editor.quickfix.index + 1,
+                            len(editor.quickfix)))]),
+                    height=1, style='class:toolbar.status'),
+            ]),
+            filter=prompt_toolkit.filters.Condition(lambda: editor.quickfix_visible))
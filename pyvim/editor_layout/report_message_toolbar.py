@@ -17,11 +17,10 @@ class ReportMessageToolbar(prompt_toolkit.layout.containers.ConditionalContainer
             eb = editor.editor_layout.editor_root.window_arrangement.active_editor_buffer
 
             lineno = eb.buffer.document.cursor_position_row
-            errors = eb.report_errors
+            errors = eb.get_errors_for_line(lineno)
 
-            for e in errors:
-                if e.lineno == lineno:
-                    return e.formatted_text
+            if errors:
+                return errors[0].formatted_text
 
             return []
 
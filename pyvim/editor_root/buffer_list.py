@@ -1,8 +1,18 @@
-import re
+"""
+The list of buffers, that is shown while ``:b`` is typed.
+
+The buffers are matched fuzzily by `BufferRegistry.match` (like the completion
+of ``:b``), against an index of the locations that is only created again when
+buffers are added, removed or renamed. Only the rows that fit on the screen
+are matched and rendered.
+"""
 import prompt_toolkit.layout.containers
 import prompt_toolkit.layout.controls
 import prompt_toolkit.filters
 from prompt_toolkit.application.current import get_app
+from prompt_toolkit.formatted_text.utils import fragment_list_width
+
+from ..fuzzy import match_positions
 
 
 def _bufferlist_overlay_visible():
@@ -22,6 +32,105 @@ def _bufferlist_overlay_visible():
     return overlay_is_visible
 
 
+def _highlight_location(location, search_string, default_token):
+    """
+    Return a tokenlist with the characters that match `search_string`
+    highlighted.
+    """
+    positions = set(match_positions(search_string, location))
+    result = []
+    start = 0
+
+    # One fragment for every run of (not) matching characters.
+    for i in range(1, len(location) + 1):
+        if i == len(location) or (i in positions) != (start in positions):
+            token = default_token + ' class:searchmatch' if start in positions else default_token
+            result.append((token, location[start:i]))
+            start = i
+    return result
+
+
+class BufferListControl(prompt_toolkit.layout.controls.UIControl):
+    """
+    Control that shows the buffers that match the input of ``:b``, best
+    matches first.
+    """
+    def __init__(self, editor):
+        self.editor = editor
+
+        # The rows, and the render counter and search string for which they
+        # were created. (The rows are used for the size of the overlay and
+        # for its content, during the same render.)
+        self._key = None
+        self._rows = []
+
+    def _get_rows(self):
+        from pyvim.commands.grammar import parse_command
+
+        search_string = parse_command(self.editor.command_buffer.text).get('buffer_name') or ''
+        app = get_app()
+        key = (app.render_counter, search_string)
+
+        if key != self._key:
+            self._key = key
+            self._rows = self._create_rows(search_string, max_count=app.output.get_size().rows)
+        return self._rows
+
+    def _create_rows(self, search_string, max_count):
+        wa = self.editor.window_arrangement
+        editor_buffers = wa.editor_buffers.match(search_string, limit=max_count)
+
+        if not editor_buffers:
+            return [[('', ' No match found. ')]]
+
+        active_eb = wa.active_editor_buffer
+        visible_ebs = wa.active_tab.visible_editor_buffers()
+        names = [eb.get_display_name() for eb in editor_buffers]
+        max_location_len = max(len(name) for name in names)
+
+        rows = [[('', '  '), ('class:title', 'Open buffers')]]
+
+        for eb, name in zip(editor_buffers, names):
+            char = '%' if eb is active_eb else ' '
+            char2 = 'a' if eb in visible_ebs else ' '
+            char3 = ' + ' if eb.has_unsaved_changes else '   '
+            t = 'class:active' if eb is active_eb else ''
+
+            if eb.is_loaded:
+                line = '%i' % (eb.buffer.document.cursor_position_row + 1)
+            else:
+                line = '-'  # (Not read yet.)
+
+            row = [
+                ('', ' '),
+                (t, '%3i ' % eb.number),
+                (t, '%s' % char),
+                (t, '%s ' % char2),
+                (t, '%s ' % char3),
+            ]
+            row.extend(_highlight_location(name, search_string, t))
+            row.extend([
+                (t, ' ' * (max_location_len - len(name))),
+                (t + ' class:lineno', '  line %s' % line),
+                (t, ' '),
+            ])
+            rows.append(row)
+        return rows
+
+    def preferred_width(self, max_available_width):
+        return max(fragment_list_width(row) for row in self._get_rows())
+
+    def preferred_height(self, width, max_available_height, wrap_lines, get_line_prefix):
+        return len(self._get_rows())
+
+    def create_content(self, width, height):
+        rows = self._get_rows()
+        return prompt_toolkit.layout.controls.UIContent(
+            get_line=lambda i: rows[i],
+            line_count=len(rows),
+            show_cursor=False)
+
+
 class BufferListOverlay(prompt_toolkit.layout.containers.ConditionalContainer):
     """
     Floating window that shows the list of buffers when we are typing ':b'
@@ -29,99 +138,9 @@ class BufferListOverlay(prompt_toolkit.layout.containers.ConditionalContainer):
     """
 
     def __init__(self):
-        def highlight_location(location, search_string, default_token):
-            """
-            Return a tokenlist with the `search_string` highlighted.
-            """
-            result = [(default_token, c) for c in location]
-
-            # Replace token of matching positions.
-            for m in re.finditer(re.escape(search_string), location):
-                for i in range(m.start(), m.end()):
-                    result[i] = ('class:searchmatch', result[i][1])
-
-            if location == search_string:
-                result[0] = (result[0][0] +
-                             ' [SetCursorPosition]', result[0][1])
-
-            return result
-
-        def get_tokens():
-            from pyvim.editor import get_editor
-            editor = get_editor()
-            wa = editor.window_arrangement
-            buffer_infos = wa.list_open_buffers()
-
-            # Filter infos according to typed text.
-            input_params = editor.command_buffer.text.lstrip().split(None, 1)
-            search_string = input_params[1] if len(input_params) > 1 else ''
-
-            if search_string:
-                def matches(info):
-                    """
-                    True when we should show this entry.
-                    """
-                    # When the input appears in the location.
-                    if input_params[1] in (str(info.editor_buffer.location) or ''):
-                        return True
-
-                    # When the input matches this buffer his index number.
-                    if input_params[1] in str(info.index):
-                        return True
-
-                    # When this entry is part of the current completions list.
-                    b = editor.command_buffer
-
-                    if b.complete_state and any(info.editor_buffer.location in c.display
-                                                for c in b.complete_state.completions
-                                                if info.editor_buffer.location is not None):
-                        return True
-
-                    return False
-
-                buffer_infos = [info for info in buffer_infos if matches(info)]
-
-            # Render output.
-            if len(buffer_infos) == 0:
-                return [('', ' No match found. ')]
-            else:
-                result = []
-
-                # Create title.
-                result.append(('', '  '))
-                result.append(('class:title', 'Open buffers\n'))
-
-                # Get length of longest location
-                max_location_len = max(
-                    len(info.editor_buffer.get_display_name()) for info in buffer_infos)
-
-                # Show info for each buffer.
-                for info in buffer_infos:
-                    eb = info.editor_buffer
-                    char = '%' if info.is_active else ' '
-                    char2 = 'a' if info.is_visible else ' '
-                    char3 = ' + ' if info.editor_buffer.has_unsaved_changes else '   '
-                    t = 'class:active' if info.is_active else ''
-
-                    result.extend([
-                        ('', ' '),
-                        (t, '%3i ' % info.index),
-                        (t, '%s' % char),
-                        (t, '%s ' % char2),
-                        (t, '%s ' % char3),
-                    ])
-                    result.extend(highlight_location(
-                        eb.get_display_name(), search_string, t))
-                    result.extend([
-                        (t, ' ' * (max_location_len - len(eb.get_display_name()))),
-                        (t + ' class:lineno', '  line %i' %
-                         (eb.buffer.document.cursor_position_row + 1)),
-                        (t, ' \n')
-                    ])
-                return result
+        from pyvim.editor import get_editor
 
         super(BufferListOverlay, self).__init__(
-            prompt_toolkit.layout.containers.Window(prompt_toolkit.layout.controls.FormattedTextControl(get_tokens),
-                                                    style='class:bufferlist',
-                                                    scroll_offsets=prompt_toolkit.layout.containers.ScrollOffsets(top=1, bottom=1)),
+            prompt_toolkit.layout.containers.Window(BufferListControl(get_editor()),
+                                                    style='class:bufferlist'),
             filter=_bufferlist_overlay_visible())
@@ -4,7 +4,7 @@ from prompt_toolkit.layout.utils import explode_text_fragments
 
 class ReportingProcessor(prompt_toolkit.layout.processors.Processor):
     """
-    Highlight all pyflakes errors on the input.
+    Highlight all pyflakes errors on the input, and the errors of `:make`.
     """
 
     def __init__(self, editor_buffer):
@@ -13,13 +13,9 @@ class ReportingProcessor(prompt_toolkit.layout.processors.Processor):
     def apply_transformation(self, transformation_input):
         fragments = transformation_input.fragments
 
-        if self.editor_buffer.report_errors:
-            for error in self.editor_buffer.report_errors:
-                if error.lineno == transformation_input.lineno:
-                    fragments = explode_text_fragments(fragments)
-                    for i in range(error.start_column, error.end_column):
-                        if i < len(fragments):
-                            fragments[i] = (
-                                'class:flakeserror', fragments[i][1])
+        for error in self.editor_buffer.get_errors_for_line(transformation_input.lineno):
+            fragments = explode_text_fragments(fragments)
+            for i in range(error.start_column, min(error.end_column, len(fragments))):
+                fragments[i] = ('class:flakeserror', fragments[i][1])
 
         return prompt_toolkit.layout.processors.Transformation(fragments)
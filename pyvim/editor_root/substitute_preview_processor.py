@@ -0,0 +1,59 @@
+import prompt_toolkit.layout.processors
+from prompt_toolkit.layout.utils import explode_text_fragments
+
+
+class SubstitutePreviewProcessor(prompt_toolkit.layout.processors.Processor):
+    """
+    Show the preview of ``:s`` while it's typed. (See `SubstitutePreview`.)
+    """
+
+    def __init__(self, editor_buffer):
+        self.editor_buffer = editor_buffer
+
+    def apply_transformation(self, transformation_input):
+        from pyvim.editor import get_editor
+        preview = get_editor().state.substitute_preview
+        fragments = transformation_input.fragments
+
+        if (preview is None or preview.buffer is not self.editor_buffer.buffer or
+                transformation_input.document.text is not preview.document.text):
+            return prompt_toolkit.layout.processors.Transformation(fragments)
+
+        substitutions = preview.substitutions.get(transformation_input.lineno)
+        if not substitutions:
+            return prompt_toolkit.layout.processors.Transformation(fragments)
+
+        fragments = explode_text_fragments(fragments)
+        result = []
+        position = 0
+
+        for start, end, new in substitutions:
+            result.extend(fragments[position:start])
+            result.append(('class:substitute-preview', new.replace('\n', '^J')))
+            position = end
+        result.extend(fragments[position:])
+
+        def source_to_display(i):
+            delta = 0
+            for start, end, new in substitutions:
+                if i >= end:
+                    delta += len(new) - (end - start)
+                elif i > start:
+                    return start + delta  # Inside a substitution.
+                else:
+                    break
+            return i + delta
+
+        def display_to_source(i):
+            delta = 0
+            for start, end, new in substitutions:
+                if i >= start + delta + len(new):
+                    delta += len(new) - (end - start)
+                elif i >= start + delta:
+                    return start
+                else:
+                    break
+            return i - delta
+
+        return prompt_toolkit.layout.processors.Transformation(
+            result, source_to_display=source_to_display, display_to_source=display_to_source)
@@ -58,8 +58,8 @@ class WelcomeMessageWindow(prompt_toolkit.layout.containers.ConditionalContainer
 
             # Only show when there is only one empty buffer, but once the
             # welcome message has been hidden, don't show it again.
-            result = (len(buffers) == 1 and buffers[0].buffer.text == '' and
-                      buffers[0].location is None and not once_hidden[0])
+            result = (len(buffers) == 1 and buffers.first.buffer.text == '' and
+                      buffers.first.location is None and not once_hidden[0])
             if not result:
                 once_hidden[0] = True
             return result
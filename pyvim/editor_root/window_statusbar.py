@@ -50,9 +50,27 @@ class WindowStatusBar(prompt_toolkit.widgets.FormattedTextToolbar):
                 else:
                     return ''
 
+            def make():
+                job = editor.make_job
+                if job:
+                    return '[make: %i lines, %i errors, %i warnings] ' % (
+                        job.line_count, job.error_count, job.warning_count)
+                else:
+                    return ''
+
+            def substitute():
+                # Progress of a `:s` (or `:s///n`) of a large range.
+                job = editor.background_substitute
+                if job:
+                    return '[%s: %i%%] ' % (job.description, job.progress * 100)
+                else:
+                    return ''
+
             return ''.join([
                 ' ',
                 recording(),
+                make(),
+                substitute(),
                 (str(editor_buffer.location) or ''),
                 (' [New File]' if editor_buffer.is_new else ''),
                 ('*' if editor_buffer.has_unsaved_changes else ''),
@@ -1,4 +1,4 @@
-from typing import NamedTuple, List
+from typing import NamedTuple, List, Optional
 import prompt_toolkit.styles
 
 
@@ -15,3 +15,5 @@ class EditorState(NamedTuple):
     cursorline: bool = False
     # ':set colorcolumn'. List of integers.
     colorcolumn: List[int] = []
+    # Preview of ':s' while it's typed. (`SubstitutePreview` instance.)
+    substitute_preview: Optional[object] = None
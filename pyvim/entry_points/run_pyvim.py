@@ -2,39 +2,102 @@
 """
 pyvim: Pure Python Vim clone.
 Usage:
-    pyvim [-p] [-o] [-O] [-u <pyvimrc>] [<location>...]
+    pyvim [-p] [-o] [-O] [-u <pyvimrc>] [--startuptime <file>] [--server] [--servername <name>] [<location>...]
+    pyvim [-p] [--servername <name>] (--remote | --remote-wait) <location>...
+    pyvim [-u <pyvimrc>] [--startuptime <file>] [--server] [--servername <name>] -S [<session>]
 
 Options:
-    -p           : Open files in tab pages.
-    -o           : Split horizontally.
-    -O           : Split vertically.
-    -u <pyvimrc> : Use this .pyvimrc file instead.
+    -p                   : Open files in tab pages.
+    -o                   : Split horizontally.
+    -O                   : Split vertically.
+    -u <pyvimrc>         : Use this .pyvimrc file instead.
+    -S                   : Restore a session. (~/.pyvim/session.json by default.)
+    --startuptime <file> : Write start-up timing messages to <file>.
+    --server             : Accept files from `pyvim --remote`.
+    --remote             : Open the files in a running pyvim server.
+    --remote-wait        : Like --remote, but wait for the files to be closed.
+    --servername <name>  : Name of the server. [default: pyvim]
 """
 import pathlib
-import docopt
 import os
 import logging
-from pyvim.rc_file import run_rc_file
+import sys
 
 __all__ = (
     'run',
 )
 
 
+class _NoTimer(object):
+    """
+    Stands in for the `StartupTimer` without ``--startuptime``. (So that
+    its module, and `importlib.abc`, are not imported on every start.)
+    """
+    def mark(self, phase):
+        pass
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def write(self, filename):
+        pass
+
+
+def _wants_startuptime(args) -> bool:
+    """
+    True when ``--startuptime`` is given. (Or an abbreviation of it, like
+    ``--startup``, which docopt accepts as well.)
+    """
+    for arg in args:
+        option = arg.split('=', 1)[0]
+        if len(option) > 3 and '--startuptime'.startswith(option):
+            return True
+    return False
+
+
 def run():
-    logging.basicConfig(level=logging.DEBUG)
+    # Heavy modules are imported in-line, so that `--startuptime` can report
+    # on them. (The option is looked for before docopt parses it, so that
+    # the import of docopt is reported as well.)
+    if _wants_startuptime(sys.argv[1:]):
+        from pyvim.startuptime import StartupTimer
+        timer = StartupTimer()
+        timer.install()
+    else:
+        timer = _NoTimer()
+
+    import docopt
     a = docopt.docopt(__doc__)  # type: ignore
     locations = [pathlib.Path(x).absolute() for x in a['<location>']]
     in_tab_pages = a['-p']
     hsplit = a['-o']
     vsplit = a['-O']
     pyvimrc = a['-u']
+    startuptime = a['--startuptime']
+    servername = a['--servername']
+
+    # Send the files to a running server, if asked for. This happens before
+    # anything else is imported.
+    if a['--remote'] or a['--remote-wait']:
+        from pyvim.server import send_to_server
+        if send_to_server(servername, locations, in_tab_pages=in_tab_pages,
+                          wait=a['--remote-wait']):
+            return
+        # No server found. Edit the files in this process.
+
+    logging.basicConfig(level=logging.DEBUG)
+    timer.mark('parsing arguments')
 
     # Create new editor instance.
     from pyvim.editor import get_editor
     editor = get_editor()
+    timer.mark('creating editor')
 
     # Apply rc file.
+    from pyvim.rc_file import run_rc_file
     if pyvimrc:
         run_rc_file(pyvimrc)
     else:
@@ -42,12 +105,47 @@ def run():
 
         if os.path.exists(default_pyvimrc):
             run_rc_file(default_pyvimrc)
+    timer.mark('running rc file')
 
     # Load files and run.
     editor.layout()
-    editor.load_initial_files(locations, in_tab_pages=in_tab_pages,
-                              hsplit=hsplit, vsplit=vsplit)
-    editor.run()
+    timer.mark('creating layout')
+
+    if a['-S']:
+        from pyvim.session import get_default_session_path, load_session
+        session = a['<session>'] or get_default_session_path()
+        try:
+            load_session(editor, session)
+        except (OSError, ValueError) as e:
+            editor.show_message('{}'.format(e))
+            if not editor.window_arrangement.tab_pages:
+                editor.load_initial_files([])
+        timer.mark('loading session')
+    else:
+        editor.load_initial_files(locations, in_tab_pages=in_tab_pages,
+                                  hsplit=hsplit, vsplit=vsplit)
+        timer.mark('loading files')
+
+    if startuptime:
+        def first_frame(app):
+            app.after_render -= first_frame
+            timer.mark('first frame')
+            timer.uninstall()
+            timer.write(startuptime)
+        editor.application.after_render += first_frame
+
+    server = None
+    if a['--server']:
+        from pyvim.server import EditorServer
+        server = editor.server = EditorServer(servername)
+        editor.application.pre_run_callables.append(
+            lambda: server.start(editor.application.loop))
+
+    try:
+        editor.run()
+    finally:
+        if server:
+            server.close()
 
 
 if __name__ == '__main__':
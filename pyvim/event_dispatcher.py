@@ -9,6 +9,7 @@ logger = logging.getLogger(__name__)
 
 class EventType(Enum):
     NewEditorBuffer = auto()
+    CloseEditorBuffer = auto()
 
 
 class EventValue(NamedTuple):
@@ -32,12 +33,15 @@ class EventDispatcher:
         self._handlers[event_type] = handler
 
     def _handle(self, event_type: EventType, palyload: Any) -> bool:
+        handler = self._handlers.get(event_type)
+        if handler is None:
+            return False
         try:
-            self._handlers[event_type](palyload)
-            return True
+            handler(palyload)
         except Exception as e:
+            # Don't let one failing handler stop the worker.
             logger.exception(e)
-            raise
+        return True
 
     async def _worker(self):
         logger.info('start worker')
@@ -0,0 +1,250 @@
+"""
+Index of the files of a project, for ``:find``.
+
+The index is built by walking the directory tree with a pool of threads,
+skipping what ``.gitignore`` files exclude. (Like the in-process ``:grep``.)
+It's saved in ``~/.pyvim/file_index/``, with the modification time of every
+directory. When it's updated, only the directories whose modification time
+changed are listed again. (Adding, removing or renaming a file changes the
+modification time of its directory.) The other directories are only `stat`ed.
+Editing a ``.gitignore`` file doesn't change any modification time, so every
+directory also keeps a digest of the ignore rules it was listed with.
+
+The paths are matched by a `FuzzyIndex`::
+
+    index = FileIndex('/home/user/project', cache_path)
+    index.load()  # The saved index, which can be stale.
+    if index.update():
+        index.save()
+    index.find('wdgcfg', limit=20)  # ['src/widgets/config.py', ...]
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import time
+
+from .fuzzy import FuzzyIndex
+from .grep import IGNORED_DIRECTORIES, IgnoreRules
+
+__all__ = (
+    'FileIndex',
+    'get_file_index_path',
+)
+
+FILE_INDEX_VERSION = 2
+
+#: Maximum number of directories that a worker visits in one task.
+_BATCH_SIZE = 256
+
+#: Minimum time between two updates of the index, while editing. (In seconds.)
+UPDATE_INTERVAL = 30
+
+
+def get_file_index_path(config_directory: pathlib.Path, root: str) -> pathlib.Path:
+    """
+    Location of the saved index of this project.
+    """
+    name = hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    return config_directory / 'file_index' / ('%s.json' % name)
+
+
+class _Directory(NamedTuple):
+    mtime: int
+    rules: str  # Digest of the ignore rules.
+    files: List[str]  # Sorted names.
+    directories: List[str]  # Names of the subdirectories that are indexed.
+
+
+@functools.lru_cache(maxsize=256)
+def _digest_rules(rules: Tuple[Tuple[str, str, bool, bool], ...]) -> str:
+    # (Not `hash`, which changes from one process to the other.)
+    return hashlib.sha1(repr(rules).encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+
+
+def _list_directory(path: str, mtime: int, rules: IgnoreRules) -> _Directory:
+    files = []
+    directories = []
+
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if is_dir and entry.name in IGNORED_DIRECTORIES:
+                continue
+            if rules.rules and rules.is_ignored(entry.path, is_dir):
+                continue
+
+            (directories if is_dir else files).append(entry.name)
+
+    files.sort()
+    return _Directory(mtime, _digest_rules(rules.rules), files, directories)
+
+
+def _update_directory(path: str, rules: IgnoreRules,
+                      cached: Optional[_Directory]) -> Optional[Tuple[_Directory, IgnoreRules, bool]]:
+    """
+    Return the directory (from the cache when neither it nor its ignore rules
+    changed), the ignore rules for its subdirectories, and whether it was
+    listed. None when it can't be read.
+    """
+    rules = rules.for_directory(path)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if (cached is not None and cached.mtime == mtime and
+                cached.rules == _digest_rules(rules.rules)):
+            return cached, rules, False
+        return _list_directory(path, mtime, rules), rules, True
+    except OSError:
+        return None
+
+
+class FileIndex(object):
+    """
+    The files under `root`. The paths are relative to the root.
+
+    The methods that read or walk the file system are called in a thread.
+    `find` can be called from other threads meanwhile.
+    """
+    def __init__(self, root: str, cache_path: Optional[pathlib.Path] = None):
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path
+
+        # By path, relative to the root. ('' for the root.)
+        self._directories: Dict[str, _Directory] = {}
+        self._index: Optional[FuzzyIndex] = None
+
+        #: Number of directories that the last update listed.
+        self.listed_count = 0
+
+        #: `time.monotonic()` at the end of the last update.
+        self.updated = None
+
+    @property
+    def ready(self) -> bool:
+        " True when the index was loaded or built. "
+        return self._index is not None
+
+    def __len__(self):
+        return len(self._index) if self._index is not None else 0
+
+    def find(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Return the paths that match the query, best matches first.
+        """
+        index = self._index
+        if index is None:
+            return []
+        return index.filter(query, limit)
+
+    def load(self) -> bool:
+        """
+        Read the saved index. Return False when there is none (for this root).
+        """
+        if self.cache_path is None:
+            return False
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get('version') != FILE_INDEX_VERSION or data.get('root') != self.root:
+            return False
+
+        self._set_directories({
+            relative: _Directory(*directory) for relative, directory in data['directories'].items()})
+        return True
+
+    def save(self) -> None:
+        """
+        Write the index. (Replaces the saved index at once, so that an
+        interrupted write doesn't leave a broken one.)
+        """
+        if self.cache_path is None:
+            return
+
+        data = {
+            'version': FILE_INDEX_VERSION,
+            'root': self.root,
+            'directories': {relative: list(directory) for relative, directory in self._directories.items()},
+        }
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.cache_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8', errors='surrogateescape') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_path, self.cache_path)
+
+    def update(self, max_workers: int = 8, cancelled: Callable[[], bool] = lambda: False) -> bool:
+        """
+        Walk the directory tree, and list the directories that changed. Return
+        False when it was cancelled, or when nothing changed.
+        """
+        old = self._directories
+        directories: Dict[str, _Directory] = {}
+        listed_count = 0
+
+        def update_batch(batch):
+            return [(relative, _update_directory(os.path.join(self.root, relative), rules,
+                                                 old.get(relative)))
+                    for relative, rules in batch]
+
+        # (relative path, ignore rules of the parent) of the directories to
+        # visit. They are visited in batches: a task per directory would cost
+        # more than the `stat` of an unchanged directory.
+        queue = [('', IgnoreRules())]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = set()
+
+            while queue or pending:
+                if cancelled():
+                    for future in pending:
+                        future.cancel()
+                    return False
+
+                size = max(1, min(_BATCH_SIZE, len(queue) // max_workers))
+                for i in range(0, len(queue), size):
+                    pending.add(pool.submit(update_batch, queue[i:i + size]))
+                queue = []
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for relative, result in future.result():
+                        if result is None:
+                            continue
+
+                        directory, rules, listed = result
+                        directories[relative] = directory
+                        listed_count += listed
+                        queue.extend((os.path.join(relative, name), rules) for name in directory.directories)
+
+        self.listed_count = listed_count
+        self.updated = time.monotonic()
+
+        if self._index is not None and listed_count == 0 and directories.keys() == old.keys():
+            return False
+
+        self._set_directories(directories)
+        return True
+
+    def _set_directories(self, directories: Dict[str, _Directory]) -> None:
+        paths = []
+        for relative in sorted(directories):
+            files = directories[relative].files
+            if relative:
+                prefix = relative + os.sep
+                paths.extend([prefix + name for name in files])
+            else:
+                paths.extend(files)
+
+        self._directories = directories
+        self._index = FuzzyIndex(paths)
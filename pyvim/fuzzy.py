@@ -0,0 +1,201 @@
+"""
+Fuzzy matching of names. (For the completion of paths, the file index of
+``:find`` and the buffer switcher.)
+
+A query matches a name when its characters appear in the name, in the same
+order. (Ignoring case.) The matches are ranked: first the names that start
+with the query, then the names that contain it, then the other matches, with
+the closest ones first. Within a rank, the original order is kept.
+
+A `FuzzyIndex` is made to match a million names (the files of a large
+project) while a query is typed:
+
+- The names are joined into texts, which are searched in C, by `str.find`
+  and by one regular expression. Only the matches are handled in Python.
+- The ranks are filled in order, and the search stops when the limit is
+  reached. Most short queries are a prefix or a substring of enough names,
+  so the other matches don't have to be searched for.
+- The names are split in segments, that are searched one after the other.
+  (So that a search in a thread doesn't block the other threads for long.)
+- When all the matches of a query are known, they are kept in a smaller
+  index, that is searched for a query that extends this one. (Typing one
+  more character only removes matches.)
+"""
+from bisect import bisect_right
+from itertools import accumulate
+from operator import itemgetter
+from typing import List, Optional, Pattern, Sequence, Tuple
+import functools
+import re
+
+__all__ = (
+    'compile_query',
+    'FuzzyIndex',
+    'fuzzy_filter',
+    'match_positions',
+)
+
+#: Number of names in a segment of a `FuzzyIndex`.
+SEGMENT_SIZE = 16384
+
+#: Maximum number of matches that are kept for the next query.
+MAX_NARROWED_MATCHES = 100000
+
+
+@functools.lru_cache(maxsize=32)
+def compile_query(query: str) -> Pattern:
+    """
+    Regular expression that matches the characters of the (lower case) query
+    in the same order, within a line, followed by the rest of the line. (Like
+    'a[^b\\n]*b[^c\\n]*c', which doesn't backtrack.)
+    """
+    parts = [re.escape(query[0])]
+    for c in query[1:]:
+        parts.append('[^%s\\n]*%s' % (re.escape(c), re.escape(c)))
+    return re.compile('(%s)[^\\n]*' % ''.join(parts))
+
+
+class _Segment(object):
+    """
+    Names that are searched together: the lower case names, joined by
+    newlines. The methods add the (global) indexes of the matching names to
+    a list.
+    """
+    def __init__(self, names: Sequence[str], offset: int):
+        self.offset = offset
+
+        lower_names = [n.lower().replace('\n', ' ') for n in names]
+        self.text = '\n'.join(lower_names)
+        self.starts = [0]
+        self.starts.extend(accumulate(len(n) + 1 for n in lower_names[:-1]))
+
+    def add_starting(self, query: str, result: List[int], limit: int) -> None:
+        " Add the names that start with the query. "
+        text = self.text
+        starts = self.starts
+        needle = '\n' + query
+
+        if text.startswith(query) and len(result) < limit:
+            result.append(self.offset)
+
+        p = text.find(needle)
+        while p != -1 and len(result) < limit:
+            result.append(self.offset + bisect_right(starts, p))
+            p = text.find(needle, p + 1)
+
+    def add_containing(self, query: str, result: List[int], limit: int) -> None:
+        " Add the names that contain the query (but don't start with it). "
+        text = self.text
+        starts = self.starts
+        count = len(starts)
+
+        p = text.find(query)
+        while p != -1 and len(result) < limit:
+            index = bisect_right(starts, p) - 1
+            if p != starts[index]:  # (The first occurrence in the name.)
+                result.append(self.offset + index)
+            index += 1
+            p = text.find(query, starts[index]) if index < count else -1
+
+    def add_others(self, query: str, result: List[Tuple[int, int]]) -> None:
+        " Add (span, index) for the names that don't contain the query. "
+        text = self.text
+        starts = self.starts
+        offset = self.offset
+        check = query in text  # (Otherwise, no name contains the query.)
+
+        for m in compile_query(query).finditer(text):
+            index = bisect_right(starts, m.start()) - 1
+            if not check or text.find(query, starts[index], m.end()) == -1:
+                start, end = m.span(1)
+                result.append((end - start, offset + index))
+
+
+class FuzzyIndex(object):
+    """
+    Names, prepared for fuzzy matching. (See the module documentation.)
+    """
+    def __init__(self, names: Sequence[str]):
+        self.names = list(names)
+        self._segments = [_Segment(self.names[i:i + SEGMENT_SIZE], i)
+                          for i in range(0, len(self.names), SEGMENT_SIZE)]
+
+        # (query, FuzzyIndex) of all the matches of the last query for
+        # which these are known.
+        self._narrowed: Optional[Tuple[str, 'FuzzyIndex']] = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def filter(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Return the names that match the query, best matches first.
+        """
+        if not query:
+            return self.names[:limit]
+
+        query = query.lower().replace('\n', ' ')
+        narrowed = self._narrowed
+        if narrowed is not None and query.startswith(narrowed[0]):
+            return narrowed[1].filter(query, limit)
+
+        names = self.names
+        wanted = len(names) if limit is None else limit
+        indexes: List[int] = []
+
+        for segment in self._segments:
+            segment.add_starting(query, indexes, wanted)
+        for segment in self._segments:
+            segment.add_containing(query, indexes, wanted)
+
+        if len(indexes) >= wanted:
+            return [names[i] for i in indexes]
+
+        others: List[Tuple[int, int]] = []
+        for segment in self._segments:
+            segment.add_others(query, others)
+        others.sort(key=itemgetter(0))  # (Stable: keeps the order within a span.)
+        indexes.extend(index for _, index in others)
+
+        # All the matches are known now.
+        if len(indexes) <= MAX_NARROWED_MATCHES and len(indexes) < len(names):
+            self._narrowed = (query, FuzzyIndex([names[i] for i in sorted(indexes)]))
+
+        return [names[i] for i in indexes[:limit]]
+
+
+def fuzzy_filter(query: str, names: Sequence[str], limit: Optional[int] = None) -> List[str]:
+    """
+    Return the names that match the query, best matches first. (Use a
+    `FuzzyIndex` when the same names are matched often.)
+    """
+    return FuzzyIndex(names).filter(query, limit)
+
+
+def match_positions(query: str, name: str) -> List[int]:
+    """
+    Return the positions of the characters of the name that match the query.
+    (For highlighting.) When the name contains the query, that's the first
+    occurrence.
+    """
+    if not query:
+        return []
+
+    query = query.lower()
+    lower_name = name.lower()
+
+    start = lower_name.find(query)
+    if start != -1:
+        return list(range(start, start + len(query)))
+
+    m = compile_query(query).search(lower_name)
+    if m is None:
+        return []
+
+    positions = []
+    position = m.start(1)
+    for c in query:
+        position = lower_name.index(c, position)
+        positions.append(position)
+        position += 1
+    return positions
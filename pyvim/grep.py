@@ -0,0 +1,340 @@
+"""
+Search engine for ``:grep`` and ``:vimgrep``.
+
+When ``rg`` (ripgrep) is installed, ``:grep`` runs it as a subprocess.
+Otherwise, and always for ``:vimgrep``, the search runs in-process: a pool of
+threads walks the directory tree (skipping what ``.gitignore`` files exclude),
+and a pool of processes searches the files through `mmap`, in batches.
+
+Either way, the matches arrive in batches, while the search is running::
+
+    async for matches in grep('pattern', ['.']):
+        ...
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import asyncio
+import fnmatch
+import functools
+import mmap
+import os
+import re
+import shutil
+import time
+
+__all__ = (
+    'GrepMatch',
+    'IgnoreRules',
+    'walk_files',
+    'search_files',
+    'grep',
+)
+
+#: Directories that are never searched.
+IGNORED_DIRECTORIES = frozenset([
+    '.git', '.hg', '.svn', '__pycache__', '.mypy_cache', '.pytest_cache',
+    '.tox', '.venv', 'node_modules'])
+
+#: Number of files that a worker process searches in one task.
+FILES_PER_TASK = 64
+
+#: Time between two batches of results from ripgrep. (In seconds.)
+BATCH_INTERVAL = 0.05
+
+#: Files with a NUL byte in the first block are binary, and skipped.
+_BINARY_CHECK_SIZE = 8192
+
+
+class GrepMatch(NamedTuple):
+    path: str
+    lineno: int  # One based.
+    column: int  # One based.
+    text: str  # The line.
+
+
+class IgnoreRules(object):
+    """
+    The patterns of the ``.gitignore`` files, from the root of the search to
+    a directory. (Negations with ``!`` are not supported.)
+    """
+
+    def __init__(self, rules: Tuple[Tuple[str, str, bool, bool], ...] = ()):
+        # Tuples of (base directory, pattern, anchored, directories only).
+        self.rules = rules
+
+    def for_directory(self, directory: str) -> 'IgnoreRules':
+        """
+        Return the rules for this directory. (With its ``.gitignore``.)
+        """
+        try:
+            with open(os.path.join(directory, '.gitignore'), 'r', errors='replace') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return self
+
+        rules = list(self.rules)
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith(('#', '!')):
+                continue
+            directories_only = line.endswith('/')
+            line = line.rstrip('/')
+            anchored = '/' in line
+            rules.append((directory, line.lstrip('/'), anchored, directories_only))
+        return IgnoreRules(tuple(rules))
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        name = os.path.basename(path)
+        for base, pattern, anchored, directories_only in self.rules:
+            if directories_only and not is_dir:
+                continue
+            if anchored:
+                if fnmatch.fnmatchcase(os.path.relpath(path, base), pattern):
+                    return True
+            elif fnmatch.fnmatchcase(name, pattern):
+                return True
+        return False
+
+
+def _scan_directory(directory: str, rules: IgnoreRules) -> Tuple[List[str], List[Tuple[str, IgnoreRules]]]:
+    """
+    List a directory. Return the files, and the subdirectories with their
+    ignore rules.
+    """
+    rules = rules.for_directory(directory)
+    files = []
+    directories = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+
+                if is_dir and entry.name in IGNORED_DIRECTORIES:
+                    continue
+                if rules.rules and rules.is_ignored(entry.path, is_dir):
+                    continue
+
+                if is_dir:
+                    directories.append((entry.path, rules))
+                else:
+                    files.append(entry.path)
+    except OSError:
+        pass
+    return files, directories
+
+
+def walk_files(paths: Sequence[str], max_workers: int = 8,
+               cancelled=lambda: False) -> Iterator[str]:
+    """
+    Yield the files in these paths (files or directories). The directories
+    are listed in parallel by a pool of threads.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = set()
+        for path in paths:
+            if os.path.isdir(path):
+                pending.add(pool.submit(_scan_directory, path, IgnoreRules()))
+            elif os.path.isfile(path):
+                yield path
+
+        while pending and not cancelled():
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, directories = future.result()
+                for directory, rules in directories:
+                    pending.add(pool.submit(_scan_directory, directory, rules))
+                yield from files
+
+        for future in pending:
+            future.cancel()
+
+
+@functools.lru_cache(maxsize=8)
+def _compile(pattern: bytes, flags: int):
+    return re.compile(pattern, flags)
+
+
+def search_files(pattern: bytes, flags: int, paths: Sequence[str]) -> List[GrepMatch]:
+    """
+    Search these files. (Called in a worker process.) Return the first match
+    of every matching line.
+    """
+    regex = _compile(pattern, flags | re.MULTILINE)
+    result = []
+
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if data.find(b'\0', 0, _BINARY_CHECK_SIZE) != -1:
+                        continue
+                    result.extend(_search_data(regex, data, path))
+        except (OSError, ValueError):
+            continue
+
+    return result
+
+
+def _search_data(regex, data, path: str) -> Iterator[GrepMatch]:
+    lineno = 1
+    counted = 0  # Newlines are counted up to this offset.
+    position = 0
+    size = len(data)
+
+    while position <= size:
+        m = regex.search(data, position)
+        if m is None:
+            break
+
+        line_start = data.rfind(b'\n', 0, m.start()) + 1
+        line_end = data.find(b'\n', m.start())
+        if line_end == -1:
+            line_end = size
+
+        lineno += data[counted:line_start].count(b'\n')
+        counted = line_start
+
+        yield GrepMatch(
+            path, lineno, m.start() - line_start + 1,
+            data[line_start:line_end].decode('utf-8', 'replace'))
+
+        # Next line.
+        position = line_end + 1
+
+
+async def grep(pattern: str, paths: Sequence[str], ignore_case: bool = False,
+               use_ripgrep: bool = True) -> AsyncIterator[List[GrepMatch]]:
+    """
+    Search these paths. Yields batches of matches. (Closing the generator
+    stops the search.)
+    """
+    rg = shutil.which('rg') if use_ripgrep else None
+    if rg:
+        search = _grep_ripgrep(rg, pattern, paths, ignore_case)
+    else:
+        search = _grep_in_process(pattern, paths, ignore_case)
+
+    try:
+        async for matches in search:
+            yield matches
+    finally:
+        await search.aclose()
+
+
+async def _grep_ripgrep(rg: str, pattern: str, paths: Sequence[str],
+                        ignore_case: bool) -> AsyncIterator[List[GrepMatch]]:
+    args = [rg, '--no-config', '--no-heading', '--color=never', '--null',
+            '--line-number', '--column']
+    if ignore_case:
+        args.append('--ignore-case')
+    args.extend(['-e', pattern, '--'])
+    args.extend(paths)
+
+    process = await asyncio.create_subprocess_exec(
+        *args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL)
+    assert process.stdout
+
+    try:
+        batch: List[GrepMatch] = []
+        last_batch = time.monotonic()
+
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+
+            # Format: path NUL line:column:text
+            path, _, rest = line.rstrip(b'\n').partition(b'\0')
+            lineno, column, text = rest.split(b':', 2)
+            batch.append(GrepMatch(
+                os.fsdecode(path), int(lineno), int(column), text.decode('utf-8', 'replace')))
+
+            if time.monotonic() - last_batch > BATCH_INTERVAL:
+                yield batch
+                batch = []
+                last_batch = time.monotonic()
+
+        if batch:
+            yield batch
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def _grep_in_process(pattern: str, paths: Sequence[str],
+                           ignore_case: bool) -> AsyncIterator[List[GrepMatch]]:
+    # Validate the pattern here, not in a worker.
+    flags = re.IGNORECASE if ignore_case else 0
+    pattern_bytes = pattern.encode('utf-8')
+    re.compile(pattern_bytes, flags)
+
+    loop = asyncio.get_event_loop()
+    queue: asyncio.Queue[Optional[asyncio.Future]] = asyncio.Queue()
+    pool = ProcessPoolExecutor()
+    stopped = False
+
+    def walk():
+        " Walk the tree (in a thread), and submit the files in batches. "
+        batch: List[str] = []
+
+        def submit():
+            if not stopped:
+                future = asyncio.wrap_future(
+                    pool.submit(search_files, pattern_bytes, flags, batch), loop=loop)
+                loop.call_soon_threadsafe(queue.put_nowait, future)
+
+        try:
+            for path in walk_files(paths, cancelled=lambda: stopped):
+                batch.append(path)
+                if len(batch) == FILES_PER_TASK:
+                    submit()
+                    batch = []
+            if batch:
+                submit()
+        finally:
+            # (`None` marks the end.)
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    walker = loop.run_in_executor(None, walk)
+    get_task: Optional[asyncio.Future] = asyncio.ensure_future(queue.get())
+    pending = set()
+
+    try:
+        while get_task or pending:
+            done, _ = await asyncio.wait(
+                pending | {get_task} if get_task else pending,
+                return_when=asyncio.FIRST_COMPLETED)
+
+            if get_task in done:
+                done.discard(get_task)
+                future = get_task.result()
+                if future is None:
+                    get_task = None
+                else:
+                    pending.add(future)
+                    get_task = asyncio.ensure_future(queue.get())
+
+            for future in done:
+                pending.discard(future)
+                matches = future.result()
+                if matches:
+                    yield matches
+    finally:
+        stopped = True
+        if get_task:
+            get_task.cancel()
+        for future in pending:
+            future.cancel()
+        # (Don't wait for the worker processes.)
+        pool.shutdown(wait=False, cancel_futures=True)
+        await walker
@@ -1,7 +1,6 @@
 import pathlib
 import gzip
 import os
-import six
 
 from .base import EditorIO
 
@@ -155,7 +154,7 @@ def _auto_decode(data):
     """
     Decode bytes. Return a (text, encoding) tuple.
     """
-    assert isinstance(data, six.binary_type)
+    assert isinstance(data, bytes)
 
     for e in ENCODINGS:
         try:
@@ -1,7 +1,8 @@
 
 from prompt_toolkit.application import get_app
-from prompt_toolkit.filters import Condition, has_focus, vi_insert_mode, vi_navigation_mode
+from prompt_toolkit.filters import Condition, has_focus, vi_insert_mode, vi_navigation_mode, vi_selection_mode
 from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
 
 import os
 
@@ -82,6 +83,125 @@ def create_key_bindings():
         """
         editor.commandline.enter_command_mode()
 
+    @kb.add(':', filter=vi_selection_mode & vi_buffer_focussed)
+    def enter_command_mode_for_selection(event):
+        """
+        Entering command mode from visual mode: set the '< and '> marks, and
+        start with this range.
+        """
+        b = event.current_buffer
+        from_, to = b.document.selection_range()
+        marks = editor.current_editor_buffer.marks
+        marks['<'] = from_
+        marks['>'] = to
+        b.exit_selection()
+
+        editor.commandline.enter_command_mode()
+        editor.command_buffer.insert_text("'<,'>")
+
+    @kb.add('m', Keys.Any, filter=in_navigation_mode)
+    def set_mark(event):
+        """
+        Set mark. (m{a-z})
+        """
+        if 'a' <= event.data <= 'z':
+            editor.current_editor_buffer.marks[event.data] = event.current_buffer.cursor_position
+
+    @kb.add("'", Keys.Any, filter=in_navigation_mode)
+    @kb.add('`', Keys.Any, filter=in_navigation_mode)
+    def go_to_mark(event):
+        """
+        Go to the line of a mark ('), or to its exact position (`).
+        """
+        b = event.current_buffer
+        position = editor.current_editor_buffer.marks.get(event.data)
+        if position is None:
+            editor.show_message('Mark not set')
+            return
+
+        b.cursor_position = min(position, len(b.text))
+        if event.key_sequence[0].key == "'":
+            b.cursor_position += b.document.get_start_of_line_position(after_whitespace=True)
+
+    substitute_confirmation = Condition(lambda: editor.substitute_confirmation is not None)
+
+    @kb.add('y', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    @kb.add('n', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    @kb.add('a', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    @kb.add('q', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    @kb.add('l', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    @kb.add('escape', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    @kb.add('c-c', filter=substitute_confirmation, eager=True, save_before=(lambda e: False))
+    def answer_substitute_confirmation(event):
+        """
+        Answer to the confirmation of a ':s///c' substitution.
+        """
+        from .commands.commands import confirm_substitute
+        confirm_substitute(editor, event.data if event.data in 'ynalq' else 'q')
+
+    @kb.add(Keys.Any, filter=substitute_confirmation & vi_navigation_mode, eager=True,
+            save_before=(lambda e: False))
+    def ignore_key_during_substitute_confirmation(event):
+        """
+        While a ':s///c' waits for an answer, the other keys are ignored. (Like
+        in Vim. Otherwise, they could change the buffer under the matches.)
+        """
+        from .commands.commands import confirm_substitute
+        confirm_substitute(editor, None)
+
+    @kb.add('@', Keys.Any, filter=in_navigation_mode, record_in_macro=False)
+    def execute_macro(event):
+        """
+        Execute a macro, `count` times, as one batch. (One undo step, and
+        only one redraw at the end.)
+        """
+        from .commands.normal import execute_macro
+        macro = event.app.vi_state.named_registers.get(event.data)
+        if macro:
+            execute_macro(editor, event.current_buffer, macro.text, event.arg)
+
+    @kb.add('c-c', filter=Condition(lambda: editor.background_substitute is not None),
+            eager=True)
+    def cancel_background_substitute(event):
+        """
+        Cancel the substitution that runs in the background.
+        """
+        from .commands.commands import cancel_substitute
+        cancel_substitute(editor)
+
+    @kb.add('c-c', filter=Condition(lambda: editor.background_sort is not None),
+            eager=True)
+    def cancel_background_sort(event):
+        """
+        Cancel the sort that runs in the background.
+        """
+        from .commands.commands import cancel_sort
+        cancel_sort(editor)
+
+    @kb.add('c-c', filter=Condition(lambda: editor.grep_task is not None) & in_navigation_mode)
+    def cancel_grep(event):
+        """
+        Stop the search of ':grep'.
+        """
+        from .commands.commands import cancel_grep
+        cancel_grep(editor)
+
+    @kb.add('c-c', filter=Condition(lambda: editor.shell_filter_task is not None) & in_navigation_mode)
+    def cancel_shell_filter(event):
+        """
+        Stop the command of ':{range}!cmd' or ':r !cmd'.
+        """
+        from .commands.commands import cancel_shell_filter
+        cancel_shell_filter(editor)
+
+    @kb.add('c-c', filter=Condition(lambda: editor.make_task is not None) & in_navigation_mode)
+    def cancel_make(event):
+        """
+        Stop the build of ':make'.
+        """
+        from .commands.commands import cancel_make
+        cancel_make(editor)
+
     @kb.add('tab', filter=vi_insert_mode &
             ~editor.editor_layout.editor_root.commandline.has_focus & whitespace_before_cursor_on_line)
     def autocomplete_or_indent(event):
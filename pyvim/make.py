@@ -0,0 +1,239 @@
+"""
+Building with ``:make``.
+
+The build command (``makeprg``) runs as an asyncio subprocess, while editing
+continues. Its output is parsed line by line as it arrives, with the regular
+expressions that are compiled from ``errorformat``. This supports a subset of
+Vim's format: ``%f``, ``%l``, ``%c``, ``%m``, ``%t``, ``%*[...]``, ``%*\\X``
+and ``%%``. Formats are separated by commas. (``\\,`` is a literal comma.)
+
+Usage::
+
+    job = MakeJob('make', compile_errorformat(DEFAULT_ERRORFORMAT), '.')
+    async for errors in job.run():
+        ...
+"""
+from typing import AsyncIterator, List, NamedTuple, Optional, Pattern, Sequence
+import asyncio
+import functools
+import os
+import re
+import sys
+import time
+
+from .commands.shell_filter import create_shell_process, kill_shell_process
+from .reporting import ReporterError
+
+__all__ = (
+    'DEFAULT_MAKEPRG',
+    'DEFAULT_ERRORFORMAT',
+    'ErrorFormatError',
+    'MakeError',
+    'compile_errorformat',
+    'parse_line',
+    'MakeJob',
+)
+
+DEFAULT_MAKEPRG = 'make'
+
+#: GCC/Clang, Python tools (pyflakes, mypy, pytest) and MSVC style errors.
+DEFAULT_ERRORFORMAT = ','.join([
+    '%f:%l:%c: %trror: %m', '%f:%l:%c: %tarning: %m', '%f:%l:%c: %m',
+    '%f:%l: %trror: %m', '%f:%l: %tarning: %m', '%f:%l: %m',
+    '%f(%l): %m'])
+
+#: Time between two batches of errors. (In seconds.)
+BATCH_INTERVAL = 0.05
+
+#: Size of the chunks that are read from the output.
+_CHUNK_SIZE = 64 * 1024
+
+_CONVERSIONS = {
+    'f': r'(?P<f>.+?)',
+    'l': r'(?P<l>\d+)',
+    'c': r'(?P<c>\d+)',
+    'm': r'(?P<m>.*)',
+    't': r'(?P<t>[A-Za-z])',
+    '%': '%',
+}
+
+
+class ErrorFormatError(Exception):
+    " Invalid 'errorformat'. "
+
+
+class MakeError(NamedTuple):
+    path: str
+    lineno: int  # One based. (0 when unknown.)
+    column: int  # One based. (0 when unknown.)
+    text: str
+    type: str  # 'e' for errors, 'w' for warnings. ('' when unknown.)
+
+    @property
+    def is_warning(self) -> bool:
+        return self.type.lower() == 'w'
+
+    def to_reporter_error(self) -> ReporterError:
+        """
+        `ReporterError` for highlighting the error in the buffer. (The whole
+        line when the column is unknown.)
+        """
+        prefix = 'warning:' if self.is_warning else 'make:'
+        start_column = max(0, self.column - 1)
+        return ReporterError(
+            lineno=self.lineno - 1,
+            start_column=start_column,
+            end_column=start_column + 1 if self.column else sys.maxsize,
+            formatted_text=[
+                ('class:flakemessage.prefix', prefix),
+                ('', ' '),
+                ('class:flakemessage', self.text),
+            ])
+
+
+@functools.lru_cache(maxsize=8)
+def compile_errorformat(errorformat: str) -> List[Pattern]:
+    """
+    Turn an 'errorformat' into a list of regular expressions.
+    """
+    return [_compile_format(f) for f in re.split(r'(?<!\\),', errorformat) if f]
+
+
+def _compile_format(format: str) -> Pattern:
+    result = []
+    i = 0
+    while i < len(format):
+        c = format[i]
+        if c == '%':
+            conversion = format[i + 1:i + 2]
+            if conversion in _CONVERSIONS:
+                result.append(_CONVERSIONS[conversion])
+                i += 2
+            elif conversion == '*':
+                # %*[...] or %*\X: skip any number of these characters.
+                m = re.match(r'\[\^?\]?[^\]]*\]|\\.', format[i + 2:])
+                if m is None:
+                    raise ErrorFormatError('Invalid %%* in errorformat: %s' % format)
+                result.append('%s*' % m.group(0))
+                i += 2 + m.end()
+            else:
+                raise ErrorFormatError('Invalid %%%s in errorformat: %s' % (conversion, format))
+        elif c == '\\' and i + 1 < len(format):
+            result.append(re.escape(format[i + 1]))
+            i += 2
+        else:
+            result.append(re.escape(c))
+            i += 1
+
+    try:
+        return re.compile(''.join(result) + '$')
+    except re.error as e:
+        raise ErrorFormatError('Invalid errorformat: %s (%s)' % (format, e))
+
+
+def parse_line(patterns: Sequence[Pattern], line: str, directory: str) -> Optional[MakeError]:
+    """
+    Parse a line of output with the first matching pattern. Return `None`
+    when the line doesn't contain an error. (Paths are relative to
+    `directory`.)
+    """
+    for pattern in patterns:
+        m = pattern.match(line)
+        if m is not None:
+            groups = m.groupdict()
+            path = groups.get('f')
+            if not path:
+                continue
+            return MakeError(
+                os.path.normpath(os.path.join(directory, path)),
+                int(groups.get('l') or 0),
+                int(groups.get('c') or 0),
+                (groups.get('m') or '').strip(),
+                groups.get('t') or '')
+    return None
+
+
+class MakeJob(object):
+    """
+    A running ``:make``.
+
+    :param command: Shell command.
+    :param patterns: Compiled 'errorformat'.
+    :param directory: Working directory of the build.
+    """
+
+    def __init__(self, command: str, patterns: Sequence[Pattern], directory: str):
+        self.command = command
+        self.patterns = patterns
+        self.directory = directory
+
+        # Progress.
+        self.line_count = 0
+        self.error_count = 0
+        self.warning_count = 0
+        self.returncode: Optional[int] = None
+
+    def __repr__(self):
+        return '%s(command=%r)' % (self.__class__.__name__, self.command)
+
+    async def run(self) -> AsyncIterator[List[MakeError]]:
+        """
+        Run the build. Yields batches of errors while the output arrives.
+        (Closing the generator kills the build.)
+        """
+        process = await create_shell_process(
+            self.command, cwd=self.directory,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+        assert process.stdout
+
+        try:
+            batch: List[MakeError] = []
+            last_batch = time.monotonic()
+            remainder = b''  # Incomplete last line.
+
+            while True:
+                try:
+                    # (Don't hold back errors while the build is silent.)
+                    data = await asyncio.wait_for(
+                        process.stdout.read(_CHUNK_SIZE), BATCH_INTERVAL if batch else None)
+                except asyncio.TimeoutError:
+                    yield batch
+                    batch = []
+                    last_batch = time.monotonic()
+                    continue
+
+                if data:
+                    lines = (remainder + data).split(b'\n')
+                    remainder = lines.pop()
+                else:
+                    lines = [remainder] if remainder else []
+
+                for line in lines:
+                    self.line_count += 1
+                    error = parse_line(
+                        self.patterns, line.decode('utf-8', 'replace').rstrip('\r'),
+                        self.directory)
+
+                    if error is not None:
+                        if error.is_warning:
+                            self.warning_count += 1
+                        else:
+                            self.error_count += 1
+                        batch.append(error)
+
+                if not data:
+                    break
+
+                if time.monotonic() - last_batch > BATCH_INTERVAL:
+                    # (Also without errors, for updating the progress.)
+                    yield batch
+                    batch = []
+                    last_batch = time.monotonic()
+
+            if batch:
+                yield batch
+            self.returncode = await process.wait()
+        finally:
+            await kill_shell_process(process)
@@ -0,0 +1,151 @@
+"""
+Quickfix list. (The results of ``:grep``, ``:make``, ...)
+
+The list can hold millions of entries. It's stored in arrays: a file ID, a
+line and a column number and a text ID per entry. The file names and the
+texts are only stored once.
+"""
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from prompt_toolkit.utils import Event
+
+__all__ = (
+    'QuickfixEntry',
+    'QuickfixList',
+)
+
+
+class QuickfixEntry(NamedTuple):
+    path: str
+    lineno: int  # One based.
+    column: int  # One based.
+    text: str
+
+
+class _StringTable(object):
+    """
+    Strings by ID. Every string is only stored once.
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def get_id(self, string: str) -> int:
+        try:
+            return self._ids[string]
+        except KeyError:
+            self._ids[string] = id_ = len(self.strings)
+            self.strings.append(string)
+            return id_
+
+
+class QuickfixList(object):
+    """
+    List of locations with a text, and the current entry.
+
+    :param title: Title of the list. (Like the command that created it.)
+    """
+
+    def __init__(self, title: str = ''):
+        #: Fired when entries were added, or when the list was cleared.
+        self.on_change = Event(self)
+
+        self._reset(title)
+
+    def _reset(self, title: str):
+        self.title = title
+        self.index = 0  # Index of the current entry.
+
+        self._paths = _StringTable()
+        self._texts = _StringTable()
+        self._file_ids = array('L')
+        self._linenos = array('L')
+        self._columns = array('L')
+        self._text_ids = array('L')
+
+    def __len__(self) -> int:
+        return len(self._linenos)
+
+    def __getitem__(self, index: int) -> QuickfixEntry:
+        return QuickfixEntry(
+            self._paths.strings[self._file_ids[index]],
+            self._linenos[index],
+            self._columns[index],
+            self._texts.strings[self._text_ids[index]])
+
+    def __repr__(self):
+        return '%s(title=%r, len=%i)' % (self.__class__.__name__, self.title, len(self))
+
+    @property
+    def file_count(self) -> int:
+        return len(self._paths.strings)
+
+    def clear(self, title: str = ''):
+        """
+        Remove all entries. (The handlers of `on_change` are kept.)
+        """
+        self._reset(title)
+        self.on_change.fire()
+
+    def append(self, path: str, lineno: int, column: int, text: str):
+        self._file_ids.append(self._paths.get_id(path))
+        self._linenos.append(lineno)
+        self._columns.append(column)
+        self._text_ids.append(self._texts.get_id(text))
+        self.on_change.fire()
+
+    def extend(self, entries: Iterable[Tuple[str, int, int, str]]):
+        """
+        Add entries. (Tuples of path, line, column and text, like
+        `QuickfixEntry` and `GrepMatch`.)
+        """
+        get_path_id = self._paths.get_id
+        get_text_id = self._texts.get_id
+
+        for path, lineno, column, text in entries:
+            self._file_ids.append(get_path_id(path))
+            self._linenos.append(lineno)
+            self._columns.append(column)
+            self._text_ids.append(get_text_id(text))
+
+        self.on_change.fire()
+
+    @property
+    def current(self) -> Optional[QuickfixEntry]:
+        if len(self):
+            return self[self.index]
+        return None
+
+    def go_to(self, index: int) -> Optional[QuickfixEntry]:
+        """
+        Make this the current entry. (The index is clipped.)
+        """
+        if not len(self):
+            return None
+        self.index = max(0, min(index, len(self) - 1))
+        return self[self.index]
+
+    def move(self, count: int) -> Optional[QuickfixEntry]:
+        """
+        Go `count` entries forward (or backward when negative). Return the
+        new current entry, or `None` at the end of the list.
+        """
+        index = self.index + count
+        if not 0 <= index < len(self):
+            return None
+        self.index = index
+        return self[index]
+
+    def format_entry(self, index: int) -> str:
+        """
+        The entry as displayed in the quickfix window. (Like Vim.)
+        """
+        path, lineno, column, text = self[index]
+        if not lineno:
+            location = ''
+        elif not column:
+            location = '%i' % lineno
+        else:
+            location = '%i col %i' % (lineno, column)
+        return '%s|%s| %s' % (path, location, text.strip())
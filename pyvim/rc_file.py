@@ -7,7 +7,6 @@ editor instance as an argument.
 """
 
 
-import six
 import os
 import traceback
 
@@ -18,14 +17,14 @@ __all__ = (
 
 def _press_enter_to_continue():
     """ Wait for the user to press enter. """
-    six.moves.input('\nPress ENTER to continue...')
+    input('\nPress ENTER to continue...')
 
 
 def run_rc_file(rc_file):
     """
     Run rc file.
     """
-    assert isinstance(rc_file, six.string_types)
+    assert isinstance(rc_file, str)
 
     # Expand tildes.
     rc_file = os.path.expanduser(rc_file)
@@ -42,7 +41,7 @@ def run_rc_file(rc_file):
 
         with open(rc_file, 'r') as f:
             code = compile(f.read(), rc_file, 'exec')
-            six.exec_(code, namespace, namespace)
+            exec(code, namespace, namespace)
 
         # Now we should have a 'configure' method in this namespace. We call this
         # method with editor as an argument.
@@ -10,7 +10,6 @@ Usage::
     errors = report('location.py', Document('file content'))
 """
 import pathlib
-import pyflakes.api
 import string
 
 __all__ = (
@@ -50,6 +49,10 @@ def report_pyflakes(document):
     """
     Run pyflakes on document and return list of ReporterError instances.
     """
+    # Importing pyflakes is done in-line, to improve start-up time. (It's only
+    # needed once the first Python file is checked.)
+    import pyflakes.api
+
     # Run pyflakes on input.
     reporter = _FlakesReporter()
     pyflakes.api.check(document.text, '', reporter=reporter)
@@ -0,0 +1,211 @@
+"""
+Client/server mode.
+
+A pyvim instance that was started with ``--server`` listens on a Unix domain
+socket in the config directory. ``pyvim --remote <location>...`` sends the
+locations to this instance instead of starting a new editor, which makes
+repeated invocations almost free. With ``--remote-wait``, the client only
+returns when the buffers have been closed, so that it can be used as
+``$EDITOR``.
+
+The protocol is a single JSON request line from the client. The server
+answers with a single line when the request was handled (and, for
+``--remote-wait``, when all the buffers have been closed).
+
+``:q`` and ``:wq`` close a buffer that a client waits for, instead of quitting
+the editor, and the editor doesn't quit while clients wait. (Unless with
+``:q!``: then the clients see the connection close.)
+
+This module is imported by the client, so it should only import from the
+standard library at module level.
+"""
+import json
+import os
+import pathlib
+import socket
+import sys
+
+__all__ = (
+    'EditorServer',
+    'get_socket_path',
+    'send_to_server',
+)
+
+
+def get_socket_path(servername: str) -> pathlib.Path:
+    """
+    Location of the socket for the server with this name.
+    """
+    return pathlib.Path(os.path.expanduser('~')) / '.pyvim' / ('%s.sock' % servername)
+
+
+def send_to_server(servername: str, locations, in_tab_pages=False, wait=False) -> bool:
+    """
+    Send these locations to a running server.
+    Return False when there is no server to send them to.
+    """
+    request = {
+        'locations': [str(l) for l in locations],
+        'in_tab_pages': in_tab_pages,
+        'wait': wait,
+    }
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(str(get_socket_path(servername)))
+    except (FileNotFoundError, ConnectionRefusedError):
+        s.close()
+        sys.stderr.write('No pyvim server named "%s": trying to execute locally.\n' % servername)
+        return False
+
+    with s:
+        s.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+        # Wait for the answer. (The connection is also closed when the
+        # server quits.)
+        s.makefile('rb').readline()
+    return True
+
+
+class EditorServer(object):
+    """
+    Server that opens the locations it receives in the editor.
+    """
+
+    def __init__(self, servername: str):
+        self.socket_path = get_socket_path(servername)
+        self._server = None
+
+        # Mapping from `EditorBuffer` to the futures of the clients that wait
+        # for it to be closed.
+        self._waiting = {}
+
+        from pyvim.event_dispatcher import DISPATCHER, EventType
+        DISPATCHER.register(EventType.CloseEditorBuffer, self._editor_buffer_closed)
+
+    def is_waiting_for(self, editor_buffer) -> bool:
+        """
+        True when a ``--remote-wait`` client waits for this buffer to be
+        closed.
+        """
+        return editor_buffer in self._waiting
+
+    @property
+    def waiting_count(self) -> int:
+        """
+        The number of buffers that ``--remote-wait`` clients wait for.
+        """
+        return len(self._waiting)
+
+    def start(self, loop):
+        loop.create_task(self._start_async())
+
+    async def _start_async(self):
+        import asyncio
+        from pyvim.editor import get_editor
+        editor = get_editor()
+
+        if self.socket_path.exists():
+            # When another server is listening, leave it alone. Otherwise,
+            # this is a stale socket of an instance that crashed.
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(self.socket_path))
+            except (ConnectionRefusedError, FileNotFoundError):
+                self.socket_path.unlink()
+            else:
+                writer.close()
+                editor.show_message('Server already running: %s' % self.socket_path)
+                return
+
+        self._server = await asyncio.start_unix_server(
+            self._handle_client, path=str(self.socket_path))
+
+    def close(self):
+        """
+        Stop listening and remove the socket.
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    async def _handle_client(self, reader, writer):
+        import asyncio
+        try:
+            request = json.loads((await reader.readline()).decode('utf-8'))
+            editor_buffers = self._open(
+                request['locations'], in_tab_pages=request.get('in_tab_pages', False))
+
+            if request.get('wait'):
+                loop = asyncio.get_running_loop()
+                futures = []
+                for eb in editor_buffers:
+                    f = loop.create_future()
+                    self._waiting.setdefault(eb, []).append(f)
+                    futures.append(f)
+
+                # Also stop waiting when the client disconnects. (Control-C,
+                # or the terminal was closed. It doesn't send anything else,
+                # so `read` returns at the end of the stream.)
+                all_closed = asyncio.gather(*futures)
+                disconnected = asyncio.ensure_future(reader.read())
+                try:
+                    await asyncio.wait([all_closed, disconnected],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    all_closed.cancel()
+                    disconnected.cancel()
+                    self._stop_waiting(futures)
+
+                if all_closed.cancelled():
+                    return  # Disconnected.
+
+            writer.write(b'done\n')
+            await writer.drain()
+        except (ValueError, KeyError):
+            writer.write(b'invalid request\n')
+        finally:
+            writer.close()
+
+    def _open(self, locations, in_tab_pages=False):
+        """
+        Open the locations in the editor. Return the list of `EditorBuffer`
+        instances.
+        """
+        from prompt_toolkit.application.current import get_app
+        from pyvim.editor import get_editor
+        editor = get_editor()
+        wa = editor.window_arrangement
+
+        editor_buffers = []
+        for i, location in enumerate(locations):
+            location = pathlib.Path(location)
+            if in_tab_pages:
+                eb = wa.create_tab(location, lazy=True)
+            else:
+                # Show the first one, add the others as hidden buffers.
+                eb = wa.open_buffer(location, show_in_current_window=(i == 0), lazy=True)
+            editor_buffers.append(eb)
+
+        editor.sync_with_prompt_toolkit()
+        get_app().invalidate()
+        return editor_buffers
+
+    def _stop_waiting(self, futures):
+        """
+        Remove the futures of a client from `_waiting`.
+        """
+        futures = set(futures)
+        for eb, waiting in list(self._waiting.items()):
+            waiting[:] = [f for f in waiting if f not in futures]
+            if not waiting:
+                del self._waiting[eb]
+
+    def _editor_buffer_closed(self, editor_buffer):
+        for f in self._waiting.pop(editor_buffer, []):
+            if not f.done():
+                f.set_result(None)
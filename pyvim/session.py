@@ -0,0 +1,174 @@
+"""
+Sessions, for ``:mksession`` and ``pyvim -S``.
+
+A session is a JSON file with the open buffers (with their cursor position)
+and the tab pages (with their split tree, scroll offsets and active window).
+When a session is restored, the buffers are not read. Like files that are
+given on the command line, they are only read once they are displayed.
+
+Format::
+
+    {
+        "version": 1,
+        "cwd": "/home/user/project",
+        "buffers": [["/home/user/project/a.py", 120], ...],
+        "tabs": [{"root": ["v", [["w", 0, 3], ["h", [...]]]], "active": 0}],
+        "active_tab": 0
+    }
+
+A window is ``["w", buffer_index, vertical_scroll]``, where the buffer index
+is null for a buffer without a location. ``"v"`` and ``"h"`` are vertical
+and horizontal splits. The active window of a tab is its index in the list of
+windows, in tree order.
+"""
+import json
+import os
+import pathlib
+
+__all__ = (
+    'get_default_session_path',
+    'save_session',
+    'load_session',
+)
+
+SESSION_VERSION = 1
+
+
+def get_default_session_path() -> pathlib.Path:
+    """
+    Location of the session file, when no file name is given.
+    """
+    return pathlib.Path(os.path.expanduser('~')) / '.pyvim' / 'session.json'
+
+
+def save_session(editor, filename):
+    """
+    Write the buffers and tab pages of the editor to this file.
+    """
+    from .window_arrangement import tab_page
+    wa = editor.window_arrangement
+
+    buffer_indexes = {}
+    buffers = []
+    for eb in wa.editor_buffers:
+        if eb.location is not None:
+            buffer_indexes[eb] = len(buffers)
+            buffers.append([str(eb.location), eb.cursor_position])
+
+    def dump_node(node):
+        if isinstance(node, tab_page.TabWindow):
+            return ['w', buffer_indexes.get(node.editor_buffer), wa.get_vertical_scroll(node)]
+        else:
+            kind = 'v' if isinstance(node, tab_page.TabVSplit) else 'h'
+            return [kind, [dump_node(c) for c in node.children]]
+
+    tabs = []
+    for t in wa.tab_pages:
+        tabs.append({
+            'root': dump_node(t.root),
+            'active': t.windows().index(t.active_window),
+        })
+
+    data = {
+        'version': SESSION_VERSION,
+        'cwd': os.getcwd(),
+        'buffers': buffers,
+        'tabs': tabs,
+        'active_tab': wa.active_tab_index,
+    }
+
+    with open(filename, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def load_session(editor, filename):
+    """
+    Restore the buffers and tab pages from this file. The buffers are only
+    read when they are displayed.
+
+    Raises `OSError` when the file can't be read, and `ValueError` when it's
+    not a valid session file. (Then the editor is left as it was: the whole
+    file is checked before the new tab pages are created and swapped in.)
+    """
+    from .window_arrangement import tab_page
+    wa = editor.window_arrangement
+
+    with open(filename, 'r') as f:
+        try:
+            data = json.load(f)
+        except ValueError:
+            raise ValueError('Not a session file: %s' % filename)
+
+    if not isinstance(data, dict) or data.get('version') != SESSION_VERSION:
+        raise ValueError('Not a session file: %s' % filename)
+
+    try:
+        buffers = [(str(location), int(cursor_position))
+                   for location, cursor_position in data['buffers']]
+
+        tabs = []
+        for tab in data['tabs']:
+            root, active = tab['root'], tab['active']
+            if root[0] == 'w' or not _is_index(active, _check_node(root, len(buffers))):
+                raise ValueError
+            tabs.append((root, active))
+
+        active_tab_index = data['active_tab']
+        if not _is_index(active_tab_index, len(tabs)):
+            raise ValueError
+    except (KeyError, IndexError, TypeError, ValueError):
+        raise ValueError('Invalid session file: %s' % filename)
+
+    if data.get('cwd') and os.path.isdir(data['cwd']):
+        os.chdir(data['cwd'])
+
+    editor_buffers = []
+    for location, cursor_position in buffers:
+        eb = wa.open_buffer(pathlib.Path(location), lazy=True)
+        eb.cursor_position = cursor_position
+        editor_buffers.append(eb)
+
+    def create_node(node, windows):
+        if node[0] == 'w':
+            _, index, vertical_scroll = node
+            if index is None:
+                eb = wa.open_buffer()
+            else:
+                eb = editor_buffers[index]
+            window = tab_page.TabWindow(eb)
+            window.vertical_scroll = vertical_scroll
+            windows.append(window)
+            return window
+        else:
+            split_cls = {'v': tab_page.TabVSplit, 'h': tab_page.TabHSplit}[node[0]]
+            return split_cls(*[create_node(c, windows) for c in node[1]])
+
+    tab_pages = []
+    for root, active in tabs:
+        windows = []
+        root = create_node(root, windows)
+        tab_pages.append(tab_page.TabPage(windows[active], root=root))
+
+    wa.tab_pages = tab_pages
+    wa.active_tab_index = active_tab_index
+
+
+def _check_node(node, buffer_count: int) -> int:
+    """
+    Check a node of a split tree, as it was read from a session file. Return
+    the number of windows in it. Raises `ValueError` (or `KeyError`,
+    `IndexError`, `TypeError`) when it's not valid.
+    """
+    if node[0] == 'w':
+        _, index, vertical_scroll = node
+        if not (index is None or _is_index(index, buffer_count)) or not isinstance(vertical_scroll, int):
+            raise ValueError
+        return 1
+    elif node[0] in ('v', 'h') and node[1]:
+        return sum(_check_node(c, buffer_count) for c in node[1])
+    else:
+        raise ValueError
+
+
+def _is_index(value, count: int) -> bool:
+    return isinstance(value, int) and 0 <= value < count
@@ -0,0 +1,153 @@
+"""
+Start-up timing, for the ``--startuptime`` command line option.
+
+Like Vim's ``--startuptime``, this writes a report with the time spent in
+every phase of the start-up, and the time it took to import every module.
+
+Usage::
+
+    timer = StartupTimer()
+    timer.install()  # Start timing imports.
+    ...
+    timer.mark('loading files')
+    ...
+    timer.write('startuptime.log')
+"""
+import importlib.abc
+import sys
+import time
+
+__all__ = (
+    'StartupTimer',
+)
+
+
+class StartupTimer(object):
+    """
+    Collect the timings of the start-up phases and imports.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._last = self._start
+
+        # List of (clock, line) tuples, in the order of completion.
+        self.entries = []
+
+        # For every import in progress, the time spent in nested imports.
+        self._nested_import_times = []
+
+        self._finder = _ImportTimingFinder(self)
+        self.mark('--- PYVIM STARTING ---')
+
+    def _clock(self, t):
+        return (t - self._start) * 1000
+
+    def mark(self, phase):
+        """
+        Record the end of a start-up phase.
+        """
+        now = time.perf_counter()
+        self.entries.append((
+            self._clock(now),
+            '%07.3f: %s' % ((now - self._last) * 1000, phase)))
+        self._last = now
+
+    def install(self):
+        """
+        Start timing imports.
+        """
+        if self._finder not in sys.meta_path:
+            sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        """
+        Stop timing imports.
+        """
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def _time_import(self, name, exec_module, module):
+        self._nested_import_times.append(0)
+        start = time.perf_counter()
+        try:
+            exec_module(module)
+        finally:
+            end = time.perf_counter()
+            total = end - start
+            nested = self._nested_import_times.pop()
+            if self._nested_import_times:
+                self._nested_import_times[-1] += total
+
+            self.entries.append((
+                self._clock(end),
+                '%07.3f  %07.3f: import %s' % (total * 1000, (total - nested) * 1000, name)))
+
+    def format(self):
+        """
+        Return the report as text.
+        """
+        lines = [
+            'times in msec',
+            ' clock   self+imported  self: imported module',
+            ' clock   elapsed:              other lines',
+            '',
+        ]
+        for clock, line in self.entries:
+            lines.append('%07.3f  %s' % (clock, line))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """
+        Append the report to this file. (Like Vim does.)
+        """
+        with open(filename, 'a') as f:
+            f.write('\n\n')
+            f.write(self.format())
+
+
+class _ImportTimingFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path finder that asks the other finders for the module spec, and
+    times the execution of the module.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(self.timer, spec.loader)
+                return spec
+
+        return None
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """
+    Wrapper around a loader, that reports the execution time to the timer.
+    The original loader is put back on the module before executing it.
+    """
+
+    def __init__(self, timer, loader):
+        self.timer = timer
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+
+        self.timer._time_import(module.__name__, self.loader.exec_module, module)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
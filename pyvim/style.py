@@ -1,22 +1,62 @@
 """
 The styles, for the colorschemes.
 """
+import collections.abc
+import functools
 import prompt_toolkit.styles
-from prompt_toolkit.styles.pygments import style_from_pygments_cls
-
-from pygments.styles import get_all_styles, get_style_by_name
 
 __all__ = (
     'generate_built_in_styles',
     'get_editor_style_by_name',
 )
 
+#: Maximum number of merged colorschemes that are kept around. (Should be
+#: larger than the number of built-in Pygments styles, so that scrolling
+#: through the ':colorscheme' completions never has to rebuild a style.)
+STYLE_CACHE_SIZE = 64
+
+
+class _CachedAttrsStyle(prompt_toolkit.styles.BaseStyle):
+    """
+    Wrapper around a merged style that memoizes the `Attrs` for each style
+    string.
+
+    The renderer drops its own attrs cache every time the invalidation hash
+    of the style changes, which happens on every colorscheme preview. By
+    keeping one instance per colorscheme, switching back to a scheme that was
+    shown before doesn't have to resolve the style strings again.
+    """
+
+    def __init__(self, style):
+        self._style = style
+        self._attrs_cache = {}
 
+    def get_attrs_for_style_str(self, style_str, default=prompt_toolkit.styles.DEFAULT_ATTRS):
+        key = (style_str, default)
+        try:
+            return self._attrs_cache[key]
+        except KeyError:
+            attrs = self._style.get_attrs_for_style_str(style_str, default)
+            self._attrs_cache[key] = attrs
+            return attrs
+
+    @property
+    def style_rules(self):
+        return self._style.style_rules
+
+    def invalidation_hash(self):
+        return self._style.invalidation_hash()
+
+
+@functools.lru_cache(maxsize=STYLE_CACHE_SIZE)
 def get_editor_style_by_name(name):
     """
     Get Style class.
     This raises `pygments.util.ClassNotFound` when there is no style with this
     name.
+
+    Styles are cached: asking twice for the same name returns the same
+    instance, so previewing a colorscheme is free after the first time.
     """
     if name == 'vim':
         vim_style = prompt_toolkit.styles.Style.from_dict(default_vim_style)
@@ -24,24 +64,62 @@ def get_editor_style_by_name(name):
 
         }
     else:
+        # Pygments styles are imported in-line, to improve start-up time.
+        from pygments.styles import get_style_by_name
+        from prompt_toolkit.styles.pygments import style_from_pygments_cls
+
         pygment_style = get_style_by_name(name)
         vim_style = style_from_pygments_cls(pygment_style)
         bg_style = {
             '': f'bg:{pygment_style.background_color}',
         }
 
-    return prompt_toolkit.styles.merge_styles([
+    return _CachedAttrsStyle(prompt_toolkit.styles.merge_styles([
         vim_style,
         prompt_toolkit.styles.Style.from_dict(style_extensions),
         prompt_toolkit.styles.Style.from_dict(bg_style),
-    ])
+    ]))
+
+
+class _BuiltInStyles(collections.abc.Mapping):
+    """
+    Mapping from style names to their classes.
+
+    Nothing is computed up front: the list of names is only collected when
+    it's needed (e.g. for completing ':colorscheme'), and every style is only
+    created when it's looked up.
+    """
+
+    def __init__(self):
+        self._names = None
+
+    @property
+    def names(self):
+        if self._names is None:
+            from pygments.styles import get_all_styles
+            self._names = list(get_all_styles())
+        return self._names
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        return get_editor_style_by_name(name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
 
 
 def generate_built_in_styles():
     """
     Return a mapping from style names to their classes.
     """
-    return dict((name, get_editor_style_by_name(name)) for name in get_all_styles())
+    return _BuiltInStyles()
 
 
 style_extensions = {
@@ -57,6 +135,9 @@ style_extensions = {
     'flakemessage.prefix':    'bg:#ff8800 #ffffff',
     'flakemessage':           '#886600',
 
+    # Preview of ':s'.
+    'substitute-preview':     'bg:#ffaa44 #000000',
+
     # Highlighting for the text in the command bar.
     'commandline.command':    'bold',
     'commandline.location':   'bg:#bbbbff #000000',
@@ -89,6 +170,10 @@ style_extensions = {
     'bufferlist active.lineno': '#666666',
     'bufferlist searchmatch':   'bg:#eeeeaa',
 
+    # Quickfix window.
+    'quickfix':                 '',
+    'quickfix.current':         'reverse',
+
     # Completions toolbar.
     'completions-toolbar':                    'bg:#aaddaa #000000',
     'completions-toolbar.arrow':              'bg:#aaddaa #000000 bold',
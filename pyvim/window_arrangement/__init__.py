@@ -5,12 +5,14 @@ This contains the data structure for the tab pages with their windows and
 buffers. It's not the same as a `prompt-toolkit` layout. The latter directly
 represents the rendering, while this is more specific for the editor itself.
 """
-from typing import List, Optional, Dict, Union
+from typing import List, Optional, Dict
 import pathlib
-from six import string_types
+import time
 from prompt_toolkit.application.current import get_app
+from prompt_toolkit.buffer import Buffer
 import prompt_toolkit.layout
 from .editor_buffer import EditorBuffer
+from .buffer_registry import BufferRegistry
 from .openbuffer_info import OpenBufferInfo
 from . import tab_page
 from .editor_window import EditorWindow, _try_char
@@ -19,6 +21,10 @@ __all__ = (
     'WindowArrangement',
 )
 
+#: Number of recently visited tab pages for which the windows are kept. (With
+#: their scroll offsets.)
+FRAME_CACHE_TABS = 8
+
 
 class WindowArrangement(object):
     '''
@@ -43,14 +49,19 @@ class WindowArrangement(object):
     def __init__(self, config_directory: pathlib.Path):
         self.tab_pages: List[tab_page.TabPage] = []
         self.active_tab_index: Optional[int] = None
-        self.editor_buffers: List[EditorBuffer] = []
-        # Mapping from (`window_arrangement.Window`, `EditorBuffer`) to a frame
-        # (Layout instance).
+        self.editor_buffers = BufferRegistry()
+        # Mapping from `TabWindow` to a frame (Layout instance).
         # We keep this as a cache in order to easily reuse the same frames when
         # the layout is updated. (We don't want to create new frames on every
         # update call, because that way, we would loose some state, like the
         # vertical scroll offset.)
-        self._frames: Dict[EditorBuffer, EditorWindow] = {}
+        self._frames: Dict[tab_page.TabWindow, EditorWindow] = {}
+        # Mapping from `TabSplit` to the VSplit/HSplit that was created for it.
+        # (For reusing the containers.)
+        self._split_containers: Dict[tab_page.TabSplit, prompt_toolkit.layout.Container] = {}
+        # The tab pages for which these are kept, the most recently visited
+        # one last.
+        self._recent_tabs: List[tab_page.TabPage] = []
 
         self.container = prompt_toolkit.layout.VSplit([
             prompt_toolkit.layout.Window(
@@ -84,9 +95,13 @@ class WindowArrangement(object):
         Return the `EditorBuffer` for this location.
         When this file was not yet loaded, return None
         """
-        for eb in self.editor_buffers:
-            if eb.location == location:
-                return eb
+        return self.editor_buffers.get_by_location(location)
+
+    def get_editor_buffer_for_buffer(self, buffer: Buffer) -> Optional[EditorBuffer]:
+        """
+        Return the `EditorBuffer` that holds this prompt_toolkit `Buffer`.
+        """
+        return self.editor_buffers.get_by_buffer(buffer)
 
     def close_window(self):
         """
@@ -156,18 +171,13 @@ class WindowArrangement(object):
         Open next buffer in active window.
         """
         if self.active_editor_buffer:
-            # Find the active opened buffer.
-            index = self.editor_buffers.index(self.active_editor_buffer)
-
-            # Get index of new buffer.
             if _previous:
-                new_index = (len(self.editor_buffers) + index -
-                             1) % len(self.editor_buffers)
+                eb = self.editor_buffers.previous(self.active_editor_buffer)
             else:
-                new_index = (index + 1) % len(self.editor_buffers)
+                eb = self.editor_buffers.next(self.active_editor_buffer)
 
             # Open new buffer in active tab.
-            self.active_tab.show_editor_buffer(self.editor_buffers[new_index])
+            self.active_tab.show_editor_buffer(eb)
 
             # Clean up buffers.
             self._auto_close_new_empty_buffers()
@@ -194,37 +204,51 @@ class WindowArrangement(object):
         self.active_tab_index = (self.active_tab_index - 1 +
                                  len(self.tab_pages)) % len(self.tab_pages)
 
-    def go_to_buffer(self, buffer_name):
+    def go_to_buffer(self, buffer_name: str) -> Optional[str]:
         """
-        Go to one of the open buffers.
+        Go to one of the open buffers, given its number or location, or a part
+        of its location that only one buffer has. (Like Vim.) Return an error
+        message when no buffer, or more than one, matches.
         """
-        assert isinstance(buffer_name, string_types)
+        assert isinstance(buffer_name, str)
 
-        for i, eb in enumerate(self.editor_buffers):
-            if (eb.location == buffer_name or
-                    (buffer_name.isdigit() and int(buffer_name) == i)):
-                self.show_editor_buffer(eb)
-                break
+        eb = None
+        if buffer_name.isdigit():
+            eb = self.editor_buffers.get_by_number(int(buffer_name))
+        if eb is None:
+            eb = self.editor_buffers.get_by_location(
+                pathlib.Path(buffer_name).expanduser().absolute())
+
+        if eb is None:
+            query = buffer_name.lower()
+            matches = [b for b in self.editor_buffers
+                       if b.location is not None and query in str(b.location).lower()]
+
+            # Several matches: prefer the one whose name (or location) starts
+            # with the query. ('a.txt' rather than 'aa.txt'.)
+            if len(matches) > 1:
+                matches = [b for b in matches if b.location.name.lower().startswith(query) or
+                           str(b.location).lower().startswith(query)] or matches
+
+            if not matches:
+                return 'E94: No matching buffer for %s' % buffer_name
+            if len(matches) > 1:
+                return 'E93: More than one match for %s' % buffer_name
+            eb = matches[0]
+
+        self.show_editor_buffer(eb)
+        return None
 
     def _add_editor_buffer(self, editor_buffer, show_in_current_window=False):
         """
-        Insert this new buffer in the list of buffers, right after the active
-        one.
+        Append this new buffer to the list of buffers. (Like Vim, which gives
+        every new buffer the next buffer number.)
         """
         assert isinstance(
             editor_buffer, EditorBuffer) and editor_buffer not in self.editor_buffers
 
         # Add to list of EditorBuffers
-        try:
-            eb = self.active_editor_buffer
-            # Append right after the currently active one.
-            try:
-                index = self.editor_buffers.index(eb)
-            except ValueError:
-                index = 0
-            self.editor_buffers.insert(index, editor_buffer)
-        except:
-            self.editor_buffers.append(editor_buffer)
+        self.editor_buffers.add(editor_buffer)
 
         # When there are no tabs/windows yet, create one for this buffer.
         if self.tab_pages == []:
@@ -236,15 +260,17 @@ class WindowArrangement(object):
         if show_in_current_window and self.active_tab:
             self.active_tab.show_editor_buffer(editor_buffer)
 
-        # Start reporter.
+        # Start reporter. (Lazy buffers start it when they are loaded.)
         editor_buffer.run_reporter()
 
-    def _get_or_create_editor_buffer(self, location: Optional[pathlib.Path] = None, text=None):
+    def _get_or_create_editor_buffer(self, location: Optional[pathlib.Path] = None, text=None,
+                                     lazy=False):
         """
         Given a location, return the `EditorBuffer` instance that we have if
         the file is already open, or create a new one.
 
         When location is None, this creates a new buffer.
+        When `lazy` is True, a new buffer is only read once it's displayed.
         """
         # assert location is None or text is None  # Don't pass two of them.
         # assert location is None or isinstance(location, pathlib.Path)
@@ -257,7 +283,7 @@ class WindowArrangement(object):
                 # Not found? Create one.
                 if eb is None:
                     # Create and add EditorBuffer
-                    eb = EditorBuffer(location)
+                    eb = EditorBuffer(location, lazy=lazy)
                     self._add_editor_buffer(eb)
 
                     return eb
@@ -275,15 +301,21 @@ class WindowArrangement(object):
             case _:
                 raise RuntimeError()
 
-    def open_buffer(self, location: Optional[pathlib.Path] = None, show_in_current_window=False):
+    def open_buffer(self, location: Optional[pathlib.Path] = None, show_in_current_window=False,
+                    lazy=False) -> EditorBuffer:
         """
         Open/create a file, load it, and show it in a new buffer.
+        Returns the `EditorBuffer`.
+
+        When `lazy` is True, the file is only read once it's displayed.
         """
-        eb = self._get_or_create_editor_buffer(location)
+        eb = self._get_or_create_editor_buffer(location, lazy=lazy)
 
         if show_in_current_window:
             self.show_editor_buffer(eb)
 
+        return eb
+
     def _auto_close_new_empty_buffers(self):
         """
         When there are new, empty buffers open. (Like, created when the editor
@@ -299,9 +331,43 @@ class WindowArrangement(object):
             ebs |= set(t.visible_editor_buffers())
 
         # Remove empty/new buffers that are hidden.
-        for eb in self.editor_buffers[:]:
+        for eb in list(self.editor_buffers):
             if eb.is_new and not eb.location and eb not in ebs and eb.buffer.text == '':
-                self.editor_buffers.remove(eb)
+                self._remove_editor_buffer(eb)
+
+    def _remove_editor_buffer(self, editor_buffer: EditorBuffer):
+        """
+        Remove this buffer from the list of buffers.
+        """
+        self.editor_buffers.remove(editor_buffer)
+
+        from pyvim.event_dispatcher import DISPATCHER, EventType
+        DISPATCHER.enqueue(EventType.CloseEditorBuffer, editor_buffer)
+
+    def unload_hidden_buffers(self, budget: int):
+        """
+        When the buffers use more than `budget` bytes, unload the hidden
+        buffers without changes, starting with the least recently shown one,
+        until the memory usage is within the budget again.
+        (A budget of zero means no limit.)
+        """
+        if not budget or self.editor_buffers.memory_usage() <= budget:
+            return
+
+        visible_ebs = set()
+        for t in self.tab_pages:
+            visible_ebs |= set(t.visible_editor_buffers())
+
+        candidates = sorted(
+            (eb for eb in self.editor_buffers
+             if eb.is_loaded and eb not in visible_ebs and eb.location is not None
+             and not eb.is_new and not eb.has_unsaved_changes),
+            key=lambda eb: eb.last_shown)
+
+        for eb in candidates:
+            if self.editor_buffers.memory_usage() <= budget:
+                break
+            eb.unload()
 
     def close_buffer(self):
         """
@@ -312,9 +378,9 @@ class WindowArrangement(object):
         assert(isinstance(self.active_tab_index, int))
         eb = self.active_editor_buffer
 
-        # Remove this buffer.
-        index = self.editor_buffers.index(eb)
-        self.editor_buffers.remove(eb)
+        # Remove this buffer. (Remember the previous one first.)
+        previous_eb = self.editor_buffers.previous(eb)
+        self._remove_editor_buffer(eb)
 
         # Close the active window.
         self.active_tab.close_active_window()
@@ -336,9 +402,7 @@ class WindowArrangement(object):
 
             if len(self.editor_buffers) > 0:
                 # Open the previous buffer.
-                new_index = (len(self.editor_buffers) + index -
-                             1) % len(self.editor_buffers)
-                eb = self.editor_buffers[new_index]
+                eb = previous_eb
 
                 # Create a window for this buffer.
                 self.tab_pages.append(tab_page.TabPage(tab_page.TabWindow(eb)))
@@ -348,17 +412,20 @@ class WindowArrangement(object):
                 # automatically.)
                 eb = self._get_or_create_editor_buffer()
 
-    def create_tab(self, location=None):
+    def create_tab(self, location=None, lazy=False) -> EditorBuffer:
         """
         Create a new tab page.
+        Returns the `EditorBuffer` that is shown in there.
         """
         assert(isinstance(self.active_tab_index, int))
-        eb = self._get_or_create_editor_buffer(location)
+        eb = self._get_or_create_editor_buffer(location, lazy=lazy)
 
         self.tab_pages.insert(self.active_tab_index + 1,
                               tab_page.TabPage(tab_page.TabWindow(eb)))
         self.active_tab_index += 1
 
+        return eb
+
     def list_open_buffers(self) -> List[OpenBufferInfo]:
         """
         Return a `OpenBufferInfo` list that gives information about the
@@ -367,56 +434,138 @@ class WindowArrangement(object):
         active_eb = self.active_editor_buffer
         visible_ebs = self.active_tab.visible_editor_buffers()
 
-        def make_info(i, eb):
+        def make_info(eb):
             return OpenBufferInfo(
-                index=i,
+                index=eb.number,
                 editor_buffer=eb,
                 is_active=(eb == active_eb),
                 is_visible=(eb in visible_ebs))
 
-        return [make_info(i, eb) for i, eb in enumerate(self.editor_buffers)]
+        return [make_info(eb) for eb in self.editor_buffers]
 
-    def get_window(self, eb: EditorBuffer) -> prompt_toolkit.layout.Window:
-        return self._frames[eb].window
+    def get_window(self, window: tab_page.TabWindow) -> prompt_toolkit.layout.Window:
+        """
+        The prompt_toolkit `Window` of this window. (After `update`.)
+        """
+        return self._frames[window].window
+
+    def get_vertical_scroll(self, window: tab_page.TabWindow) -> int:
+        """
+        The vertical scroll offset of this window.
+        """
+        editor_window = self._frames.get(window)
+        if editor_window is None:
+            return window.vertical_scroll
+        return editor_window.window.vertical_scroll
 
     def update(self):
         """
         Update layout to match the layout as described in the
         WindowArrangement.
+
+        This reconciles the prompt_toolkit containers with the tree of the
+        active tab page: the containers of the previous update are reused, and
+        only the splits of which the children changed are touched. When
+        nothing changed (after `:set` or `:w`, for instance), the layout is
+        left alone. The containers of the `FRAME_CACHE_TABS` most recently
+        visited tab pages are kept, so switching tabs doesn't rebuild them.
         """
+        now = time.monotonic()
+        changed = False
+
+        def get_vertical_border_char():
+            " Return the character to be used for the vertical border. "
+            return _try_char('\u2502', '|', get_app().output.encoding())
 
-        # Start with an empty frames list everytime, to avoid memory leaks.
-        existing_frames = self._frames
-        self._frames = {}
+        def reconcile(node) -> prompt_toolkit.layout.Container:
+            nonlocal changed
 
-        def create_layout_from_node(node) -> Union[prompt_toolkit.layout.containers.Window, prompt_toolkit.layout.containers.HSplit, prompt_toolkit.layout.containers.VSplit]:
-            from . import tab_page
             if isinstance(node, tab_page.TabWindow):
-                # Create frame for Window, or reuse it, if we had one already.
-                editor_window = existing_frames.get(node.editor_buffer)
-                if not editor_window:
+                # Read the file, when it's displayed for the first time.
+                node.editor_buffer.load()
+                node.editor_buffer.last_shown = now
+
+                # Create frame for Window, or reuse it, if we had one already
+                # for the same buffer.
+                editor_window = self._frames.get(node)
+                if editor_window is None or editor_window.buffer is not node.editor_buffer.buffer:
                     editor_window = EditorWindow(
                         self.searchline.search_control, node.editor_buffer)
+                    editor_window.window.vertical_scroll = node.vertical_scroll
+                    self._frames[node] = editor_window
+                    changed = True
 
-                self._frames[node.editor_buffer] = editor_window
                 return editor_window.window
 
-            if isinstance(node, tab_page.TabVSplit):
-                def get_vertical_border_char():
-                    " Return the character to be used for the vertical border. "
-                    return _try_char('\u2502', '|', get_app().output.encoding())
-
-                return prompt_toolkit.layout.VSplit(
-                    [create_layout_from_node(n) for n in node.children],
-                    padding=1,
-                    padding_char=get_vertical_border_char(),
-                    padding_style='class:frameborder')
-
-            if isinstance(node, tab_page.TabHSplit):
-                return prompt_toolkit.layout.HSplit([create_layout_from_node(n) for n in node.children])
+            if isinstance(node, (tab_page.TabVSplit, tab_page.TabHSplit)):
+                children = [reconcile(n) for n in node.children]
+
+                # Reuse the container of this split, if we had one already.
+                # Only replace the children when they changed.
+                container = self._split_containers.get(node)
+                if container is None:
+                    if isinstance(node, tab_page.TabVSplit):
+                        container = prompt_toolkit.layout.VSplit(
+                            children,
+                            padding=1,
+                            padding_char=get_vertical_border_char(),
+                            padding_style='class:frameborder')
+                    else:
+                        container = prompt_toolkit.layout.HSplit(children)
+                    self._split_containers[node] = container
+                    changed = True
+                elif not _same_items(container.children, children):
+                    container.children = children
+                    changed = True
+
+                return container
 
             raise RuntimeError()
 
-        assert(self.active_tab)
-        self.container.children = [create_layout_from_node(
-            self.active_tab.root)]
+        tab = self.active_tab
+        if not self._recent_tabs or self._recent_tabs[-1] is not tab:
+            if tab in self._recent_tabs:
+                self._recent_tabs.remove(tab)
+            self._recent_tabs.append(tab)
+            changed = True
+
+        root = reconcile(tab.root)
+        if not _same_items(self.container.children, [root]):
+            self.container.children = [root]
+
+        # Forget the containers of closed windows and tabs, and of the tabs
+        # that were not visited recently, to avoid memory leaks.
+        if changed:
+            self._prune_frames()
+
+    def _prune_frames(self):
+        """
+        Only keep the frames and split containers of the `FRAME_CACHE_TABS`
+        most recently visited tab pages that are still open.
+        """
+        open_tabs = set(self.tab_pages)
+        self._recent_tabs = [t for t in self._recent_tabs if t in open_tabs]
+        del self._recent_tabs[:-FRAME_CACHE_TABS]
+
+        windows = set()
+        splits = set()
+        for t in self._recent_tabs:
+            windows.update(t.windows())
+            splits.update(t.splits())
+
+        # (Remember the scroll offset of the windows in tabs that are still
+        # open.)
+        for w, f in self._frames.items():
+            if w not in windows:
+                w.vertical_scroll = f.window.vertical_scroll
+
+        self._frames = {w: f for w, f in self._frames.items() if w in windows}
+        self._split_containers = {
+            s: c for s, c in self._split_containers.items() if s in splits}
+
+
+def _same_items(list1, list2) -> bool:
+    """
+    True when both lists contain the same objects, in the same order.
+    """
+    return len(list1) == len(list2) and all(a is b for a, b in zip(list1, list2))
@@ -0,0 +1,211 @@
+from typing import Dict, Iterator, List, Optional, Set
+import itertools
+import pathlib
+from prompt_toolkit.buffer import Buffer
+from .editor_buffer import EditorBuffer
+from ..fuzzy import FuzzyIndex
+
+__all__ = (
+    'BufferRegistry',
+)
+
+
+class BufferRegistry(object):
+    """
+    The ordered collection of open `EditorBuffer` instances.
+
+    Buffers can be found by location, by prompt_toolkit `Buffer` and by
+    buffer number through dictionaries that are kept in sync when buffers
+    are added and removed. The order is kept in a circular doubly linked
+    list, so that appending, removing and going to the next or previous
+    buffer don't depend on the number of open buffers.
+
+    The locations are also indexed for fuzzy matching (`match`), for the
+    completion of ``:b`` and the buffer list. That index is created when it's
+    needed, and dropped when a buffer is added, removed or renamed.
+
+    The total memory usage of the buffers is kept as well. (For unloading
+    hidden buffers.) Only the buffers that were loaded, unloaded or changed
+    are measured again.
+    """
+
+    def __init__(self):
+        self._first: Optional[EditorBuffer] = None
+        self._next: Dict[EditorBuffer, EditorBuffer] = {}
+        self._previous: Dict[EditorBuffer, EditorBuffer] = {}
+
+        self._by_location: Dict[pathlib.Path, EditorBuffer] = {}
+        self._by_buffer: Dict[Buffer, EditorBuffer] = {}
+        self._by_number: Dict[int, EditorBuffer] = {}
+
+        # The keys under which every EditorBuffer is indexed. (The location
+        # changes when a buffer is written elsewhere. The prompt_toolkit
+        # `Buffer` is created lazily, and dropped when a buffer is unloaded.)
+        self._locations: Dict[EditorBuffer, pathlib.Path] = {}
+        self._buffers: Dict[EditorBuffer, Buffer] = {}
+
+        self._numbers = itertools.count()
+
+        # `FuzzyIndex` of the locations, and the buffers by location (as a
+        # string). None when it has to be created again.
+        self._name_index: Optional[FuzzyIndex] = None
+        self._by_name: Dict[str, EditorBuffer] = {}
+
+        # The last measured memory usage of every buffer, their sum, and the
+        # buffers that have to be measured again.
+        self._memory_usage: Dict[EditorBuffer, int] = {}
+        self._memory_total = 0
+        self._changed: Set[EditorBuffer] = set()
+
+    def __len__(self) -> int:
+        return len(self._next)
+
+    def __contains__(self, editor_buffer) -> bool:
+        return editor_buffer in self._next
+
+    def __iter__(self) -> Iterator[EditorBuffer]:
+        eb = self._first
+        for _ in range(len(self._next)):
+            yield eb
+            eb = self._next[eb]
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, list(self))
+
+    @property
+    def first(self) -> Optional[EditorBuffer]:
+        return self._first
+
+    def add(self, editor_buffer: EditorBuffer):
+        """
+        Append this buffer. It receives a new buffer number.
+        """
+        assert editor_buffer not in self
+
+        if self._first is None:
+            self._first = editor_buffer
+            self._next[editor_buffer] = editor_buffer
+            self._previous[editor_buffer] = editor_buffer
+        else:
+            last = self._previous[self._first]
+            self._next[last] = editor_buffer
+            self._previous[editor_buffer] = last
+            self._next[editor_buffer] = self._first
+            self._previous[self._first] = editor_buffer
+
+        editor_buffer.number = next(self._numbers)
+        self._by_number[editor_buffer.number] = editor_buffer
+        self._index_location(editor_buffer)
+        self._index_buffer(editor_buffer)
+
+        editor_buffer.on_location_changed += self._index_location
+        editor_buffer.on_buffer_changed += self._index_buffer
+
+    def remove(self, editor_buffer: EditorBuffer):
+        """
+        Remove this buffer.
+        """
+        previous = self._previous.pop(editor_buffer)
+        following = self._next.pop(editor_buffer)
+
+        if previous is editor_buffer:
+            self._first = None
+        else:
+            self._next[previous] = following
+            self._previous[following] = previous
+            if self._first is editor_buffer:
+                self._first = following
+
+        del self._by_number[editor_buffer.number]
+        self._name_index = None
+        self._unindex_location(editor_buffer)
+        self._unindex_buffer(editor_buffer)
+        self._memory_total -= self._memory_usage.pop(editor_buffer, 0)
+        self._changed.discard(editor_buffer)
+
+        editor_buffer.on_location_changed -= self._index_location
+        editor_buffer.on_buffer_changed -= self._index_buffer
+
+    def next(self, editor_buffer: EditorBuffer) -> EditorBuffer:
+        """ The buffer after this one. (Wraps around.) """
+        return self._next[editor_buffer]
+
+    def previous(self, editor_buffer: EditorBuffer) -> EditorBuffer:
+        """ The buffer before this one. (Wraps around.) """
+        return self._previous[editor_buffer]
+
+    def get_by_location(self, location: pathlib.Path) -> Optional[EditorBuffer]:
+        return self._by_location.get(location)
+
+    def get_by_buffer(self, buffer: Buffer) -> Optional[EditorBuffer]:
+        return self._by_buffer.get(buffer)
+
+    def get_by_number(self, number: int) -> Optional[EditorBuffer]:
+        return self._by_number.get(number)
+
+    def memory_usage(self) -> int:
+        """
+        The memory used by all the buffers, in bytes. (See
+        `EditorBuffer.memory_usage`.)
+        """
+        while self._changed:
+            eb = self._changed.pop()
+            usage = eb.memory_usage()
+            self._memory_total += usage - self._memory_usage.get(eb, 0)
+            self._memory_usage[eb] = usage
+        return self._memory_total
+
+    def match(self, query: str, limit: Optional[int] = None) -> List[EditorBuffer]:
+        """
+        Return the buffers whose location matches the query (see
+        `pyvim.fuzzy`), best matches first. When the query is a buffer number,
+        that buffer comes first. An empty query matches all the buffers.
+        """
+        if not query:
+            return list(itertools.islice(self, limit))
+
+        if self._name_index is None:
+            self._by_name = {str(eb.location): eb for eb in self if eb.location is not None}
+            self._name_index = FuzzyIndex(list(self._by_name))
+
+        result = [self._by_name[name] for name in self._name_index.filter(query, limit)]
+
+        if query.isdigit():
+            eb = self._by_number.get(int(query))
+            if eb is not None:
+                if eb in result:
+                    result.remove(eb)
+                result.insert(0, eb)
+                if limit is not None:
+                    del result[limit:]
+        return result
+
+    def _index_location(self, editor_buffer: EditorBuffer):
+        self._name_index = None
+        self._unindex_location(editor_buffer)
+        if editor_buffer.location is not None:
+            self._locations[editor_buffer] = editor_buffer.location
+            self._by_location[editor_buffer.location] = editor_buffer
+
+    def _unindex_location(self, editor_buffer: EditorBuffer):
+        location = self._locations.pop(editor_buffer, None)
+        if location is not None and self._by_location.get(location) is editor_buffer:
+            del self._by_location[location]
+
+    def _index_buffer(self, editor_buffer: EditorBuffer):
+        self._unindex_buffer(editor_buffer)
+        self._changed.add(editor_buffer)  # (Loaded or unloaded.)
+        buffer = editor_buffer._buffer
+        if buffer is not None:
+            self._buffers[editor_buffer] = buffer
+            self._by_buffer[buffer] = editor_buffer
+            buffer.on_text_changed += self._text_changed
+
+    def _unindex_buffer(self, editor_buffer: EditorBuffer):
+        buffer = self._buffers.pop(editor_buffer, None)
+        if buffer is not None:
+            del self._by_buffer[buffer]
+            buffer.on_text_changed -= self._text_changed
+
+    def _text_changed(self, buffer: Buffer):
+        self._changed.add(self._by_buffer[buffer])
@@ -1,12 +1,14 @@
-from typing import Optional, NamedTuple
+from typing import Dict, List, Optional, NamedTuple
 import logging
 import pathlib
 import os
+import sys
 from asyncio import get_event_loop
 from prompt_toolkit.application.current import get_app
 from prompt_toolkit.buffer import Buffer
 from prompt_toolkit.document import Document
 from prompt_toolkit import __version__ as ptk_version
+from prompt_toolkit.utils import Event
 from pyvim.completion import DocumentCompleter
 from pyvim.reporting import report
 logger = logging.getLogger(__name__)
@@ -25,7 +27,13 @@ class EditorBuffer(object):
     etc... This wrapper contains the necessary data for the editor.
     """
 
-    def __init__(self, location: Optional[pathlib.Path] = None, text: Optional[str] = None):
+    def __init__(self, location: Optional[pathlib.Path] = None, text: Optional[str] = None,
+                 lazy: bool = False):
+        """
+        :param lazy: When True, don't read the file yet. Only the location is
+            kept, until `load` is called. (When the buffer is displayed for
+            the first time.)
+        """
         assert not (location and text)
 
         self.location = location
@@ -37,28 +45,145 @@ class EditorBuffer(object):
         # Empty if not in file explorer mode, directory path otherwise.
         self.isdir = False
 
+        #: is_loaded: False as long as the file was not read.
+        self.is_loaded = not (lazy and location)
+
+        #: Buffer number. (Assigned when the buffer is added to the
+        #: `BufferRegistry`.)
+        self.number: Optional[int] = None
+
+        #: Fired when the buffer is written to another location.
+        self.on_location_changed = Event(self)
+
+        #: Fired when the prompt_toolkit `Buffer` is created or dropped.
+        self.on_buffer_changed = Event(self)
+
+        #: Time when this buffer was displayed for the last time. (For
+        #: unloading the least recently used hidden buffers.)
+        self.last_shown = 0.0
+
+        # Cursor position to restore when the buffer is loaded again.
+        self._unloaded_cursor_position = 0
+
+        #: Marks. Mapping from the mark name to a cursor position. (Set with
+        #: `m{a-z}`, and '<' and '>' for the last visual selection.)
+        self.marks: Dict[str, int] = {}
+
         # Read text.
-        if location:
+        if location and self.is_loaded:
             text = self._read(location)
         else:
             text = text or ''
 
         self._file_content = text
 
-        # Create Buffer.
-        self.buffer = Buffer(
+        # Create Buffer. (For buffers that are not loaded, this is postponed
+        # until it's accessed.)
+        self._buffer: Optional[Buffer] = None
+        if self.is_loaded:
+            self._buffer = self._create_buffer(text)
+
+        # List of reporting errors.
+        self.report_errors = []
+        self._reporter_is_running = False
+
+        if self.is_loaded:
+            from pyvim.event_dispatcher import DISPATCHER, EventType
+            DISPATCHER.enqueue(EventType.NewEditorBuffer, self)
+
+    def _create_buffer(self, text: str) -> Buffer:
+        return Buffer(
             multiline=True,
             completer=DocumentCompleter(self),
             document=Document(text, 0),
             on_text_changed=lambda _: self.run_reporter())
 
-        # List of reporting errors.
-        self.report_errors = []
-        self._reporter_is_running = False
+    @property
+    def buffer(self) -> Buffer:
+        """
+        The prompt_toolkit `Buffer`.
+        """
+        if self._buffer is None:
+            self._buffer = self._create_buffer('')
+            self.on_buffer_changed.fire()
+        return self._buffer
+
+    def load(self):
+        """
+        Read the file of a buffer that was created with `lazy=True`, or that
+        was unloaded. (Does nothing when the buffer was loaded already.)
+        """
+        if self.is_loaded:
+            return
+
+        self.is_loaded = True
+        text = self._read(self.location)
+        self._file_content = text
+
+        # Setting the document triggers `run_reporter`.
+        self.buffer.document = Document(
+            text, min(self._unloaded_cursor_position, len(text)))
 
         from pyvim.event_dispatcher import DISPATCHER, EventType
         DISPATCHER.enqueue(EventType.NewEditorBuffer, self)
 
+    def unload(self):
+        """
+        Free the text, undo history and reporter errors of this buffer. The
+        file will be read again by `load`, when the buffer is displayed. Only
+        the cursor position is kept.
+
+        This is only possible for files without unsaved changes, and not while
+        the reporter runs in a thread. (It would set its errors afterwards.)
+        """
+        if (not self.is_loaded or self.location is None or self.is_new or
+                self._reporter_is_running):
+            return
+        assert not self.has_unsaved_changes
+
+        self._unloaded_cursor_position = self.buffer.cursor_position
+        self.is_loaded = False
+        self._buffer = None
+        self._file_content = ''
+        self.report_errors = []
+        self.on_buffer_changed.fire()
+
+    def memory_usage(self) -> int:
+        """
+        Estimate of the memory used by this buffer, in bytes. This counts the
+        text, the content of the file as it was read, the undo history and the
+        reporter errors. (Strings that are shared are counted only once.)
+        """
+        if not self.is_loaded:
+            return 0
+
+        buffer = self.buffer
+        texts = {id(buffer.text): buffer.text, id(self._file_content): self._file_content}
+        # (The undo stacks are private in prompt_toolkit. Tested with 3.0.52;
+        # when they are renamed, the undo history is not counted.)
+        for stack in (getattr(buffer, '_undo_stack', ()), getattr(buffer, '_redo_stack', ())):
+            for text, _ in stack:
+                texts[id(text)] = text
+
+        return (sum(sys.getsizeof(t) for t in texts.values()) +
+                sum(sys.getsizeof(e) for e in self.report_errors))
+
+    @property
+    def cursor_position(self) -> int:
+        """
+        Cursor position. (Also for buffers that are not loaded.)
+        """
+        if self.is_loaded:
+            return self.buffer.cursor_position
+        return self._unloaded_cursor_position
+
+    @cursor_position.setter
+    def cursor_position(self, value: int):
+        if self.is_loaded:
+            self.buffer.cursor_position = min(value, len(self.buffer.text))
+        else:
+            self._unloaded_cursor_position = value
+
     @property
     def filetype(self) -> str:
         if not self.location:
@@ -70,6 +195,8 @@ class EditorBuffer(object):
         """
         True when some changes are not yet written to file.
         """
+        if not self.is_loaded:
+            return False
         return self._file_content != self.buffer.text
 
     @property
@@ -122,6 +249,10 @@ class EditorBuffer(object):
         """
         Reload file again from storage.
         """
+        if not self.is_loaded:
+            self.load()
+            return
+
         text = self._read(self.location)
         cursor_position = min(self.buffer.cursor_position, len(text))
 
@@ -132,30 +263,67 @@ class EditorBuffer(object):
         """
         Write file to I/O backend.
         """
+        from pyvim.editor import get_editor
+        text = self.prepare_write(location)
+        try:
+            self.write_text(text)
+        except Exception as e:
+            # E.g. "No such file or directory."
+            get_editor().show_message('%s' % e)
+        else:
+            self.written(text)
+
+    def prepare_write(self, location=None) -> str:
+        """
+        First step of `write`: set the new location (if given) and return the
+        text to be written by `write_text`.
+        """
+        # Never write the empty text of a buffer that wasn't read.
+        self.load()
+
         # Take location and expand tilde.
         if location is not None:
-            self.location = location
+            location = pathlib.Path(location).expanduser().absolute()
+            if location != self.location:
+                self.location = location
+                self.on_location_changed.fire()
         assert self.location
+        return self.buffer.text
 
-        # Find I/O backend that handles this location.
+    def write_text(self, text: str) -> None:
+        """
+        Write this text with the I/O backend that handles the location. (This
+        doesn't touch the buffer, so it can be called in a thread, like in
+        `:wa`.) Raises an exception when writing fails.
+        """
         from pyvim.editor import get_editor
-        editor = get_editor()
-        for io in editor.io_backends:
+        for io in get_editor().io_backends:
             if io.can_open_location(self.location):
-                break
-        else:
-            editor.show_message('Unknown location: %r' % location)
+                io.write(self.location, text + '\n', self.encoding)
+                return
+        raise IOError('Unknown location: %s' % self.location)
 
-        # Write it.
-        try:
-            io.write(self.location, self.buffer.text + '\n', self.encoding)
-            self.is_new = False
-        except Exception as e:
-            # E.g. "No such file or directory."
-            editor.show_message('%s' % e)
-        else:
-            # When the save succeeds: update: _file_content.
-            self._file_content = self.buffer.text
+    def written(self, text: str) -> None:
+        """
+        Last step of `write`, after `write_text` succeeded.
+        """
+        self.is_new = False
+        self._file_content = text
+
+    def get_errors_for_line(self, lineno: int) -> List:
+        """
+        The reporter errors and the errors of the last ':make' on this line.
+        (Zero based.)
+        """
+        errors = [e for e in self.report_errors if e.lineno == lineno]
+
+        if self.location is not None:
+            from pyvim.editor import get_editor
+            diagnostics = get_editor().diagnostics.get(self.location)
+            if diagnostics:
+                errors.extend(diagnostics.get(lineno, ()))
+
+        return errors
 
     def get_display_name(self, short=False):
         """
@@ -169,13 +337,21 @@ class EditorBuffer(object):
             return str(self.location)
 
     def __repr__(self):
+        if not self.is_loaded:
+            return '%s(location=%r, not loaded)' % (self.__class__.__name__, self.location)
         return '%s(buffer=%r)' % (self.__class__.__name__, self.buffer)
 
     def run_reporter(self):
         " Buffer text changed. "
-        if not self._reporter_is_running:
-            self._reporter_is_running = True
+        if not self.is_loaded:
+            return
 
+        # Run the reporter only once for a batch of edits.
+        from pyvim.editor import get_editor
+        if get_editor().call_after_batch(self.run_reporter):
+            return
+
+        if not self._reporter_is_running:
             text = self.buffer.text
             self.report_errors = []
 
@@ -184,6 +360,8 @@ class EditorBuffer(object):
             if self.location is None:
                 return
 
+            self._reporter_is_running = True
+
             # Better not to access the document in an executor.
             document = self.buffer.document
 
@@ -35,7 +35,12 @@ def create_buffer_control(search_control, editor_buffer: EditorBuffer):
     editor = get_editor()
 
     from ..editor_root.reporting_processor import ReportingProcessor
+    from ..editor_root.substitute_preview_processor import SubstitutePreviewProcessor
     input_processors = [
+        # Preview of ':s'. (First, because it works on the columns of the
+        # text.)
+        SubstitutePreviewProcessor(editor_buffer),
+
         # Processor for visualising spaces. (should come before the
         # selection processor, otherwise, we won't see these spaces
         # selected.)
@@ -90,6 +95,9 @@ class EditorWindow:
         from pyvim.editor import get_editor
         editor = get_editor()
 
+        #: The prompt_toolkit `Buffer` that is displayed.
+        self.buffer = editor_buffer.buffer
+
         def get_line_prefix(buffer, line_number, wrap_count):
             if wrap_count > 0:
                 result = []
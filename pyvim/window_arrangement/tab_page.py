@@ -1,9 +1,18 @@
-from typing import Optional, Iterable, Tuple, List
+from typing import Dict, Optional, List
+import itertools
 from .editor_buffer import EditorBuffer
 
 
 class TabNode:
-    pass
+    """
+    Node in the window tree of a tab page. Every node has a stable ID, and
+    knows its parent split. (The root split has no parent.)
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self) -> None:
+        self.id = next(TabNode._ids)
+        self.parent: Optional['TabSplit'] = None
 
 
 class TabWindow(TabNode):
@@ -13,16 +22,50 @@ class TabWindow(TabNode):
 
     def __init__(self, editor_buffer: EditorBuffer):
         assert isinstance(editor_buffer, EditorBuffer)
+        super().__init__()
         self.editor_buffer = editor_buffer
 
+        #: Vertical scroll offset, for when the prompt_toolkit `Window` is
+        #: created. (When it's restored from a session, or when the `Window`
+        #: was dropped from the cache.)
+        self.vertical_scroll = 0
+
     def __repr__(self):
-        return '%s(editor_buffer=%r)' % (self.__class__.__name__, self.editor_buffer)
+        return '%s(id=%r, editor_buffer=%r)' % (
+            self.__class__.__name__, self.id, self.editor_buffer)
 
 
 class TabSplit(TabNode):
-    def __init__(self, *window: TabWindow) -> None:
+    """
+    Split. The children should only be changed through the methods of this
+    class, which keep the parent links up to date.
+    """
+
+    def __init__(self, *window: TabNode) -> None:
         super().__init__()
-        self.children: List[TabNode] = list(window)
+        self.children: List[TabNode] = []
+        for w in window:
+            self.insert(len(self.children), w)
+
+    def __repr__(self):
+        return '%s(id=%r, children=%r)' % (
+            self.__class__.__name__, self.id, self.children)
+
+    def insert(self, index: int, node: TabNode):
+        self.children.insert(index, node)
+        node.parent = self
+
+    def remove(self, node: TabNode) -> int:
+        """ Remove this child. Return the index it had. """
+        index = self.children.index(node)
+        del self.children[index]
+        node.parent = None
+        return index
+
+    def replace(self, old: TabNode, new: TabNode):
+        self.children[self.children.index(old)] = new
+        old.parent = None
+        new.parent = self
 
 
 class TabHSplit(TabSplit):
@@ -34,17 +77,39 @@ class TabVSplit(TabSplit):
     """ Horizontal split. """
 
 
+def _first_window(node: TabNode) -> TabWindow:
+    """ The first window in this subtree. """
+    while isinstance(node, TabSplit):
+        node = node.children[0]
+    assert isinstance(node, TabWindow)
+    return node
+
+
 class TabPage(object):
     """
     Tab page. Container for windows.
+
+    Next to the tree of splits and windows, the tab page keeps an index of
+    its windows by ID and by `EditorBuffer`. Together with the parent links,
+    this keeps splitting, closing and moving the focus independent of the
+    number of windows.
     """
 
-    def __init__(self, window: TabWindow):
-        self.root = TabVSplit(window)
+    def __init__(self, window: TabWindow, root: Optional[TabSplit] = None):
+        """
+        :param root: Split tree that contains `window`. (When restoring a
+            session.) By default, the tab page contains only `window`.
+        """
+        self.root = root or TabVSplit(window)
 
         # Keep track of which window is focusesd in this tab.
         self._active_window: Optional[TabWindow] = window
 
+        self._windows_by_id: Dict[int, TabWindow] = {}
+        self._windows_by_buffer: Dict[EditorBuffer, List[TabWindow]] = {}
+        for w in self.windows():
+            self._index_window(w)
+
     @property
     def active_window(self) -> TabWindow:
         assert(self._active_window)
@@ -52,55 +117,58 @@ class TabPage(object):
 
     def windows(self) -> List[TabWindow]:
         """ Return a list of all windows in this tab page. """
-        return [window for _, window in self._walk_through_windows()]
+        result = []
 
-    def window_count(self) -> int:
-        """ The amount of windows in this tab. """
-        return len(self.windows())
+        def walk(split: TabSplit):
+            for c in split.children:
+                if isinstance(c, TabSplit):
+                    walk(c)
+                elif isinstance(c, TabWindow):
+                    result.append(c)
 
-    def visible_editor_buffers(self) -> List[EditorBuffer]:
-        """
-        Return a list of visible `EditorBuffer` instances.
-        """
-        return [w.editor_buffer for w in self.windows()]
+        walk(self.root)
+        return result
 
-    def _walk_through_windows(self):
-        """
-        Yields (Split, Window) tuples.
-        """
-        def walk(split: TabSplit) -> Iterable[Tuple[TabSplit, TabWindow]]:
+    def splits(self) -> List[TabSplit]:
+        """ Return a list of all splits in this tab page, including the root. """
+        result = []
+
+        def walk(split: TabSplit):
+            result.append(split)
             for c in split.children:
-                if isinstance(c, (TabHSplit, TabVSplit)):
-                    for i in walk(c):
-                        yield i
-                elif isinstance(c, TabWindow):
-                    yield split, c
+                if isinstance(c, TabSplit):
+                    walk(c)
+
+        walk(self.root)
+        return result
+
+    def window_count(self) -> int:
+        """ The amount of windows in this tab. """
+        return len(self._windows_by_id)
 
-        return walk(self.root)
+    def get_window_by_id(self, window_id: int) -> Optional[TabWindow]:
+        return self._windows_by_id.get(window_id)
 
-    def _walk_through_splits(self):
+    def windows_for_editor_buffer(self, editor_buffer: EditorBuffer) -> List[TabWindow]:
+        """ Return the windows in this tab that show this `EditorBuffer`. """
+        return list(self._windows_by_buffer.get(editor_buffer, []))
+
+    def visible_editor_buffers(self) -> List[EditorBuffer]:
         """
-        Yields (parent_split, child_plit) tuples.
+        Return a list of visible `EditorBuffer` instances.
         """
-        def walk(split: TabSplit) -> Iterable[Tuple[TabSplit, TabSplit]]:
-            for c in split.children:
-                if isinstance(c, (TabHSplit, TabVSplit)):
-                    yield split, c
-                    for i in walk(c):
-                        yield i
-
-        return walk(self.root)
+        return list(self._windows_by_buffer)
 
-    def _get_active_split(self) -> TabSplit:
-        for split, window in self._walk_through_windows():
-            if window == self._active_window:
-                return split
-        raise Exception('active_window not found. Something is wrong.')
+    def _index_window(self, window: TabWindow):
+        self._windows_by_id[window.id] = window
+        self._windows_by_buffer.setdefault(window.editor_buffer, []).append(window)
 
-    def _get_split_parent(self, split) -> Optional[TabSplit]:
-        for parent, child in self._walk_through_splits():
-            if child == split:
-                return parent
+    def _unindex_window(self, window: TabWindow):
+        del self._windows_by_id[window.id]
+        windows = self._windows_by_buffer[window.editor_buffer]
+        windows.remove(window)
+        if not windows:
+            del self._windows_by_buffer[window.editor_buffer]
 
     def _split(self, split_cls: type, editor_buffer: Optional[EditorBuffer] = None):
         """
@@ -112,17 +180,23 @@ class TabPage(object):
             editor_buffer = self._active_window.editor_buffer
         assert(editor_buffer)
 
-        active_split = self._get_active_split()
-        index = active_split.children.index(self._active_window)
+        active_split = self._active_window.parent
+        assert(active_split)
         new_window = TabWindow(editor_buffer)
 
         if isinstance(active_split, split_cls):
             # Add new window to active split.
-            active_split.children.insert(index, new_window)
+            index = active_split.children.index(self._active_window)
+            active_split.insert(index, new_window)
         else:
             # Split in the other direction.
-            active_split.children[index] = split_cls(
-                [active_split.children[index], new_window])
+            active_window = self._active_window
+            new_split = split_cls()
+            active_split.replace(active_window, new_split)
+            new_split.insert(0, active_window)
+            new_split.insert(1, new_window)
+
+        self._index_window(new_window)
 
         # Focus new window.
         self._active_window = new_window
@@ -145,15 +219,17 @@ class TabPage(object):
         """
         assert(self._active_window)
         assert isinstance(editor_buffer, EditorBuffer)
+        self._unindex_window(self._active_window)
         self._active_window.editor_buffer = editor_buffer
+        self._active_window.vertical_scroll = 0
+        self._index_window(self._active_window)
 
     def close_editor_buffer(self, editor_buffer: EditorBuffer):
         """
         Close all the windows that have this editor buffer open.
         """
-        for split, window in self._walk_through_windows():
-            if window.editor_buffer == editor_buffer:
-                self._close_window(window)
+        for window in self.windows_for_editor_buffer(editor_buffer):
+            self._close_window(window)
 
     def _close_window(self, window: TabWindow):
         """
@@ -163,6 +239,7 @@ class TabPage(object):
             self.close_active_window()
         else:
             original_active_window = self._active_window
+            self._active_window = window
             self.close_active_window()
             self._active_window = original_active_window
 
@@ -170,20 +247,17 @@ class TabPage(object):
         """
         Close active window.
         """
-        active_split = self._get_active_split()
+        assert(self._active_window)
+        active_split = self._active_window.parent
+        assert(active_split)
 
         # First remove the active window from its split.
-        assert(self._active_window)
-        index = active_split.children.index(self._active_window)
-        del active_split.children[index]
+        index = active_split.remove(self._active_window)
+        self._unindex_window(self._active_window)
 
         # Move focus.
         if len(active_split.children):
-            new_active_window = active_split.children[max(0, index - 1)]
-            while isinstance(new_active_window, (TabHSplit, TabVSplit)):
-                new_active_window = new_active_window.children[0]
-            assert(isinstance(new_active_window, TabWindow))
-            self._active_window = new_active_window
+            self._active_window = _first_window(active_split.children[max(0, index - 1)])
         else:
             self._active_window = None  # No windows left.
 
@@ -191,26 +265,35 @@ class TabPage(object):
         # split. (We don't want to keep a split with one item around -- exept
         # for the root.)
         if len(active_split.children) == 1 and active_split != self.root:
-            parent = self._get_split_parent(active_split)
+            parent = active_split.parent
             assert(parent)
-            index = parent.children.index(active_split)
-            parent.children[index] = active_split.children[0]
+            parent.replace(active_split, active_split.children[0])
 
     def cycle_focus(self):
         """
         Cycle through all windows.
         """
         assert(self._active_window)
-        windows = self.windows()
-        new_index = (windows.index(self._active_window) + 1) % len(windows)
-        self._active_window = windows[new_index]
+
+        # Go up until there is a next sibling, then down to its first window.
+        # (Wrap around at the root.)
+        node: TabNode = self._active_window
+        while node.parent is not None:
+            siblings = node.parent.children
+            index = siblings.index(node)
+            if index + 1 < len(siblings):
+                self._active_window = _first_window(siblings[index + 1])
+                return
+            node = node.parent
+
+        self._active_window = _first_window(self.root)
 
     @property
     def has_unsaved_changes(self):
         """
         True when any of the visible buffers in this tab has unsaved changes.
         """
-        for w in self.windows():
-            if w.editor_buffer.has_unsaved_changes:
+        for eb in self._windows_by_buffer:
+            if eb.has_unsaved_changes:
                 return True
         return False
@@ -1,26 +1,53 @@
-
+import asyncio
 import pytest
 
-from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.application.current import set_app
 from prompt_toolkit.output import DummyOutput
 from prompt_toolkit.input import DummyInput
-from pyvim.editor import Editor
-from pyvim.window_arrangement import TabPage, EditorBuffer, Window
+from pyvim.editor import get_editor
+from pyvim.event_dispatcher import DISPATCHER
+from pyvim.window_arrangement.editor_buffer import EditorBuffer
+from pyvim.window_arrangement.tab_page import TabPage, TabWindow
 
 
 @pytest.fixture
-def editor():
-    return Editor(output=DummyOutput(), input=DummyInput())
+def editor(tmp_path, monkeypatch):
+    # (The history files are written in '~/.pyvim'.)
+    monkeypatch.setenv('HOME', str(tmp_path))
+
+    # The editor and the dispatcher are singletons: start from a clean state
+    # in every test.
+    editor = get_editor()
+    editor.__init__()
+    DISPATCHER.__init__()
+    editor.input = DummyInput()
+    editor.output = DummyOutput()
+    editor.layout()
+
+    # (Like when the application runs, there is an event loop.)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with set_app(editor.application):
+            yield editor
+    finally:
+        # (Stop the tasks that are still running, like the event dispatcher.)
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        asyncio.set_event_loop(None)
+        loop.close()
 
 
 @pytest.fixture
 def editor_buffer(editor):
-    return EditorBuffer(editor)
+    return EditorBuffer()
 
 
 @pytest.fixture
 def window(editor_buffer):
-    return Window(editor_buffer)
+    return TabWindow(editor_buffer)
 
 
 @pytest.fixture
@@ -0,0 +1,86 @@
+import asyncio
+
+from pyvim.window_arrangement.editor_buffer import EditorBuffer
+
+
+def _write_files(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_text(name * 10000 + '\n')
+        paths.append(path)
+    return paths
+
+
+def _wait_for_reporters(ebs):
+    async def wait():
+        while any(eb._reporter_is_running for eb in ebs):
+            await asyncio.sleep(0.01)
+
+    asyncio.get_event_loop().run_until_complete(wait())
+
+
+def test_unload(editor, tmp_path):
+    path, = _write_files(tmp_path, ['a'])
+    eb = EditorBuffer(path)
+    eb.cursor_position = 5
+    assert eb.memory_usage() > 10000
+
+    eb.unload()
+    assert not eb.is_loaded
+    assert eb.memory_usage() == 0
+    assert eb.cursor_position == 5
+
+    eb.load()
+    assert eb.buffer.text == 'a' * 10000
+    assert eb.cursor_position == 5
+
+
+def test_unload_while_reporter_runs(editor, tmp_path):
+    path, = _write_files(tmp_path, ['a'])
+    eb = EditorBuffer(path)
+    eb.buffer.text = 'b'
+    eb.buffer.text = 'a' * 10000
+
+    # The reporter runs in a thread. (It sets the errors afterwards.)
+    assert eb._reporter_is_running
+    eb.unload()
+    assert eb.is_loaded
+
+    _wait_for_reporters([eb])
+    eb.unload()
+    assert not eb.is_loaded
+
+
+def test_unload_hidden_buffers(editor, tmp_path):
+    paths = _write_files(tmp_path, ['a', 'b', 'c'])
+    editor.load_initial_files(paths)
+    wa = editor.window_arrangement
+    ebs = [wa.editor_buffers.get_by_location(p) for p in paths]
+    for eb in ebs:
+        eb.load()
+    _wait_for_reporters(ebs)
+
+    # The running total follows the changes of the text.
+    total = wa.editor_buffers.memory_usage()
+    assert total == sum(eb.memory_usage() for eb in ebs)
+    ebs[0].buffer.text += 'a' * 10000
+    assert wa.editor_buffers.memory_usage() > total
+
+    # 'a' is visible, 'c' was shown least recently.
+    assert wa.active_editor_buffer is ebs[0]
+    ebs[1].last_shown = 2.0
+    ebs[2].last_shown = 1.0
+
+    wa.unload_hidden_buffers(wa.editor_buffers.memory_usage() - 1)
+    assert [eb.is_loaded for eb in ebs] == [True, True, False]
+
+    wa.unload_hidden_buffers(1)
+    assert [eb.is_loaded for eb in ebs] == [True, False, False]
+    assert wa.editor_buffers.memory_usage() == ebs[0].memory_usage()
+
+    # A budget of zero means no limit.
+    ebs[1].load()
+    _wait_for_reporters(ebs)
+    wa.unload_hidden_buffers(0)
+    assert ebs[1].is_loaded
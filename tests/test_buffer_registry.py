@@ -0,0 +1,31 @@
+import pathlib
+
+from pyvim.window_arrangement.buffer_registry import BufferRegistry
+from pyvim.window_arrangement.editor_buffer import EditorBuffer
+
+
+def test_match():
+    registry = BufferRegistry()
+    ebs = [EditorBuffer(pathlib.Path('/project/src/widgets/config.py'), lazy=True),
+           EditorBuffer(pathlib.Path('/project/README'), lazy=True),
+           EditorBuffer(pathlib.Path('/project/src/main.py'), lazy=True),
+           EditorBuffer(text='new')]
+    for eb in ebs:
+        registry.add(eb)
+
+    assert registry.match('wdgcfg') == [ebs[0]]
+    assert registry.match('main') == [ebs[2]]
+    assert registry.match('py') == [ebs[0], ebs[2]]
+    assert registry.match('sm') == [ebs[2]]
+    assert registry.match('') == ebs
+    assert registry.match('', limit=2) == ebs[:2]
+
+    # A buffer number.
+    assert registry.match('3') == [ebs[3]]
+
+    # The index follows the buffers.
+    registry.remove(ebs[2])
+    assert registry.match('py') == [ebs[0]]
+    ebs[1].location = pathlib.Path('/project/setup.py')
+    ebs[1].on_location_changed.fire()
+    assert registry.match('py') == [ebs[0], ebs[1]]
@@ -0,0 +1,68 @@
+import os
+
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+
+from pyvim.commands.completer import DirectoryCache, LocationCompleter
+from pyvim import fuzzy
+from pyvim.fuzzy import FuzzyIndex, fuzzy_filter, match_positions
+
+
+def test_fuzzy_filter():
+    names = ['xbarx', 'b_a_r', 'foo', 'Bar.txt', 'bxxxaxxxr', 'rab']
+    assert fuzzy_filter('bar', names) == ['Bar.txt', 'xbarx', 'b_a_r', 'bxxxaxxxr']
+    assert fuzzy_filter('bar', names, limit=2) == ['Bar.txt', 'xbarx']
+    assert fuzzy_filter('', names) == names
+    assert fuzzy_filter('a.t', names) == ['Bar.txt']
+
+
+def test_fuzzy_index_segments(monkeypatch):
+    monkeypatch.setattr(fuzzy, 'SEGMENT_SIZE', 2)
+    names = ['xbarx', 'b_a_r', 'foo', 'Bar.txt', 'bxxxaxxxr', 'rab']
+    index = FuzzyIndex(names)
+    assert index.filter('bar') == ['Bar.txt', 'xbarx', 'b_a_r', 'bxxxaxxxr']
+    assert index.filter('bar', limit=1) == ['Bar.txt']
+
+    # The matches of 'br' are searched for 'bar'.
+    assert index.filter('br') == ['xbarx', 'Bar.txt', 'b_a_r', 'bxxxaxxxr']
+    assert index.filter('bar') == ['Bar.txt', 'xbarx', 'b_a_r', 'bxxxaxxxr']
+    assert index.filter('bart') == ['Bar.txt']
+    assert index.filter('f') == ['foo']
+
+
+def test_match_positions():
+    assert match_positions('bar', 'xBarx') == [1, 2, 3]
+    assert match_positions('br', 'b_a_r') == [0, 4]
+    assert match_positions('xy', 'b_a_r') == []
+    assert match_positions('', 'b_a_r') == []
+
+
+def _complete(completer, text):
+    return [c.text for c in completer.get_completions(Document(text), CompleteEvent())]
+
+
+def test_location_completer(tmp_path):
+    for name in ['alpha.txt', 'beta.txt', '.hidden']:
+        (tmp_path / name).write_text('')
+    (tmp_path / 'alps').mkdir()
+
+    completer = LocationCompleter(max_completions=10)
+    directory = str(tmp_path) + os.sep
+    assert _complete(completer, directory) == ['alpha.txt', 'alps/', 'beta.txt']
+    assert _complete(completer, directory + 'al') == ['alpha.txt', 'alps/']
+    assert _complete(completer, directory + 'btt') == ['beta.txt']
+    assert _complete(completer, directory + '.h') == ['.hidden']
+    assert _complete(completer, directory + 'missing/') == []
+
+
+def test_directory_cache(tmp_path):
+    cache = DirectoryCache()
+    (tmp_path / 'a').write_text('')
+    listing = cache.get_listing(str(tmp_path))
+    assert listing.index.names == ['a']
+    assert cache.get_listing(str(tmp_path)) is listing
+
+    # Adding an entry changes the modification time of the directory.
+    (tmp_path / 'b').write_text('')
+    os.utime(tmp_path, ns=(listing.mtime + 10 ** 9, listing.mtime + 10 ** 9))
+    assert cache.get_listing(str(tmp_path)).index.names == ['a', 'b']
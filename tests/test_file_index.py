@@ -0,0 +1,78 @@
+import os
+
+from pyvim.file_index import FileIndex, get_file_index_path
+
+
+def _create_files(root, paths):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text('')
+
+
+def test_file_index(tmp_path):
+    root = tmp_path / 'project'
+    _create_files(root, ['README.md', 'src/widgets/config.py', 'src/main.py',
+                         'build/out.o', '.git/HEAD'])
+    (root / '.gitignore').write_text('build/\n')
+
+    index = FileIndex(str(root))
+    assert not index.ready and index.find('main') == []
+    assert index.update()
+    assert index.ready and len(index) == 4
+    assert index.find('wdgcfg') == [os.path.join('src', 'widgets', 'config.py')]
+    assert index.find('main') == [os.path.join('src', 'main.py')]
+    assert index.find('out') == []
+
+
+def test_file_index_update(tmp_path):
+    root = tmp_path / 'project'
+    _create_files(root, ['a/b/c.txt', 'a/d.txt', 'e.txt'])
+    cache_path = get_file_index_path(tmp_path / 'config', str(root))
+
+    index = FileIndex(str(root), cache_path)
+    assert not index.load()
+    index.update()
+    index.save()
+    assert index.listed_count == 3
+
+    # Only the directories that changed are listed again.
+    index = FileIndex(str(root), cache_path)
+    assert index.load() and len(index) == 3
+    assert not index.update()
+    assert index.listed_count == 0
+
+    _create_files(root, ['a/b/f.txt'])
+    assert index.update()
+    assert index.listed_count == 1
+    assert index.find('f.txt') == [os.path.join('a', 'b', 'f.txt')]
+
+
+def test_file_index_gitignore_changed(tmp_path):
+    root = tmp_path / 'project'
+    _create_files(root, ['a/b/c.log', 'a/b/d.txt'])
+
+    index = FileIndex(str(root))
+    index.update()
+    assert len(index) == 2
+
+    # The modification time of 'a/b' doesn't change.
+    (root / '.gitignore').write_text('*.log\n')
+    assert index.update()
+    assert index.find('c.log') == []
+
+    (root / '.gitignore').write_text('')
+    assert index.update()
+    assert index.find('c.log') == [os.path.join('a', 'b', 'c.log')]
+
+
+def test_find_command(editor, tmp_path):
+    from pyvim.commands.commands import _open_found_file
+    from pyvim.commands.handler import handle_command
+
+    editor.load_initial_files([])
+    handle_command(':find')
+    assert editor.message == 'Argument required'
+
+    _create_files(tmp_path, ['src/a.txt'])
+    _open_found_file(editor, FileIndex(str(tmp_path)), './src/../src/a.txt')
+    assert editor.window_arrangement.active_editor_buffer.location == tmp_path / 'src' / 'a.txt'
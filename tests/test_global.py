@@ -0,0 +1,53 @@
+from pyvim.commands.global_command import find_rows, apply_to_lines
+from pyvim.commands.substitute import compile_pattern
+
+sample_lines = """
+Roses are red,
+    Violets are blue,
+Sugar is sweet,
+    And so are you.
+""".lstrip().split('\n')
+
+
+def _apply(pattern, command, invert=False):
+    pattern = compile_pattern(pattern)
+    rows = find_rows(pattern, sample_lines, 0, len(sample_lines) - 2, invert)
+    return apply_to_lines(sample_lines, rows, command, pattern)
+
+
+def test_find_rows():
+    pattern = compile_pattern('are')
+    assert find_rows(pattern, sample_lines, 0, 3) == [0, 1, 3]
+    assert find_rows(pattern, sample_lines, 1, 2) == [1]
+    assert find_rows(pattern, sample_lines, 0, 3, invert=True) == [2]
+
+
+def test_global_delete():
+    lines, cursor_row = _apply('are', 'd')
+    assert lines == ['Sugar is sweet,', '']
+    assert cursor_row == 0
+
+    lines, cursor_row = _apply('are', 'd', invert=True)
+    assert lines == ['Roses are red,', '    Violets are blue,', '    And so are you.', '']
+    assert cursor_row == 2
+
+
+def test_global_move():
+    lines, _ = _apply('^', 'm0')
+    assert lines == [
+        '    And so are you.', 'Sugar is sweet,', '    Violets are blue,', 'Roses are red,', '']
+
+    lines, _ = _apply('^ ', 'm$')
+    assert lines == [
+        'Roses are red,', 'Sugar is sweet,', '    Violets are blue,', '    And so are you.', '']
+
+
+def test_global_substitute():
+    lines, cursor_row = _apply('^ ', 's/are/is/')
+    assert lines[1] == '    Violets is blue,'
+    assert lines[3] == '    And so is you.'
+    assert cursor_row == 3
+
+    # Without pattern, the pattern of :g is used.
+    lines, _ = _apply('e', 's//E/g')
+    assert lines[0] == 'RosEs arE rEd,'
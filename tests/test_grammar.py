@@ -0,0 +1,37 @@
+from pyvim.commands.grammar import parse_command, parse_input
+
+
+def _variables(input_string):
+    parsed = parse_command(input_string)
+    assert parsed.matched
+    return {name: value for name, value, _, _ in parsed.variables}
+
+
+def test_parse_command():
+    assert _variables(':%s/a\\/b/c/g') == {
+        'range': '%', 'command': 's', 'search': 'a\\/b', 'replace': 'c', 'flags': '/g'}
+    assert _variables('g!/x/d') == {'command': 'g', 'force': '!', 'global_pattern': 'x', 'global_command': 'd'}
+    assert _variables('1,5!sort') == {'range': '1,5', 'filter_command': 'sort'}
+    assert _variables('  12 ') == {'go_to_line': '12'}
+    assert _variables('w! file.txt') == {'command': 'w', 'force': '!', 'location': 'file.txt'}
+    assert _variables('set tw=8') == {'command': 'set', 'set_option': 'tw', 'set_value': '8'}
+    assert _variables('sort') == {'command': 'sort', 'force': ''}
+    assert _variables('tabnext') == {'command': 'tabnext', 'force': ''}
+    assert _variables('Files src conf') == {'command': 'Files', 'find_query': 'src conf'}
+    assert _variables('') == {}
+
+    # Commands that don't take a range, or arguments.
+    assert _variables('%bufdo') == {'command': '%bufdo', 'force': ''}
+    assert not parse_command('e a b').matched
+    assert not parse_command('%bufdo e').matched
+    assert parse_input('tabnext x') == (None, None, None)
+
+
+def test_end_variable():
+    assert parse_command('').end_variable == ('command', 0)
+    assert parse_command('tabn').end_variable == ('command', 0)
+    assert parse_command('e ').end_variable == ('location', 2)
+    assert parse_command('w! fi').end_variable == ('location', 3)
+    assert parse_command('set nu').end_variable == ('set_option', 4)
+    assert parse_command('!ls').end_variable == ('shell_command', 1)
+    assert parse_command('e a ').end_variable is None
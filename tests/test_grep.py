@@ -0,0 +1,55 @@
+import asyncio
+
+from pyvim.grep import GrepMatch, grep, search_files, walk_files
+
+
+def _create_tree(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'ignored').mkdir()
+    (tmp_path / 'a.txt').write_text('alpha\nbeta needle\ngamma\n')
+    (tmp_path / 'sub' / 'b.txt').write_text('needle one\nno\nneedle needle two')
+    (tmp_path / 'ignored' / 'c.txt').write_text('needle\n')
+    (tmp_path / 'binary').write_bytes(b'needle\0')
+    (tmp_path / '.gitignore').write_text('ignored/\n')
+
+
+def test_walk_files_with_ignore_rules(tmp_path):
+    _create_tree(tmp_path)
+    files = sorted(walk_files([str(tmp_path)]))
+    assert files == sorted([
+        str(tmp_path / '.gitignore'),
+        str(tmp_path / 'a.txt'),
+        str(tmp_path / 'binary'),
+        str(tmp_path / 'sub' / 'b.txt'),
+    ])
+
+
+def test_search_files(tmp_path):
+    _create_tree(tmp_path)
+    a = str(tmp_path / 'a.txt')
+    b = str(tmp_path / 'sub' / 'b.txt')
+    binary = str(tmp_path / 'binary')
+
+    assert search_files(b'needle', 0, [a, b, binary]) == [
+        GrepMatch(a, 2, 6, 'beta needle'),
+        GrepMatch(b, 1, 1, 'needle one'),
+        GrepMatch(b, 3, 1, 'needle needle two'),
+    ]
+
+
+def test_grep_in_process(tmp_path):
+    _create_tree(tmp_path)
+
+    async def run():
+        result = []
+        async for matches in grep('NEEDLE', [str(tmp_path)], ignore_case=True,
+                                  use_ripgrep=False):
+            result.extend(matches)
+        return result
+
+    result = asyncio.run(run())
+    assert sorted((m.path, m.lineno) for m in result) == [
+        (str(tmp_path / 'a.txt'), 2),
+        (str(tmp_path / 'sub' / 'b.txt'), 1),
+        (str(tmp_path / 'sub' / 'b.txt'), 3),
+    ]
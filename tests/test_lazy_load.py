@@ -0,0 +1,54 @@
+from pyvim.window_arrangement.editor_buffer import EditorBuffer
+
+
+def _write_files(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_text('text of %s\n' % name)
+        paths.append(path)
+    return paths
+
+
+def test_lazy_load(editor, tmp_path):
+    path, = _write_files(tmp_path, ['a.txt'])
+    eb = EditorBuffer(path, lazy=True)
+    assert not eb.is_loaded
+    assert not eb.has_unsaved_changes
+
+    # The cursor position is kept until the file is read.
+    eb.cursor_position = 3
+    eb.load()
+    assert eb.is_loaded
+    assert eb.buffer.text == 'text of a.txt'
+    assert eb.cursor_position == 3
+
+
+def test_only_visible_buffers_are_loaded(editor, tmp_path):
+    paths = _write_files(tmp_path, ['a.txt', 'b.txt', 'c.txt'])
+    editor.load_initial_files(paths)
+    wa = editor.window_arrangement
+    ebs = [wa.editor_buffers.get_by_location(p) for p in paths]
+    assert not any(eb.is_loaded for eb in ebs)
+
+    editor.sync_with_prompt_toolkit()
+    assert [eb.is_loaded for eb in ebs] == [True, False, False]
+
+    wa.go_to_buffer('c.txt')
+    editor.sync_with_prompt_toolkit()
+    assert [eb.is_loaded for eb in ebs] == [True, False, True]
+
+
+def test_write_loads_first(editor, tmp_path):
+    path, = _write_files(tmp_path, ['a.txt'])
+    eb = EditorBuffer(path, lazy=True)
+
+    # The file is read before it's written. (Not replaced by an empty text.)
+    eb.write()
+    assert eb.is_loaded
+    assert path.read_text() == 'text of a.txt\n'
+
+    copy = tmp_path / 'copy.txt'
+    copy.write_text('')
+    EditorBuffer(path, lazy=True).write(copy)
+    assert copy.read_text() == 'text of a.txt\n'
@@ -0,0 +1,56 @@
+import asyncio
+
+from pyvim.make import (
+    DEFAULT_ERRORFORMAT, MakeError, MakeJob, compile_errorformat, parse_line)
+
+
+def test_parse_line():
+    patterns = compile_errorformat(DEFAULT_ERRORFORMAT)
+
+    assert parse_line(patterns, "a.c:2:10: error: undeclared 'x'", '/src') == \
+        MakeError('/src/a.c', 2, 10, "undeclared 'x'", 'e')
+    assert parse_line(patterns, 'lib/b.py:3: warning: unused', '/src') == \
+        MakeError('/src/lib/b.py', 3, 0, 'unused', 'w')
+    assert parse_line(patterns, 'c.py:4: undefined name', '/src') == \
+        MakeError('/src/c.py', 4, 0, 'undefined name', '')
+    assert parse_line(patterns, 'make: *** [all] Error 1', '/src') is None
+
+
+def test_custom_errorformat():
+    patterns = compile_errorformat(r'%f\, line %l: %m,%*[ ]File "%f"')
+    assert parse_line(patterns, 'a.txt, line 3: bad', '/') == \
+        MakeError('/a.txt', 3, 0, 'bad', '')
+    assert parse_line(patterns, '   File "b.py"', '/') == MakeError('/b.py', 0, 0, '', '')
+
+
+def test_make_job(tmp_path):
+    patterns = compile_errorformat(DEFAULT_ERRORFORMAT)
+    job = MakeJob(
+        'echo "a.c:1:2: error: x"; echo noise; printf "b.c:3: warning: y"; exit 2',
+        patterns, str(tmp_path))
+
+    async def run():
+        result = []
+        async for errors in job.run():
+            result.extend(errors)
+        return result
+
+    errors = asyncio.run(run())
+    assert [(e.path, e.lineno, e.type) for e in errors] == [
+        (str(tmp_path / 'a.c'), 1, 'e'),
+        (str(tmp_path / 'b.c'), 3, 'w'),
+    ]
+    assert (job.line_count, job.error_count, job.warning_count) == (3, 1, 1)
+    assert job.returncode == 2
+
+
+def test_set_makeprg(editor):
+    from pyvim.commands.handler import handle_command
+    editor.load_initial_files([])
+
+    handle_command(r':set makeprg=python\ -m\ pytest')
+    handle_command(':set makeprg')
+    assert editor.message == 'makeprg=python -m pytest'
+
+    handle_command(':set errorformat')
+    assert editor.message == 'errorformat=%s' % DEFAULT_ERRORFORMAT
@@ -0,0 +1,56 @@
+from prompt_toolkit.key_binding.vi_state import InputMode
+
+from pyvim.commands.normal import execute_macro, execute_normal_on_rows
+
+
+def _focus_buffer(editor, text):
+    editor.load_initial_files([])
+    editor.sync_with_prompt_toolkit()
+    buffer = editor.window_arrangement.active_editor_buffer.buffer
+    buffer.text = text
+    buffer.cursor_position = 0
+    editor.application.layout.focus(buffer)
+    editor.application.vi_state.input_mode = InputMode.NAVIGATION
+    return buffer
+
+
+def test_normal_on_rows(editor):
+    buffer = _focus_buffer(editor, 'a\nb\nc\nd\n')
+
+    execute_normal_on_rows(editor, buffer, range(0, 4), 'Ax')
+    assert buffer.text == 'ax\nbx\ncx\ndx\n'
+
+    # The next rows are shifted by the inserted and deleted lines.
+    execute_normal_on_rows(editor, buffer, range(0, 4), 'onew')
+    assert buffer.text == 'ax\nnew\nbx\nnew\ncx\nnew\ndx\nnew\n'
+
+    execute_normal_on_rows(editor, buffer, range(1, 4), 'dd')
+    assert buffer.text == 'ax\ncx\nnew\ndx\nnew\n'
+
+    # (The keys change the lines after the row.)
+    execute_normal_on_rows(editor, buffer, range(0, 2), 'jdd')
+    assert buffer.text == 'ax\ndx\nnew\n'
+
+
+def test_normal_on_rows_is_one_undo_step(editor):
+    buffer = _focus_buffer(editor, 'a\nb\nc\n')
+
+    execute_normal_on_rows(editor, buffer, range(0, 3), 'Ax')
+    assert buffer.text == 'ax\nbx\ncx\n'
+
+    buffer.undo()
+    assert buffer.text == 'a\nb\nc\n'
+
+
+def test_execute_macro(editor):
+    buffer = _focus_buffer(editor, '1\n2\n3\n4\n')
+
+    execute_macro(editor, buffer, 'A!\x1bj', count=2)
+    assert buffer.text == '1!\n2!\n3\n4\n'
+
+    buffer.undo()
+    assert buffer.text == '1\n2\n3\n4\n'
+
+    # The playback stops when nothing changes anymore.
+    execute_macro(editor, buffer, 'x', count=100)
+    assert buffer.text == '\n2\n3\n4\n'
@@ -0,0 +1,52 @@
+from pyvim.quickfix import QuickfixEntry, QuickfixList
+
+
+def _create_list():
+    quickfix = QuickfixList(':grep needle')
+    quickfix.extend([
+        ('a.txt', 2, 6, 'beta needle'),
+        ('b.txt', 1, 1, 'needle one'),
+        ('b.txt', 3, 1, '    needle two'),
+    ])
+    return quickfix
+
+
+def test_quickfix_entries():
+    quickfix = _create_list()
+    assert len(quickfix) == 3
+    assert quickfix.file_count == 2
+    assert quickfix[1] == QuickfixEntry('b.txt', 1, 1, 'needle one')
+    assert quickfix.format_entry(2) == 'b.txt|3 col 1| needle two'
+
+    quickfix.clear(':grep other')
+    assert len(quickfix) == 0
+    assert quickfix.title == ':grep other'
+    assert quickfix.current is None
+
+
+def test_quickfix_navigation():
+    quickfix = _create_list()
+    assert quickfix.current == QuickfixEntry('a.txt', 2, 6, 'beta needle')
+
+    assert quickfix.move(1).path == 'b.txt'
+    assert quickfix.move(1).lineno == 3
+    assert quickfix.move(1) is None  # At the end.
+    assert quickfix.index == 2
+
+    assert quickfix.move(-2).path == 'a.txt'
+    assert quickfix.move(-1) is None
+
+    # `go_to` clips the index.
+    assert quickfix.go_to(10).lineno == 3
+    assert quickfix.go_to(-5).lineno == 2
+
+
+def test_quickfix_on_change():
+    quickfix = _create_list()
+    changes = []
+    quickfix.on_change += lambda _: changes.append(len(quickfix))
+
+    quickfix.append('c.txt', 1, 1, 'needle three')
+    quickfix.clear(':grep other')
+    quickfix.extend([('d.txt', 1, 1, 'needle')])
+    assert changes == [4, 0, 1]
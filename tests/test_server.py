@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+
+from pyvim.commands.handler import handle_command
+from pyvim.event_dispatcher import DISPATCHER
+from pyvim.server import EditorServer, get_socket_path
+
+
+@pytest.fixture
+def server(editor, tmp_path):
+    for name in ['local.txt', 'remote.txt']:
+        (tmp_path / name).write_text('text\n')
+
+    loop = asyncio.get_event_loop()
+    editor.load_initial_files([tmp_path / 'local.txt'])
+    DISPATCHER.start(loop)
+    editor.server = EditorServer('test')
+    loop.run_until_complete(editor.server._start_async())
+    try:
+        yield editor.server
+    finally:
+        editor.server.close()
+
+
+async def _connect(path):
+    " Send a '--remote-wait' request. Return the reader and writer. "
+    reader, writer = await asyncio.open_unix_connection(str(get_socket_path('test')))
+    request = {'locations': [str(path)], 'wait': True}
+    writer.write(json.dumps(request).encode('utf-8') + b'\n')
+    return reader, writer
+
+
+def _remote_wait(server, path):
+    " Run a '--remote-wait' client until the server opened the file. "
+    loop = asyncio.get_event_loop()
+
+    async def remote_wait():
+        reader, writer = await _connect(path)
+        try:
+            return await reader.readline()
+        finally:
+            writer.close()
+
+    async def wait_until_opened():
+        while server.waiting_count == 0:
+            await asyncio.sleep(0.01)
+
+    client = loop.create_task(remote_wait())
+    loop.run_until_complete(wait_until_opened())
+    return client
+
+
+def test_remote_wait(editor, server, tmp_path):
+    loop = asyncio.get_event_loop()
+    exited = []
+    editor.application.exit = lambda: exited.append(True)
+
+    client = _remote_wait(server, tmp_path / 'remote.txt')
+    wa = editor.window_arrangement
+    assert wa.active_editor_buffer.location == tmp_path / 'remote.txt'
+
+    # The editor doesn't quit while the client waits.
+    wa.go_to_buffer('local.txt')
+    handle_command(':q')
+    assert not exited
+    assert not client.done()
+
+    # ':wq' writes and closes the buffer, which releases the client.
+    wa.go_to_buffer('remote.txt')
+    editor.sync_with_prompt_toolkit()
+    wa.active_editor_buffer.buffer.text = 'remote'
+    handle_command(':wq')
+    assert loop.run_until_complete(asyncio.wait_for(client, 5)) == b'done\n'
+    assert (tmp_path / 'remote.txt').read_text() == 'remote\n'
+    assert not exited
+    assert server.waiting_count == 0
+
+    handle_command(':q')
+    assert exited
+
+
+def test_remote_wait_client_disconnects(editor, server, tmp_path):
+    loop = asyncio.get_event_loop()
+
+    async def connect_and_close():
+        reader, writer = await _connect(tmp_path / 'remote.txt')
+        while server.waiting_count == 0:
+            await asyncio.sleep(0.01)
+        writer.close()
+
+        # The server stops waiting for the buffer.
+        while server.waiting_count:
+            await asyncio.sleep(0.01)
+
+    loop.run_until_complete(asyncio.wait_for(connect_and_close(), 5))
+    assert server.waiting_count == 0
+    assert not server.is_waiting_for(editor.window_arrangement.active_editor_buffer)
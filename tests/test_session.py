@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from pyvim.session import load_session, save_session
+from pyvim.window_arrangement.tab_page import TabHSplit, TabVSplit
+
+
+@pytest.fixture
+def files(editor, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        path = tmp_path / name
+        path.write_text('line\n' * 10)
+        paths.append(path)
+    return paths
+
+
+def _open_layout(editor, paths):
+    " Two tab pages: a vertical and horizontal split, and one window. "
+    editor.load_initial_files(paths[:1])
+    wa = editor.window_arrangement
+    wa.vsplit(location=paths[1])
+    wa.hsplit(location=paths[2])
+    wa.active_editor_buffer.cursor_position = 7
+    wa.create_tab(paths[1])
+    wa.active_tab_index = 0
+
+
+def test_session_round_trip(editor, files, tmp_path):
+    _open_layout(editor, files)
+    wa = editor.window_arrangement
+    locations = [w.editor_buffer.location for w in wa.tab_pages[0].windows()]
+    session = tmp_path / 'session.json'
+    save_session(editor, session)
+
+    # Change the layout, then restore it.
+    wa.keep_only_current_window()
+    wa.close_tab()
+    load_session(editor, session)
+
+    assert len(wa.tab_pages) == 2
+    assert wa.active_tab_index == 0
+    root = wa.tab_pages[0].root
+    assert isinstance(root, TabVSplit) and isinstance(root.children[0], TabHSplit)
+    assert [w.editor_buffer.location for w in wa.tab_pages[0].windows()] == locations
+    assert [w.editor_buffer.location for w in wa.tab_pages[1].windows()] == [files[1]]
+    assert wa.active_editor_buffer.location == files[2]
+    assert wa.active_editor_buffer.cursor_position == 7
+
+    # Saving again gives the same session.
+    session2 = tmp_path / 'session2.json'
+    save_session(editor, session2)
+    assert json.loads(session2.read_text()) == json.loads(session.read_text())
+
+
+@pytest.mark.parametrize('change', [
+    lambda data: data['tabs'][0]['root'][1].append(['w', 10, 0]),
+    lambda data: data['tabs'][0]['root'][1].append(['x', []]),
+    lambda data: data['tabs'][0].update(active=3),
+    lambda data: data.update(active_tab=2),
+    lambda data: data['buffers'].append(['d.txt', 'not a number']),
+    lambda data: (data['buffers'].append(['d.txt', 0]), data.update(active_tab=2)),
+])
+def test_invalid_session(editor, files, tmp_path, change):
+    _open_layout(editor, files)
+    session = tmp_path / 'session.json'
+    save_session(editor, session)
+    data = json.loads(session.read_text())
+    change(data)
+    session.write_text(json.dumps(data))
+
+    # Nothing changes when the session is not valid.
+    wa = editor.window_arrangement
+    wa.keep_only_current_window()
+    tab_pages = list(wa.tab_pages)
+    editor_buffers = list(wa.editor_buffers)
+
+    with pytest.raises(ValueError):
+        load_session(editor, session)
+    assert wa.tab_pages == tab_pages
+    assert list(wa.editor_buffers) == editor_buffers
+    assert wa.active_tab.window_count() == 1
@@ -0,0 +1,68 @@
+import asyncio
+import io
+
+from pyvim.commands.shell_filter import (
+    FilterResult, begin_insert, begin_replace, insert_lines, replace_lines, run_filter)
+
+
+def test_run_filter():
+    text = 'first\ncharlie\nalpha\nbravo\nlast'
+    start, end = 6, 25  # The three lines in the middle.
+
+    # The output is written after the text before the range.
+    output = begin_replace(text, start)
+    result = asyncio.run(run_filter('sort', output, text, start, end))
+    assert result.returncode == 0
+    assert output.getvalue() == 'first\nalpha\nbravo\ncharlie'
+    assert replace_lines(text, start, end, result, output) == (
+        'first\nalpha\nbravo\ncharlie\nlast', 6)
+    assert output.closed
+
+    # Without input. (`:r !cmd`)
+    output = io.StringIO()
+    result = asyncio.run(run_filter('echo output; echo error >&2; exit 2', output))
+    assert output.getvalue() == 'output'
+    assert result.returncode == 2
+    assert result.error == 'error'
+
+    # A command that prints nothing.
+    assert asyncio.run(run_filter('true', io.StringIO(), text, start, end)).is_empty
+
+
+def test_replace_and_insert_lines():
+    text = 'a\nb\nc'
+
+    def replace(start, end, output):
+        new_text = begin_replace(text, start)
+        new_text.write(output)
+        return replace_lines(text, start, end, FilterResult(len(output), 0, ''), new_text)
+
+    def insert(position, output):
+        new_text = begin_insert(text, position)
+        new_text.write(output)
+        return insert_lines(text, position, FilterResult(len(output), 0, ''), new_text)
+
+    # Without output, the lines are deleted.
+    assert replace(2, 3, '') == ('a\nc', 2)
+    assert replace(4, 5, '') == ('a\nb', 2)
+    assert replace(2, 3, 'x\ny') == ('a\nx\ny\nc', 2)
+
+    # A newline is output as an empty line.
+    new_text = begin_replace(text, 2)
+    assert replace_lines(text, 2, 3, FilterResult(1, 0, ''), new_text) == ('a\n\nc', 2)
+
+    assert insert(0, 'x') == ('x\na\nb\nc', 0)
+    assert insert(2, 'x\ny') == ('a\nx\ny\nb\nc', 2)
+    assert insert(len(text) + 1, 'x') == ('a\nb\nc\nx', 6)
+    assert insert(2, '') == (text, 2)
+
+
+def test_run_filter_newlines():
+    # Only the last newline of the output is dropped, also when it comes in
+    # another chunk.
+    for command, expected in [('printf "a\\n\\n"', 'a\n'), ('printf "\\n"', ''),
+                              ('printf "a"; sleep 0.1; printf "\\n"', 'a')]:
+        output = io.StringIO()
+        result = asyncio.run(run_filter(command, output))
+        assert output.getvalue() == expected
+        assert not result.is_empty
@@ -0,0 +1,64 @@
+import re
+
+import pytest
+
+from pyvim.commands.sort import BackgroundSort, Sorter, SortError, parse_sort_args
+
+
+def test_parse_sort_args():
+    assert parse_sort_args('') == ('', None)
+    assert parse_sort_args('nu') == ('nu', None)
+    assert parse_sort_args('i /a\\/b/ r') == ('ir', 'a/b')
+    assert parse_sort_args('n //') == ('n', '')
+    assert parse_sort_args('|x|') == ('', 'x')
+
+    with pytest.raises(SortError):
+        parse_sort_args('x')
+    with pytest.raises(SortError):
+        parse_sort_args('/abc')
+
+
+def test_sort():
+    lines = ['b', 'B', 'a', 'c', 'a']
+    assert Sorter(None).sort(lines) == ['B', 'a', 'a', 'b', 'c']
+    assert Sorter(None, 'u').sort(lines) == ['B', 'a', 'b', 'c']
+    assert Sorter(None, 'i').sort(lines) == ['a', 'a', 'b', 'B', 'c']
+    assert Sorter(None, 'iu').sort(lines) == ['a', 'b', 'c']
+    assert Sorter(None, reverse=True).sort(lines) == ['c', 'b', 'a', 'a', 'B']
+
+
+def test_sort_numeric_and_pattern():
+    lines = ['x10', 'y', 'x-2', 'z', 'x3']
+    assert Sorter(None, 'n').sort(lines) == ['y', 'z', 'x-2', 'x3', 'x10']
+
+    lines = ['a=3 z', 'b=1 y', 'c', 'd=2 x']
+    pattern = re.compile(r'=\d')
+    assert Sorter(pattern).sort(lines) == ['c', 'd=2 x', 'b=1 y', 'a=3 z']
+    assert Sorter(pattern, 'r').sort(lines) == ['c', 'b=1 y', 'd=2 x', 'a=3 z']
+
+
+def test_sort_reverse():
+    # Like Vim, the whole result is reversed.
+    lines = ['b', '9', 'a', '10', 'c']
+    assert Sorter(None, 'n', reverse=True).sort(lines) == ['10', '9', 'c', 'a', 'b']
+
+    lines = ['x1 a', 'x2', 'x1 b', 'y']
+    assert Sorter(None, 'n', reverse=True).sort(lines) == ['x2', 'x1 b', 'x1 a', 'y']
+    assert Sorter(None, 'nu', reverse=True).sort(lines) == ['x2', 'x1 b', 'y']
+
+
+def test_external_sort():
+    lines = ['line %i' % (i * 7919 % 1000) for i in range(1000)] + ['no number']
+    lines += ['%s %i' % (word, i % 3) for i, word in enumerate(['Ab', 'ab', 'aB'] * 200)]
+    lines += ['no number %s' % c for c in 'xyzzyx' * 10]
+    text = 'header\n' + '\n'.join(lines) + '\nfooter'
+    start = len('header\n')
+    end = len(text) - len('\nfooter')
+
+    for flags, reverse in [('', False), ('n', False), ('n', True), ('nu', True), ('i', True)]:
+        sorter = Sorter(None, flags, reverse)
+        expected = sorter.sort(lines)
+
+        job = BackgroundSort(sorter, text, start, end, memory=100, run_size=500)
+        assert job.run().split('\n') == expected
+        assert job.line_count == len(expected)
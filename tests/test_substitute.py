@@ -1,4 +1,8 @@
+import asyncio
+
 from pyvim.commands.handler import handle_command
+from pyvim.commands.commands import confirm_substitute
+from pyvim.editor import get_editor
 
 sample_text = """
 Roses are red,
@@ -8,7 +12,7 @@ Sugar is sweet,
 """.lstrip()
 
 def given_sample_text(editor_buffer, text=None):
-    editor = editor_buffer.editor
+    editor = get_editor()
     editor.window_arrangement._add_editor_buffer(editor_buffer)
     editor_buffer.buffer.text = text or sample_text
     editor.sync_with_prompt_toolkit()
@@ -23,7 +27,7 @@ def test_substitute_current_line(editor, editor_buffer):
     given_sample_text(editor_buffer)
     given_cursor_position(editor_buffer, 2)
 
-    handle_command(editor, ':s/s are/ is')
+    handle_command(':s/s are/ is')
 
     assert 'Roses are red,' in editor_buffer.buffer.text
     assert 'Violet is blue,' in editor_buffer.buffer.text
@@ -36,7 +40,7 @@ def test_substitute_single_line(editor, editor_buffer):
     given_sample_text(editor_buffer)
     given_cursor_position(editor_buffer, 1)
 
-    handle_command(editor, ':2s/s are/ is')
+    handle_command(':2s/s are/ is')
 
     assert 'Roses are red,' in editor_buffer.buffer.text
     assert 'Violet is blue,' in editor_buffer.buffer.text
@@ -49,24 +53,52 @@ def test_substitute_range(editor, editor_buffer):
     given_sample_text(editor_buffer)
     given_cursor_position(editor_buffer, 1)
 
-    handle_command(editor, ':1,3s/s are/ is')
+    handle_command(':1,3s/s are/ is')
 
     assert 'Rose is red,' in editor_buffer.buffer.text
     assert 'Violet is blue,' in editor_buffer.buffer.text
     assert 'And so are you.' in editor_buffer.buffer.text
-    # FIXME: vim would have set the cursor position on last substituted line
-    #        but we set the cursor position on the end_range even when there
-    #        is not substitution there
-    # assert editor_buffer.buffer.cursor_position \
-    #    == editor_buffer.buffer.text.index('Violet')
+    # Like vim: the cursor goes to the last substituted line.
     assert editor_buffer.buffer.cursor_position \
-        == editor_buffer.buffer.text.index('Sugar')
+        == editor_buffer.buffer.text.index('Violet')
+
+
+def test_substitute_whole_buffer(editor, editor_buffer):
+    given_sample_text(editor_buffer)
+
+    handle_command(':%s/are/is/')
+
+    assert 'Roses is red,' in editor_buffer.buffer.text
+    assert 'Violets is blue,' in editor_buffer.buffer.text
+    assert 'And so is you.' in editor_buffer.buffer.text
+
+
+def test_substitute_relative_range(editor, editor_buffer):
+    given_sample_text(editor_buffer)
+    given_cursor_position(editor_buffer, 2)
+
+    handle_command(':.,$-1s/^/# /')
+
+    assert editor_buffer.buffer.text == (
+        'Roses are red,\n#     Violets are blue,\n# Sugar is sweet,\n    And so are you.\n')
+
+
+def test_substitute_marks(editor, editor_buffer):
+    given_sample_text(editor_buffer)
+    editor_buffer.marks['a'] = editor_buffer.buffer.text.index('Sugar')
+    editor_buffer.marks['b'] = editor_buffer.buffer.text.index('And')
+
+    handle_command(":'a,'bs/s/z/g")
+
+    assert 'Roses are red,' in editor_buffer.buffer.text
+    assert 'Sugar iz zweet,' in editor_buffer.buffer.text
+    assert 'And zo are you.' in editor_buffer.buffer.text
 
 
 def test_substitute_range_boundaries(editor, editor_buffer):
     given_sample_text(editor_buffer, 'Violet\n' * 4)
 
-    handle_command(editor, ':2,3s/Violet/Rose')
+    handle_command(':2,3s/Violet/Rose')
 
     assert 'Violet\nRose\nRose\nViolet\n' in editor_buffer.buffer.text
 
@@ -75,17 +107,17 @@ def test_substitute_from_search_history(editor, editor_buffer):
     given_sample_text(editor_buffer)
     editor.application.current_search_state.text = 'blue'
 
-    handle_command(editor, ':1,3s//pretty')
+    handle_command(':1,3s//pretty')
     assert 'Violets are pretty,' in editor_buffer.buffer.text
 
 
 def test_substitute_from_substitute_search_history(editor, editor_buffer):
     given_sample_text(editor_buffer, 'Violet is Violet\n')
 
-    handle_command(editor, ':s/Violet/Rose')
+    handle_command(':s/Violet/Rose')
     assert 'Rose is Violet' in editor_buffer.buffer.text
 
-    handle_command(editor, ':s//Lily')
+    handle_command(':s//Lily')
     assert 'Rose is Lily' in editor_buffer.buffer.text
 
 
@@ -93,10 +125,10 @@ def test_substitute_with_repeat_last_substitution(editor, editor_buffer):
     given_sample_text(editor_buffer, 'Violet is Violet\n')
     editor.application.current_search_state.text = 'Lily'
 
-    handle_command(editor, ':s/Violet/Rose')
+    handle_command(':s/Violet/Rose')
     assert 'Rose is Violet' in editor_buffer.buffer.text
 
-    handle_command(editor, ':s')
+    handle_command(':s')
     assert 'Rose is Rose' in editor_buffer.buffer.text
 
 
@@ -104,13 +136,13 @@ def test_substitute_without_replacement_text(editor, editor_buffer):
     given_sample_text(editor_buffer, 'Violet Violet Violet \n')
     editor.application.current_search_state.text = 'Lily'
 
-    handle_command(editor, ':s/Violet/')
+    handle_command(':s/Violet/')
     assert ' Violet Violet \n' in editor_buffer.buffer.text
 
-    handle_command(editor, ':s/Violet')
+    handle_command(':s/Violet')
     assert '  Violet \n' in editor_buffer.buffer.text
 
-    handle_command(editor, ':s/')
+    handle_command(':s/')
     assert '   \n' in editor_buffer.buffer.text
 
 
@@ -118,22 +150,184 @@ def test_substitute_with_repeat_last_substitution_without_previous_substitution(
     original_text = 'Violet is blue\n'
     given_sample_text(editor_buffer, original_text)
 
-    handle_command(editor, ':s')
+    handle_command(':s')
     assert original_text in editor_buffer.buffer.text
 
     editor.application.current_search_state.text = 'blue'
 
-    handle_command(editor, ':s')
+    handle_command(':s')
     assert 'Violet is \n' in editor_buffer.buffer.text
 
 
 def test_substitute_flags_empty_flags(editor, editor_buffer):
     given_sample_text(editor_buffer, 'Violet is Violet\n')
-    handle_command(editor, ':s/Violet/Rose/')
+    handle_command(':s/Violet/Rose/')
     assert 'Rose is Violet' in editor_buffer.buffer.text
 
 
 def test_substitute_flags_g(editor, editor_buffer):
     given_sample_text(editor_buffer, 'Violet is Violet\n')
-    handle_command(editor, ':s/Violet/Rose/g')
+    handle_command(':s/Violet/Rose/g')
     assert 'Rose is Rose' in editor_buffer.buffer.text
+
+
+def test_substitute_group_references(editor, editor_buffer):
+    given_sample_text(editor_buffer, 'Violet is blue\n')
+    handle_command(r':s/(\w+) is (\w+)/\2 is \1/')
+    assert 'blue is Violet' in editor_buffer.buffer.text
+
+
+def test_substitute_flags_i(editor, editor_buffer):
+    given_sample_text(editor_buffer, 'Violet is violet\n')
+    handle_command(':s/VIOLET/Rose/gi')
+    assert 'Rose is Rose' in editor_buffer.buffer.text
+
+
+def test_substitute_flags_n(editor, editor_buffer):
+    given_sample_text(editor_buffer)
+    handle_command(':%s/are/is/gn')
+    assert editor_buffer.buffer.text == sample_text
+    assert editor.message == '3 matches on 3 lines'
+
+
+def _wait_for_background_substitute(editor):
+    async def wait():
+        while editor.background_substitute:
+            await asyncio.sleep(0.01)
+
+    asyncio.get_event_loop().run_until_complete(asyncio.wait_for(wait(), 5))
+
+
+def test_substitute_flags_n_in_background(editor, editor_buffer, monkeypatch):
+    from prompt_toolkit.formatted_text import to_plain_text
+    from pyvim.commands import substitute
+    from pyvim.editor_root.window_statusbar import WindowStatusBar
+
+    monkeypatch.setattr(substitute, 'BACKGROUND_SIZE', 0)
+    monkeypatch.setattr(substitute, 'CHUNK_SIZE', 10)
+    given_sample_text(editor_buffer, sample_text * 3)
+
+    handle_command(':%s/are/is/gn')
+    assert isinstance(editor.background_substitute, substitute.BackgroundCount)
+    assert editor.message is None
+
+    # The progress is shown in the status bar.
+    status_bar = WindowStatusBar(editor, editor_buffer)
+    assert '[count: ' in to_plain_text(status_bar.content.text())
+
+    _wait_for_background_substitute(editor)
+    assert editor.message == '9 matches on 9 lines'
+    assert editor_buffer.buffer.text == sample_text * 3
+
+
+def test_cancel_substitute_flags_n_in_background(editor, editor_buffer, monkeypatch):
+    from pyvim.commands import substitute
+    from pyvim.commands.commands import cancel_substitute
+
+    monkeypatch.setattr(substitute, 'BACKGROUND_SIZE', 0)
+    given_sample_text(editor_buffer)
+
+    handle_command(':%s/are/is/gn')
+    cancel_substitute(editor)
+    assert editor.background_substitute is None
+    assert editor.message == 'Interrupted'
+
+    # (The count is not shown when the job finishes.)
+    asyncio.get_event_loop().run_until_complete(asyncio.sleep(0.1))
+    assert editor.message == 'Interrupted'
+
+
+def test_substitute_is_one_undo_step(editor, editor_buffer):
+    given_sample_text(editor_buffer)
+    handle_command(':%s/e/E/g')
+    editor_buffer.buffer.undo()
+    assert editor_buffer.buffer.text == sample_text
+
+
+def test_background_substitute_in_chunks(monkeypatch):
+    from pyvim.commands import substitute
+
+    monkeypatch.setattr(substitute, 'CHUNK_SIZE', 10)
+    pattern = substitute.compile_pattern('are')
+    text = sample_text * 3
+
+    job = substitute.BackgroundSubstitute(pattern, 'is', text, 0, len(text) - 1, False)
+    assert job.run() == substitute.substitute_text(
+        pattern, 'is', text, 0, len(text) - 1, False)
+
+    job.cancel()
+    assert job.run() is None
+
+
+def test_background_count_in_chunks(monkeypatch):
+    from pyvim.commands import substitute
+
+    monkeypatch.setattr(substitute, 'CHUNK_SIZE', 10)
+    pattern = substitute.compile_pattern('e')
+    text = sample_text * 3
+
+    for all_matches in (False, True):
+        matches, line_count = substitute.find_matches(pattern, text, 0, len(text), all_matches)
+        job = substitute.BackgroundCount(pattern, text, 0, len(text), all_matches)
+        assert job.run() == (len(matches), line_count)
+
+
+def test_substitute_preview():
+    from prompt_toolkit.buffer import Buffer
+    from prompt_toolkit.document import Document
+    from pyvim.commands import substitute
+
+    document = Document(sample_text)
+    pattern = substitute.compile_pattern('(a)re')
+    preview = substitute.SubstitutePreview(
+        Buffer(), document, pattern, r'\1', 0, len(sample_text), all_matches=False)
+
+    preview.compute(1, 3)
+    assert preview.substitutions == {1: [(12, 15, 'a')], 3: [(11, 14, 'a')]}
+    assert preview.complete
+
+    preview = substitute.SubstitutePreview(
+        Buffer(), document, pattern, None, 0, len(sample_text), all_matches=True)
+    preview.compute(0, 3, time_budget=-1)
+    assert preview.substitutions == {}
+    assert not preview.complete
+
+
+def _press_keys(editor, keys):
+    from prompt_toolkit.key_binding import KeyPress
+    editor.application.timeoutlen = None  # (No flush timer, without running loop.)
+    key_processor = editor.application.key_processor
+    for key in keys:
+        key_processor.feed(KeyPress(key))
+    key_processor.process_keys()
+
+
+def test_substitute_confirmation_is_modal(editor, editor_buffer):
+    from prompt_toolkit.key_binding.vi_state import InputMode
+    given_sample_text(editor_buffer)
+    editor.application.vi_state.input_mode = InputMode.NAVIGATION
+
+    handle_command(':%s/are/is/gc')
+    assert editor.message == 'replace with is (y/n/a/q/l)?'
+
+    # Other keys are ignored. ('x' would delete a character.)
+    _press_keys(editor, 'xdd')
+    assert editor_buffer.buffer.text == sample_text
+    assert editor.message == 'replace with is (y/n/a/q/l)?'
+
+    _press_keys(editor, 'yny')
+    assert editor_buffer.buffer.text.startswith('Roses is red,\n    Violets are blue,')
+    assert 'so is you.' in editor_buffer.buffer.text
+    assert editor.substitute_confirmation is None
+
+
+def test_substitute_confirmation_of_changed_buffer(editor, editor_buffer):
+    given_sample_text(editor_buffer)
+
+    handle_command(':%s/are/is/gc')
+    editor_buffer.buffer.text = 'changed'
+
+    confirm_substitute(editor, 'a')
+    assert editor_buffer.buffer.text == 'changed'
+    assert editor.substitute_confirmation is None
+    assert editor.message == 'Buffer changed, substitution stopped'
@@ -1,19 +1,209 @@
+import pytest
 
 from prompt_toolkit.buffer import Buffer
-from pyvim.window_arrangement import EditorBuffer, VSplit
+from pyvim.commands.handler import handle_command
+from pyvim.window_arrangement.editor_buffer import EditorBuffer
+from pyvim.window_arrangement.tab_page import TabHSplit, TabSplit, TabVSplit
 
 
 def test_initial(window, tab_page):
-    assert isinstance(tab_page.root, VSplit)
-    assert tab_page.root == [window]
+    assert isinstance(tab_page.root, TabVSplit)
+    assert tab_page.root.children == [window]
 
 
 def test_vsplit(editor, tab_page):
     # Create new buffer.
-    eb = EditorBuffer(editor)
+    eb = EditorBuffer()
 
     # Insert in tab, by splitting.
     tab_page.vsplit(eb)
 
-    assert isinstance(tab_page.root, VSplit)
-    assert len(tab_page.root) == 2
+    assert isinstance(tab_page.root, TabVSplit)
+    assert len(tab_page.root.children) == 2
+
+
+def _check_tab_page(tab_page):
+    """
+    Check the parent links of the split tree, and the index of the windows by
+    ID and by buffer.
+    """
+    assert tab_page.root.parent is None
+    for split in tab_page.splits():
+        assert split is tab_page.root or len(split.children) > 1
+        for child in split.children:
+            assert child.parent is split
+
+    windows = tab_page.windows()
+    assert len({w.id for w in windows}) == len(windows) == tab_page.window_count()
+    for w in windows:
+        assert tab_page.get_window_by_id(w.id) is w
+        assert w in tab_page.windows_for_editor_buffer(w.editor_buffer)
+    assert set(tab_page.visible_editor_buffers()) == {w.editor_buffer for w in windows}
+    assert tab_page.active_window in windows
+
+
+def test_tab_page_tree(editor, window, tab_page):
+    eb1, eb2 = EditorBuffer(), EditorBuffer()
+
+    tab_page.vsplit(eb1)
+    tab_page.hsplit(eb2)
+    tab_page.hsplit()
+    _check_tab_page(tab_page)
+    assert isinstance(tab_page.root.children[0], TabHSplit)
+    assert [w.editor_buffer for w in tab_page.windows()] == [eb1, eb2, eb2, window.editor_buffer]
+
+    # The focus goes through the windows in tree order, and wraps around.
+    windows = tab_page.windows()
+    start = windows.index(tab_page.active_window)
+    for i in range(1, 5):
+        tab_page.cycle_focus()
+        assert tab_page.active_window is windows[(start + i) % 4]
+
+    tab_page.show_editor_buffer(eb1)
+    _check_tab_page(tab_page)
+
+    # Closing windows collapses the splits with one window left.
+    tab_page.close_editor_buffer(eb2)
+    _check_tab_page(tab_page)
+    assert [w.editor_buffer for w in tab_page.windows()] == [eb1, eb1, window.editor_buffer]
+
+    tab_page.close_active_window()
+    _check_tab_page(tab_page)
+    assert tab_page.root.children[1:] == [window]
+    assert not any(isinstance(c, TabSplit) for c in tab_page.root.children)
+
+
+def test_go_to_buffer(editor, tmp_path):
+    paths = [tmp_path / 'a.txt', tmp_path / 'aa.txt', tmp_path / 'src' / 'b.txt']
+    editor.load_initial_files(paths)
+    wa = editor.window_arrangement
+
+    def active_name():
+        return wa.active_editor_buffer.location.name
+
+    assert wa.go_to_buffer('b.txt') is None and active_name() == 'b.txt'
+    assert wa.go_to_buffer('a.txt') is None and active_name() == 'a.txt'
+    number = str(wa.editor_buffers.get_by_location(paths[1]).number)
+    assert wa.go_to_buffer(number) is None and active_name() == 'aa.txt'
+    assert wa.go_to_buffer(str(paths[2])) is None and active_name() == 'b.txt'
+
+    assert wa.go_to_buffer('.txt') == 'E93: More than one match for .txt'
+    assert wa.go_to_buffer('abc') == 'E94: No matching buffer for abc'
+    assert active_name() == 'b.txt'
+
+
+def _open_files(editor, tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        path.write_text('text\n')
+        paths.append(path)
+    editor.load_initial_files(paths[:1])
+    editor.sync_with_prompt_toolkit()
+    return paths
+
+
+def _layout(wa):
+    """
+    The containers of the layout, and the lists of their children, from the
+    root down. (For comparing with `is`.)
+    """
+    result = []
+
+    def walk(container):
+        result.append(container)
+        children = getattr(container, 'children', None)
+        if children is not None:
+            result.append(children)
+            for c in children:
+                walk(c)
+
+    walk(wa.container.children[0])
+    return result
+
+
+def _same_objects(list1, list2):
+    return len(list1) == len(list2) and all(a is b for a, b in zip(list1, list2))
+
+
+def test_update_without_changes(editor, tmp_path):
+    paths = _open_files(editor, tmp_path, ['a.txt', 'b.txt'])
+    wa = editor.window_arrangement
+    wa.vsplit(location=paths[1])
+    wa.hsplit()
+    editor.sync_with_prompt_toolkit()
+    layout = _layout(wa)
+
+    # The layout is left alone. (Not even the lists of children change.)
+    for command in [':set nowrap', ':w']:
+        handle_command(command)
+        editor.sync_with_prompt_toolkit()
+        assert _same_objects(_layout(wa), layout)
+
+
+def test_update_switching_tabs(editor, tmp_path):
+    paths = _open_files(editor, tmp_path, ['a.txt', 'b.txt'])
+    wa = editor.window_arrangement
+    wa.vsplit(location=paths[1])
+    editor.sync_with_prompt_toolkit()
+    first_tab = wa.active_tab
+    layout = _layout(wa)
+
+    wa.create_tab(paths[1])
+    editor.sync_with_prompt_toolkit()
+    second_layout = _layout(wa)
+    assert second_layout[0] is not layout[0]
+
+    # gT and gt: the frames and split containers of the tabs are reused.
+    wa.go_to_previous_tab()
+    editor.sync_with_prompt_toolkit()
+    assert wa.active_tab is first_tab
+    assert _same_objects(_layout(wa), layout)
+
+    wa.go_to_next_tab()
+    editor.sync_with_prompt_toolkit()
+    assert _same_objects(_layout(wa), second_layout)
+
+
+def test_frame_for_every_window(editor, tmp_path):
+    _open_files(editor, tmp_path, ['a.txt'])
+    wa = editor.window_arrangement
+    wa.vsplit()
+    editor.sync_with_prompt_toolkit()
+
+    window1, window2 = wa.active_tab.windows()
+    assert window1.editor_buffer is window2.editor_buffer
+    assert wa.get_window(window1) is not wa.get_window(window2)
+
+
+def test_prune_frames(editor, tmp_path, monkeypatch):
+    import pyvim.window_arrangement
+    monkeypatch.setattr(pyvim.window_arrangement, 'FRAME_CACHE_TABS', 2)
+
+    paths = _open_files(editor, tmp_path, ['a.txt', 'b.txt', 'c.txt'])
+    wa = editor.window_arrangement
+    first_window = wa.active_window
+    wa.get_window(first_window).vertical_scroll = 3
+
+    # Visit three tabs: the frames of the first one are pruned.
+    for path in paths[1:]:
+        wa.create_tab(path)
+        editor.sync_with_prompt_toolkit()
+    with pytest.raises(KeyError):
+        wa.get_window(first_window)
+
+    # The scroll offset is kept, for when the frame is created again.
+    assert wa.get_vertical_scroll(first_window) == 3
+    wa.active_tab_index = 0
+    editor.sync_with_prompt_toolkit()
+    assert wa.get_window(first_window).vertical_scroll == 3
+
+    # The frames of a closed tab are pruned.
+    wa.active_tab_index = 2
+    last_window = wa.active_window
+    editor.sync_with_prompt_toolkit()
+    wa.get_window(last_window)
+    wa.close_tab()
+    editor.sync_with_prompt_toolkit()
+    with pytest.raises(KeyError):
+        wa.get_window(last_window)
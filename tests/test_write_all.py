@@ -0,0 +1,59 @@
+import threading
+
+from pyvim.commands.write_all import WriteFailure, format_write_summary, write_buffers
+
+
+class _Buffer(object):
+    " Stand-in for an `EditorBuffer`. "
+    def __init__(self, name, text, fail=False):
+        self.name = name
+        self.text = text
+        self.fail = fail
+        self.written_text = None
+        self.thread = None
+
+    def prepare_write(self):
+        return self.text
+
+    def write_text(self, text):
+        self.thread = threading.current_thread()
+        if self.fail:
+            raise IOError('Permission denied')
+
+    def written(self, text):
+        self.written_text = text
+
+    def get_display_name(self, short=False):
+        return self.name
+
+
+def test_write_buffers():
+    ebs = [_Buffer('a.txt', 'a'), _Buffer('b.txt', 'b', fail=True), _Buffer('c.txt', 'c')]
+    failures = write_buffers(ebs)
+
+    assert failures == [WriteFailure(ebs[1], 'Permission denied')]
+    assert [eb.written_text for eb in ebs] == ['a', None, 'c']
+    assert all(eb.thread is not threading.current_thread() for eb in ebs)
+    assert write_buffers([]) == []
+
+
+def test_format_write_summary():
+    assert format_write_summary(1, []) == '1 file written'
+    assert format_write_summary(3, []) == '3 files written'
+
+    failures = [WriteFailure(_Buffer('b.txt', ''), 'Permission denied')]
+    assert format_write_summary(2, failures) == '2 written, 1 failed: b.txt: Permission denied'
+
+
+def test_bufdo_writes_every_buffer_once(editor, tmp_path):
+    from pyvim.commands.handler import handle_command
+
+    paths = [tmp_path / 'a.txt', tmp_path / 'b.txt']
+    for path in paths:
+        path.write_text('old\n')
+    editor.load_initial_files(paths)
+
+    handle_command(':bufdo s/old/new/ | w | update')
+
+    assert [path.read_text() for path in paths] == ['new\n', 'new\n']
+    assert editor.message == '2 files written'